@@ -1,19 +1,41 @@
 import gradio as gr
 import warnings
 import base64
-from utils import load_env, llama32, disp_image, merge_images, resize_image
+from utils import load_env
+from providers import default_router
+from health import monitor
+from metrics import start_metrics_server, timed_task
+from dashboard import PERFORMANCE_TAB, performance_tab
+from tracing import span, traced
+from profiling import profiled
+from table_utils import (process_table_response, render_partial_table, stream_table_text,
+                         TABLE_STOP)
+from chart_layout import charts_to_tables, detect_chart_regions
+from vision_sessions import SessionStore
+from speculation import FollowupSpeculator
 from PIL import Image
 import io
 warnings.filterwarnings('ignore')
 load_env()
 
+# Together and Ollama backends, picked per request by recent latency
+llm = default_router()
+
+# Interior design conversations, keyed by the session ID kept in gr.State
+design_sessions = SessionStore()
+
 def encode_image_for_llama(image_path):
     """Convert image to base64 string"""
-    with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+    with span("encode_image") as encode_span:
+        with open(image_path, "rb") as image_file:
+            data = image_file.read()
+        encode_span.set_attribute("image_bytes", len(data))
+        # Image.open only parses the header here; the pixels are never decoded
+        encode_span.set_attribute("image_size", "x".join(map(str, Image.open(io.BytesIO(data)).size)))
+        return base64.b64encode(data).decode('utf-8')
 
-def process_image_for_llama(image_path, prompt):
-    """Process image and create message structure for llama32"""
+def create_image_message(image_path, prompt):
+    """Create the message structure for llama32 with one image"""
     base64_image = encode_image_for_llama(image_path)
     messages = [
         {
@@ -25,12 +47,43 @@ def process_image_for_llama(image_path, prompt):
             ]
         }
     ]
-    return llama32(messages)
+    return messages
+
+def process_image_for_llama(image_path, prompt):
+    """Process image and create message structure for llama32"""
+    return llm.complete(create_image_message(image_path, prompt))
+
+def speculate_answer(session, question, base_turns):
+    """Answer a likely follow-up in the background, without touching the session"""
+    return llm.complete(session.messages(question, upto=base_turns)), None
 
-def interior_design(image_path, initial_question, followup_question):
-    """Analyze interior design image with custom questions"""
+# Likely follow-ups are answered ahead of time and dropped with their session
+speculator = FollowupSpeculator(speculate_answer)
+design_sessions.on_evict(speculator.cancel)
+
+def ask_session(session, question):
+    """Ask the next question in a design session, reusing its cached image"""
+    with session.lock, span("ask_session", turn=len(session.turns)) as ask_span:
+        hit = speculator.take(session, question)
+        ask_span.set_attribute("speculative_hit", bool(hit))
+        if hit:
+            answer = hit[0]
+        else:
+            answer = llm.complete(session.messages(question))
+        session.add_turn(question, answer)
+    return answer
+
+@traced("interior_design")
+@profiled("interior_design")
+@timed_task("interior_design")
+def interior_design(image_path, initial_question, followup_question, previous_session_id=None):
+    """
+    Start an interior design session; returns (analysis, session_id).
+    The tab's previous session is closed, cancelling its speculative answers.
+    """
+    design_sessions.close(previous_session_id)
     if image_path is None:
-        return "Please upload an image."
+        return "Please upload an image.", None
     
     if not initial_question.strip():
         initial_question = ("Describe the design, style, color, material and other "
@@ -38,26 +91,33 @@ def interior_design(image_path, initial_question, followup_question):
                           "the objects in the photo.")
     
     # First analysis
-    result = process_image_for_llama(image_path, initial_question)
+    session = design_sessions.create(image_path)
+    ask_session(session, initial_question)
     
     # Follow-up analysis if provided
     if followup_question.strip():
-        base64_image = encode_image_for_llama(image_path)
-        messages = [
-            {"role": "user",
-             "content": [
-                 {"type": "text", "text": initial_question},
-                 {"type": "image_url",
-                  "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
-             ]},
-            {"role": "assistant", "content": result},
-            {"role": "user", "content": followup_question}
-        ]
-        final_result = llama32(messages)
-        return f"{result}\n\nFollow-up Analysis:\n{final_result}"
-    
-    return result
+        ask_session(session, followup_question)
+    
+    speculator.start(session)
+    return session.transcript(), session.id
+
+@traced("interior_followup")
+@profiled("interior_followup")
+@timed_task("interior_followup")
+def interior_followup(session_id, followup_question):
+    """Ask another follow-up in an existing session; returns (transcript, session_id)"""
+    session = design_sessions.get(session_id)
+    if session is None:
+        return "Session expired. Please analyze the image again.", None
+    if not followup_question.strip():
+        return session.transcript(), session.id
+    
+    ask_session(session, followup_question)
+    return session.transcript(), session.id
 
+@traced("read_receipts")
+@profiled("read_receipts")
+@timed_task("read_receipts")
 def read_receipts(files, question, summary_question):
     """Analyze multiple receipt images with custom questions"""
     if not files:
@@ -73,9 +133,10 @@ def read_receipts(files, question, summary_question):
     total_response = ""
     
     # Process each receipt
-    for file in files:
+    for i, file in enumerate(files):
         temp_path = file.name
-        result = process_image_for_llama(temp_path, question)
+        with span("receipt", index=i):
+            result = process_image_for_llama(temp_path, question)
         results.append(result)
         total_response += f"{result}\n"
     
@@ -84,20 +145,43 @@ def read_receipts(files, question, summary_question):
         {"role": "user",
          "content": f"{summary_question}\n{total_response}"}
     ]
-    total = llama32(messages)
+    with span("summarize", receipts=len(results)):
+        total = llm.complete(messages)
     
     return f"Individual Receipts:\n{total_response}\nSummary Analysis:\n{total}"
 
+@traced("graph_to_table")
+@profiled("graph_to_table")
+@timed_task("graph_to_table")
 def graph_to_table(image_path, question):
-    """Convert graph to HTML table with custom question"""
+    """
+    Convert graph to a sanitized HTML table plus CSV/JSON/Parquet exports.
+    Rows render as they arrive and generation stops at the closing </table>.
+    """
     if image_path is None:
-        return "Please upload a graph image."
+        yield "Please upload a graph image.", None
+        return
     
     if not question.strip():
         question = "Convert the chart to an HTML table."
     
-    result = process_image_for_llama(image_path, question)
-    return result
+    with span("detect_charts") as detect_span:
+        boxes = detect_chart_regions(image_path)
+        detect_span.set_attribute("charts", len(boxes))
+    if len(boxes) > 1:
+        yield from charts_to_tables(
+            image_path, boxes,
+            lambda crop: llm.complete(create_image_message(crop, question), stop=[TABLE_STOP]))
+        return
+    
+    messages = create_image_message(image_path, question)
+    result = ""
+    with span("convert_chart", chart=1):
+        for result in stream_table_text(llm.stream(messages, stop=[TABLE_STOP])):
+            yield render_partial_table(result), None
+    with span("parse_export", chart=1):
+        table_html, table, export_paths = process_table_response(result)
+    yield table_html, export_paths
 
 # Create Gradio interface
 with gr.Blocks(title="Multimodal on Platform Machine") as demo:
@@ -113,12 +197,19 @@ with gr.Blocks(title="Multimodal on Platform Machine") as demo:
                 followup_q = gr.Textbox(
                     label="Follow-up Question (Optional)",
                     placeholder="Ask a follow-up question based on the initial analysis")
-                design_button = gr.Button("Analyze Interior")
+                with gr.Row():
+                    design_button = gr.Button("Analyze Interior")
+                    followup_button = gr.Button("Ask Follow-up")
             design_output = gr.Textbox(label="Analysis Result", lines=10)
+        design_session = gr.State(None)
         design_button.click(
             fn=interior_design,
-            inputs=[image_input, initial_q, followup_q],
-            outputs=design_output)
+            inputs=[image_input, initial_q, followup_q, design_session],
+            outputs=[design_output, design_session])
+        followup_button.click(
+            fn=interior_followup,
+            inputs=[design_session, followup_q],
+            outputs=[design_output, design_session])
     
     with gr.Tab("Read Receipts"):
         with gr.Row():
@@ -145,12 +236,22 @@ with gr.Blocks(title="Multimodal on Platform Machine") as demo:
                     label="Question",
                     placeholder="Convert the chart to an HTML table")
                 graph_button = gr.Button("Convert to Table")
-            table_output = gr.HTML(label="Table Output")
+            with gr.Column():
+                table_output = gr.HTML(label="Table Output")
+                table_files = gr.File(label="Export (CSV / JSON / Parquet)",
+                                      file_count="multiple")
         graph_button.click(
             fn=graph_to_table,
             inputs=[graph_input, graph_q],
-            outputs=table_output)
+            outputs=[table_output, table_files])
+
+    if PERFORMANCE_TAB:
+        performance_tab(llm, speculator)
 
 if __name__ == "__main__":
+    # Background health probes open a backend's circuit breaker while it is down
+    monitor.start()
+    # Prometheus /metrics for every model call, on METRICS_PORT
+    start_metrics_server()
     demo.launch()
     
@@ -0,0 +1,2 @@
+# Performance benchmarks; run each module from the repo root, e.g.
+#   python -m benchmarks.e2e --mock together
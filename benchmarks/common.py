@@ -0,0 +1,142 @@
+# Helpers shared by the benchmark scripts: paths, percentiles, result files
+# and regression checks against a saved baseline.
+
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LESSON_IMAGES = os.path.join(REPO_ROOT, "MultiModal_LLamaLesson", "images")
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+# The app modules live at the repo root
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+def lesson_image(name):
+    return os.path.join(LESSON_IMAGES, name)
+
+
+def percentile(values, q):
+    """q-th percentile (0-100) with linear interpolation; None for no values"""
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+def summarize(values):
+    """Count, mean and the usual percentiles of a list of numbers"""
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+
+def max_rss_mb():
+    """Peak resident memory of this process so far, in MB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def rss_mb():
+    """Current resident memory of this process in MB (Linux; elsewhere the peak so far)"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, IndexError):
+        return max_rss_mb()
+
+
+class RssSampler:
+    """
+    Peak resident memory while the block runs, sampled every interval seconds.
+    Unlike ru_maxrss it is not carried over from earlier work in the process,
+    so each concurrency level gets its own figure.
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_mb = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        current = rss_mb()
+        self.peak_mb = current if self.peak_mb is None else max(self.peak_mb, current)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def metadata(**extra):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(),
+            "platform": platform.platform(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            **extra}
+
+
+def write_results(name, results, path=None):
+    """Write results as JSON (default: benchmarks/results/<name>-<time>.json)"""
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w") as results_file:
+        json.dump(results, results_file, indent=2)
+    return path
+
+
+def compare(current, baseline, threshold, higher_is_better=()):
+    """
+    Regressions of current against baseline, both flat {metric: value} dicts
+
+    A metric regresses when it is worse than the baseline by more than
+    threshold (a fraction). Lower is better unless the metric is listed in
+    higher_is_better; a lower-is-better metric whose baseline is zero (such
+    as an error rate) regresses as soon as it is above zero. Returns a list
+    of messages, empty when nothing regressed.
+    """
+    regressions = []
+    for metric, base in baseline.items():
+        value = current.get(metric)
+        if value is None or base is None:
+            continue
+        if not base:
+            if metric not in higher_is_better and value > 0:
+                regressions.append(f"{metric}: 0 -> {value:.4g} (baseline was zero)")
+            continue
+        change = (value - base) / base
+        if metric in higher_is_better:
+            change = -change
+        if change > threshold:
+            regressions.append(f"{metric}: {base:.4g} -> {value:.4g} ({change:+.1%} worse)")
+    return regressions
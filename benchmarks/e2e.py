@@ -0,0 +1,217 @@
+# End-to-end benchmark: replays the Lesson_3 scenarios (receipts, graph to
+# table, interior design, math grader, fridge) over the bundled lesson images
+# against a backend, at several concurrency levels, and writes JSON results.
+#
+#   python -m benchmarks.e2e --mock together --concurrency 1 4 16
+#   python -m benchmarks.e2e --backend router --compare benchmarks/results/baseline.json
+
+import argparse
+import base64
+import json
+import mimetypes
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import (RssSampler, compare, lesson_image, metadata, summarize,
+                               write_results)
+
+RECEIPTS = ["receipt-1.jpg", "receipt-2.jpg", "receipt-3.jpg"]
+
+
+def _data_url(image_name):
+    path = lesson_image(image_name)
+    mime = mimetypes.guess_type(path)[0] or "image/jpeg"
+    with open(path, "rb") as image_file:
+        return f"data:{mime};base64,{base64.b64encode(image_file.read()).decode('utf-8')}"
+
+
+def _image_message(prompt, image_name):
+    return {"role": "user", "content": [
+        {"type": "text", "text": prompt},
+        {"type": "image_url", "image_url": {"url": _data_url(image_name)}}]}
+
+
+def receipts(ask):
+    answers = [ask([_image_message("What's the total charge in the receipt?", name)])
+               for name in RECEIPTS]
+    ask([{"role": "user", "content": "What's the total charge of all the receipts below?\n"
+                                     + "\n".join(answers)}])
+
+
+def graph_to_table(ask):
+    from table_utils import TABLE_STOP, process_table_response
+    result = ask([_image_message("Convert the chart to an HTML table.", "llama31speed.png")],
+                 stop=[TABLE_STOP])
+    process_table_response(result, export_dir=None)
+
+
+def interior_design(ask):
+    question = ("Describe the design, style, color, material and other aspects of the "
+                "fireplace in this photo. Then list all the objects in the photo.")
+    first = _image_message(question, "001.jpeg")
+    result = ask([first])
+    ask([first, {"role": "assistant", "content": result},
+         {"role": "user", "content": "How many balls and vases are there? Which one is "
+                                     "closer to the fireplace: the balls or the vases?"}])
+
+
+def math_grader(ask):
+    ask([_image_message("Check carefully each answer in a kid's math homework, first do "
+                        "the calculation, then compare the result with the kid's answer, "
+                        "mark it as correct or incorrect, at the end count the number of "
+                        "incorrect answers.", "math_hw3.jpg")])
+
+
+def fridge(ask):
+    question = ("What're in the fridge? What kind of food can be made? Give me 2 examples, "
+                "based on only the ingredients in the fridge.")
+    first = _image_message(question, "fridge-3.jpg")
+    result = ask([first])
+    ask([first, {"role": "assistant", "content": result},
+         {"role": "user", "content": "is there banana in the fridge? where?"}])
+
+
+SCENARIOS = {
+    "receipts": receipts,
+    "graph_to_table": graph_to_table,
+    "interior_design": interior_design,
+    "math_grader": math_grader,
+    "fridge": fridge,
+}
+
+
+def make_backend(name, model_size):
+    """complete(messages, stop) for the chosen backend"""
+    if name == "together":
+        from utils import llama32
+        return lambda messages, stop=None: llama32(messages, model_size, stop=stop)
+    if name == "ollama":
+        from local_utils import llama32
+        from providers import to_ollama_messages
+        return lambda messages, stop=None: llama32(to_ollama_messages(messages), stop=stop)
+    if name == "router":
+        from providers import default_router
+        router = default_router()
+        return lambda messages, stop=None: router.complete(messages, model_size, stop=stop)
+    raise ValueError(f"Unknown backend: {name}")
+
+
+def run_scenario(name, complete):
+    """Run one scenario; returns its latency, model calls, payload bytes and error"""
+    stats = {"calls": 0, "payload_bytes": 0}
+
+    def ask(messages, stop=None):
+        stats["calls"] += 1
+        stats["payload_bytes"] += len(json.dumps(messages))
+        return complete(messages, stop=stop)
+
+    start = time.perf_counter()
+    error = None
+    try:
+        SCENARIOS[name](ask)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return {"scenario": name, "latency": time.perf_counter() - start, "error": error, **stats}
+
+
+def run_level(concurrency, iterations, scenarios, complete):
+    """Run iterations scenario runs (round-robin over scenarios) with concurrency workers"""
+    plan = [scenarios[i % len(scenarios)] for i in range(iterations)]
+    start = time.perf_counter()
+    with RssSampler() as rss, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        runs = list(executor.map(lambda name: run_scenario(name, complete), plan))
+    duration = time.perf_counter() - start
+
+    ok = [run for run in runs if not run["error"]]
+    level = {
+        "concurrency": concurrency,
+        "runs": len(runs),
+        "errors": len(runs) - len(ok),
+        "duration": duration,
+        "throughput": len(ok) / duration if duration else None,
+        "calls_per_sec": sum(run["calls"] for run in ok) / duration if duration else None,
+        "latency": summarize([run["latency"] for run in ok]),
+        "payload_bytes": summarize([run["payload_bytes"] for run in runs]),
+        "peak_rss_mb": rss.peak_mb,
+        "scenarios": {},
+        "error_samples": sorted({run["error"] for run in runs if run["error"]})[:5],
+    }
+    for name in scenarios:
+        latencies = [run["latency"] for run in ok if run["scenario"] == name]
+        level["scenarios"][name] = summarize(latencies)
+    return level
+
+
+def flatten(results):
+    """{metric: value} view of the results used for baseline comparison"""
+    flat = {}
+    for level in results["levels"]:
+        prefix = f"c{level['concurrency']}"
+        flat[f"{prefix}.throughput"] = level["throughput"]
+        flat[f"{prefix}.latency_p50"] = level["latency"]["p50"]
+        flat[f"{prefix}.latency_p95"] = level["latency"]["p95"]
+        flat[f"{prefix}.error_rate"] = level["errors"] / level["runs"] if level["runs"] else 0
+        flat[f"{prefix}.payload_bytes_mean"] = level["payload_bytes"]["mean"]
+    return flat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end benchmark over the lesson scenarios")
+    parser.add_argument("--backend", choices=["together", "ollama", "router"], default="together")
+    parser.add_argument("--mock", metavar="PROFILE",
+                        help="start the bundled mock server with this profile and use it")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 8])
+    parser.add_argument("--iterations", type=int, default=20,
+                        help="scenario runs per concurrency level")
+    parser.add_argument("--model-size", type=int, default=11)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/)")
+    parser.add_argument("--compare", metavar="BASELINE", help="baseline results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="allowed regression as a fraction (default 0.1)")
+    args = parser.parse_args(argv)
+
+    if args.mock:
+        from mock_llm_server import start_mock_server
+        server, base_url = start_mock_server(profile=args.mock)
+        # Must be set before the backend modules are imported
+        os.environ["DLAI_TOGETHER_API_BASE"] = base_url
+        os.environ["OLLAMA_HOST"] = base_url
+        os.environ.setdefault("TOGETHER_API_KEY", "mock")
+
+    complete = make_backend(args.backend, args.model_size)
+    results = {
+        "benchmark": "e2e",
+        "meta": metadata(backend=args.backend, mock_profile=args.mock,
+                         model_size=args.model_size, scenarios=args.scenarios,
+                         iterations=args.iterations),
+        "levels": [],
+    }
+    for concurrency in args.concurrency:
+        level = run_level(concurrency, args.iterations, args.scenarios, complete)
+        results["levels"].append(level)
+        latency = level["latency"]
+        p50 = f"{latency['p50']:.2f}s" if latency["p50"] is not None else "-"
+        p95 = f"{latency['p95']:.2f}s" if latency["p95"] is not None else "-"
+        print(f"concurrency {concurrency:>3}: {level['throughput'] or 0:.2f} runs/s, "
+              f"p50 {p50}, p95 {p95}, errors {level['errors']}/{level['runs']}, "
+              f"peak rss {level['peak_rss_mb']:.0f} MB")
+
+    path = write_results("e2e", results, args.output)
+    print(f"Results written to {path}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(flatten(results), flatten(baseline), args.threshold,
+                              higher_is_better={k for k in flatten(baseline) if k.endswith("throughput")})
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+# Load test for the Gradio apps: simulated users drive the Interior Design,
+# Read Receipts and Graph to Table endpoints through the Gradio API with the
+# lesson images, and each call's queue wait and service time are measured.
+#
+#   python -m benchmarks.load --app app --mock together --users 1 4 16 --duration 60
+#   python -m benchmarks.load --url http://localhost:7860 --mix read_receipts=3,graph_to_table=1
+
+import argparse
+import importlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+
+from benchmarks.common import (compare, lesson_image, max_rss_mb, metadata, summarize,
+                               write_results)
+
+# Job status is polled this often to see when the queue hands a call to a worker
+POLL_SECONDS = 0.01
+
+FOLLOWUP = ("How many balls and vases are there? Which one is closer to the fireplace: "
+            "the balls or the vases?")
+
+
+def _tasks():
+    from gradio_client import handle_file
+    return {
+        # The follow-up uses the session kept in gr.State by the first call
+        "interior_design": [
+            ("/interior_design", lambda: (handle_file(lesson_image("001.jpeg")), "", "")),
+            ("/interior_followup", lambda: (FOLLOWUP,)),
+        ],
+        "read_receipts": [
+            ("/read_receipts", lambda: ([handle_file(lesson_image(f"receipt-{i}.jpg"))
+                                         for i in (1, 2, 3)], "", "")),
+        ],
+        "graph_to_table": [
+            ("/graph_to_table", lambda: (handle_file(lesson_image("llama31speed.png")), "")),
+        ],
+    }
+
+
+def parse_mix(text):
+    """'interior_design=2,read_receipts=1' -> {task: weight}"""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def call(client, endpoint, args):
+    """Run one API call; returns its queue wait, service time and error"""
+    from gradio_client.utils import Status
+    running = (Status.PROCESSING, Status.ITERATING, Status.PROGRESS, Status.LOG)
+
+    submitted = time.time()
+    job = client.submit(*args, api_name=endpoint)
+    started = None
+    while not job.done():
+        status = job.status()
+        if started is None and status.code in running:
+            started = status.time.timestamp() if status.time else time.time()
+        time.sleep(POLL_SECONDS)
+    finished = time.time()
+    error = None
+    try:
+        job.result()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    if started is None:
+        # Finished between two polls (or never left the queue)
+        started = finished
+    return {"endpoint": endpoint, "queue_wait": started - submitted,
+            "service": finished - started, "latency": finished - submitted, "error": error}
+
+
+def user(url, mix, think_time, deadline, seed, records, lock):
+    """One simulated user: pick a task from the mix, run its calls, think, repeat"""
+    from gradio_client import Client
+    rng = random.Random(seed)
+    tasks = _tasks()
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    try:
+        client = Client(url, verbose=False)
+    except Exception as e:
+        with lock:
+            records.append({"task": None, "endpoint": None, "latency": 0, "queue_wait": 0,
+                            "service": 0, "error": f"connect: {type(e).__name__}: {e}"})
+        return
+    while time.time() < deadline:
+        task = rng.choices(names, weights)[0]
+        for endpoint, make_args in tasks[task]:
+            record = call(client, endpoint, make_args())
+            record["task"] = task
+            with lock:
+                records.append(record)
+            if record["error"]:
+                break
+        if think_time:
+            time.sleep(min(rng.expovariate(1 / think_time), max(0.0, deadline - time.time())))
+
+
+def run_level(url, users, duration, mix, think_time, seed):
+    records, lock = [], threading.Lock()
+    deadline = time.time() + duration
+    threads = [threading.Thread(target=user, daemon=True,
+                                args=(url, mix, think_time, deadline, seed + i, records, lock))
+               for i in range(users)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+
+    ok = [record for record in records if not record["error"]]
+    level = {
+        "users": users,
+        "duration": elapsed,
+        "calls": len(records),
+        "errors": len(records) - len(ok),
+        "error_rate": (len(records) - len(ok)) / len(records) if records else 0,
+        "throughput": len(ok) / elapsed if elapsed else None,
+        "queue_wait": summarize([record["queue_wait"] for record in ok]),
+        "service": summarize([record["service"] for record in ok]),
+        "latency": summarize([record["latency"] for record in ok]),
+        "endpoints": {},
+        "error_samples": sorted({record["error"] for record in records if record["error"]})[:5],
+    }
+    for endpoint in sorted({record["endpoint"] for record in records if record["endpoint"]}):
+        calls = [record for record in records if record["endpoint"] == endpoint]
+        done = [record for record in calls if not record["error"]]
+        level["endpoints"][endpoint] = {
+            "calls": len(calls),
+            "errors": len(calls) - len(done),
+            "queue_wait": summarize([record["queue_wait"] for record in done]),
+            "service": summarize([record["service"] for record in done]),
+        }
+    return level
+
+
+def launch_app(name, concurrency_limit=None, max_size=None):
+    """Import app / local_app, launch its demo in this process and return its URL"""
+    module = importlib.import_module(name)
+    if concurrency_limit is not None or max_size is not None:
+        module.demo.queue(default_concurrency_limit=concurrency_limit or 1, max_size=max_size)
+    module.demo.launch(prevent_thread_lock=True, quiet=True)
+    return module.demo.local_url
+
+
+def _seconds(value):
+    return f"{value:.2f}s" if value is not None else "-"
+
+
+def flatten(results):
+    """{metric: value} view of the results used for baseline comparison"""
+    flat = {}
+    for level in results["levels"]:
+        prefix = f"u{level['users']}"
+        flat[f"{prefix}.throughput"] = level["throughput"]
+        flat[f"{prefix}.error_rate"] = level["error_rate"]
+        flat[f"{prefix}.latency_p95"] = level["latency"]["p95"]
+        flat[f"{prefix}.queue_wait_p95"] = level["queue_wait"]["p95"]
+        flat[f"{prefix}.service_p95"] = level["service"]["p95"]
+    return flat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test for the Gradio endpoints")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="an already running app")
+    target.add_argument("--app", choices=["app", "local_app"], default="app",
+                        help="launch this app in-process (default)")
+    parser.add_argument("--mock", metavar="PROFILE",
+                        help="with --app: point the app at the bundled mock server")
+    parser.add_argument("--concurrency-limit", type=int,
+                        help="with --app: queue default_concurrency_limit (Gradio's default is 1)")
+    parser.add_argument("--max-size", type=int, help="with --app: queue max_size")
+    parser.add_argument("--users", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--duration", type=float, default=60, help="seconds per user level")
+    parser.add_argument("--think-time", type=float, default=2.0,
+                        help="mean seconds between a user's tasks (exponential)")
+    parser.add_argument("--mix", type=parse_mix,
+                        default=parse_mix("interior_design=1,read_receipts=1,graph_to_table=1"),
+                        help="task weights, e.g. interior_design=2,read_receipts=1")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="results file (default: benchmarks/results/)")
+    parser.add_argument("--compare", metavar="BASELINE", help="baseline results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="allowed regression as a fraction (default 0.1)")
+    args = parser.parse_args(argv)
+    unknown = set(args.mix) - set(_tasks())
+    if unknown:
+        parser.error(f"unknown tasks in --mix: {', '.join(sorted(unknown))}")
+
+    url = args.url
+    if url is None:
+        if args.mock:
+            from mock_llm_server import start_mock_server
+            server, base_url = start_mock_server(profile=args.mock)
+            # Must be set before the app is imported
+            os.environ["DLAI_TOGETHER_API_BASE"] = base_url
+            os.environ["OLLAMA_HOST"] = base_url
+            os.environ.setdefault("TOGETHER_API_KEY", "mock")
+        url = launch_app(args.app, args.concurrency_limit, args.max_size)
+
+    results = {
+        "benchmark": "load",
+        "meta": metadata(url=args.url, app=None if args.url else args.app, mock_profile=args.mock,
+                         concurrency_limit=args.concurrency_limit, max_size=args.max_size,
+                         duration=args.duration, think_time=args.think_time, mix=args.mix),
+        "levels": [],
+    }
+    for users in args.users:
+        level = run_level(url, users, args.duration, args.mix, args.think_time, args.seed)
+        results["levels"].append(level)
+        queue_wait, service = level["queue_wait"], level["service"]
+        print(f"users {users:>3}: {level['throughput'] or 0:.2f} calls/s, "
+              f"queue wait p50 {_seconds(queue_wait['p50'])} p95 {_seconds(queue_wait['p95'])}, "
+              f"service p50 {_seconds(service['p50'])} p95 {_seconds(service['p95'])}, "
+              f"errors {level['errors']}/{level['calls']}")
+    results["meta"]["max_rss_mb"] = max_rss_mb()
+
+    path = write_results("load", results, args.output)
+    print(f"Results written to {path}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(flatten(results), flatten(baseline), args.threshold,
+                              higher_is_better={k for k in flatten(baseline) if k.endswith("throughput")})
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# Micro-benchmarks for the image preprocessing done before every model call:
+# decode, resize, re-encode, base64 and data-URL assembly, plus the lessons'
+# encode_image and utils.merge_images, over the lesson images and synthetic
+# 4K / 12MP photos. Reports time and tracemalloc peak per stage.
+#
+#   python -m benchmarks.preprocess
+#   python -m benchmarks.preprocess --compare benchmarks/results/baseline.json --threshold 0.2
+
+import argparse
+import base64
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from PIL import Image
+
+from benchmarks.common import compare, lesson_image, max_rss_mb, metadata, write_results
+
+LESSON_INPUTS = ["receipt-1.jpg", "llama31speed.png", "001.jpeg", "math_hw3.jpg", "fridge-3.jpg"]
+SYNTHETIC_SIZES = {"synthetic-4k": (3840, 2160), "synthetic-12mp": (4000, 3000)}
+MERGE_INPUTS = ["receipt-1.jpg", "receipt-2.jpg", "receipt-3.jpg"]
+
+
+def make_synthetic(path, size):
+    """A photo-like JPEG: a colour gradient with sensor noise, so it compresses realistically"""
+    gradient = Image.linear_gradient("L").resize(size)
+    noise = Image.effect_noise(size, 40)
+    Image.merge("RGB", (gradient, noise, gradient.transpose(Image.FLIP_LEFT_RIGHT))).save(
+        path, "JPEG", quality=90)
+    return path
+
+
+def lesson_encode_image(image_path):
+    # Same as encode_image in MultiModal_LLamaLesson/Lesson_3*.py, which run
+    # model calls at import time and so cannot be imported here
+    with open(image_path, "rb") as image_file:
+        return base64.b64encode(image_file.read()).decode('utf-8')
+
+
+def _reencode(img):
+    buffer = io.BytesIO()
+    img.convert("RGB").save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def stages(path):
+    """(name, fn) per preprocessing step for one image; each fn does the step once"""
+    from utils import resize_image
+
+    with open(path, "rb") as image_file:
+        raw = image_file.read()
+    decoded = Image.open(io.BytesIO(raw))
+    decoded.load()
+    # resize_image saves a JPEG, which has no alpha channel
+    rgb = decoded.convert("RGB")
+    resized = rgb.copy()
+    resized.thumbnail((1120, 1120))
+    jpeg = _reencode(resized)
+    encoded = base64.b64encode(jpeg).decode("utf-8")
+
+    def decode():
+        img = Image.open(io.BytesIO(raw))
+        img.load()
+
+    return [
+        ("decode", decode),
+        ("resize", lambda: resize_image(rgb)),
+        ("reencode", lambda: _reencode(resized)),
+        ("base64", lambda: base64.b64encode(jpeg).decode("utf-8")),
+        ("data_url", lambda: f"data:image/jpeg;base64,{encoded}"),
+        ("encode_image", lambda: lesson_encode_image(path)),
+    ]
+
+
+def measure(fn, repeat, min_time):
+    """Median and min seconds per call over repeat rounds, then the tracemalloc peak of one call"""
+    fn()  # warm up
+    # Loops per round so that a round lasts at least min_time
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 10_000:
+            break
+        loops *= 2
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        times.append((time.perf_counter() - start) / loops)
+
+    # Pillow's pixel buffers are allocated outside the Python allocator, so
+    # the peak covers Python objects (raw bytes, base64 strings, buffers) only
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"median": statistics.median(times), "min": min(times), "loops": loops,
+            "peak_kb": peak / 1024}
+
+
+def run(inputs, repeat, min_time):
+    results = {}
+    for name, path in inputs.items():
+        with Image.open(path) as img:
+            size = "x".join(map(str, img.size))
+        image_results = {"size": size, "file_bytes": os.path.getsize(path), "stages": {}}
+        for stage, fn in stages(path):
+            image_results["stages"][stage] = measure(fn, repeat, min_time)
+        results[name] = image_results
+
+    from utils import merge_images
+    merge_paths = [lesson_image(name) for name in MERGE_INPUTS]
+    results["merge_images"] = {"stages": {
+        "merge": measure(lambda: merge_images(*merge_paths), repeat, min_time)}}
+    return results
+
+
+def report(images):
+    for name, image_results in images.items():
+        if "size" in image_results:
+            print(f"{name} ({image_results['size']}, {image_results['file_bytes'] / 1024:.0f} KB)")
+        else:
+            print(name)
+        for stage, stats in image_results["stages"].items():
+            print(f"  {stage:<13} {stats['median'] * 1000:9.3f} ms  peak {stats['peak_kb']:9.1f} KB")
+
+
+def flatten(results):
+    """{metric: value} view of the results used for baseline comparison"""
+    flat = {}
+    for name, image_results in results["images"].items():
+        for stage, stats in image_results["stages"].items():
+            flat[f"{name}.{stage}.median"] = stats["median"]
+            flat[f"{name}.{stage}.peak_kb"] = stats["peak_kb"]
+    return flat
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Image preprocessing micro-benchmarks")
+    parser.add_argument("--images", nargs="+", default=LESSON_INPUTS,
+                        help="lesson images to include (file names in MultiModal_LLamaLesson/images)")
+    parser.add_argument("--no-synthetic", action="store_true", help="skip the 4K / 12MP inputs")
+    parser.add_argument("--repeat", type=int, default=5, help="timing rounds per stage")
+    parser.add_argument("--min-time", type=float, default=0.05,
+                        help="minimum seconds per timing round")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/)")
+    parser.add_argument("--compare", metavar="BASELINE", help="baseline results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed regression as a fraction (default 0.2)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        inputs = {name: lesson_image(name) for name in args.images}
+        if not args.no_synthetic:
+            for name, size in SYNTHETIC_SIZES.items():
+                inputs[name] = make_synthetic(os.path.join(workdir, f"{name}.jpg"), size)
+        # resize_image and merge_images save to images/ and print sizes
+        os.makedirs(os.path.join(workdir, "images"))
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                images = run(inputs, args.repeat, args.min_time)
+        finally:
+            os.chdir(cwd)
+    report(images)
+
+    results = {
+        "benchmark": "preprocess",
+        "meta": metadata(repeat=args.repeat, min_time=args.min_time, max_rss_mb=max_rss_mb()),
+        "images": images,
+    }
+    path = write_results("preprocess", results, args.output)
+    print(f"Results written to {path}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(flatten(results), flatten(baseline), args.threshold)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
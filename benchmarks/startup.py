@@ -0,0 +1,118 @@
+# Import-time benchmark: imports each module in a fresh interpreter several
+# times, reports the median import time and the heaviest top-level imports
+# (python -X importtime), and fails when a serving module pulls in a display
+# or tool dependency or regresses against a baseline.
+#
+#   python -m benchmarks.startup
+#   python -m benchmarks.startup --compare benchmarks/results/baseline.json
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+from benchmarks.common import REPO_ROOT, compare, metadata, write_results
+
+# Serving code must not load these; they belong to display_utils / tool_utils
+HEAVY_HELPERS = ("matplotlib", "pygments", "wolframalpha", "nest_asyncio")
+MODULES = {
+    "utils": HEAVY_HELPERS + ("ollama",),
+    "local_utils": HEAVY_HELPERS + ("ollama",),
+    "providers": HEAVY_HELPERS + ("ollama",),
+    # Gradio brings pygments along, so only the rest is checked for the apps
+    "app": ("matplotlib.pyplot", "wolframalpha", "nest_asyncio"),
+    "local_app": ("matplotlib.pyplot", "wolframalpha", "nest_asyncio"),
+}
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {forbidden!r} if m in sys.modules]}}))
+"""
+
+
+def import_once(module, forbidden, importtime=False):
+    """Import module in a fresh interpreter; returns (seconds, forbidden modules loaded, stderr)"""
+    command = [sys.executable] + (["-X", "importtime"] if importtime else [])
+    command += ["-c", _PROBE.format(module=module, forbidden=tuple(forbidden))]
+    result = subprocess.run(command, cwd=REPO_ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"import {module} failed:\n{result.stderr[-2000:]}")
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    return probe["seconds"], probe["loaded"], result.stderr
+
+
+def heaviest_imports(importtime_output, module, count=5):
+    """module's direct imports by cumulative time, from -X importtime output"""
+    children, pending = [], []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # Each level of nesting indents the name by two more spaces, and
+        # children are listed before their parent
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == module:
+                children = pending
+            pending = []
+        elif depth == 1:
+            pending.append((int(cumulative), name.strip()))
+    return [{"module": name, "seconds": us / 1e6} for us, name in sorted(children, reverse=True)[:count]]
+
+
+def measure(module, forbidden, repeat):
+    times, loaded = [], set()
+    for _ in range(repeat):
+        seconds, found, _ = import_once(module, forbidden)
+        times.append(seconds)
+        loaded.update(found)
+    _, _, importtime_output = import_once(module, forbidden, importtime=True)
+    return {"median": statistics.median(times), "min": min(times),
+            "forbidden_loaded": sorted(loaded), "heaviest": heaviest_imports(importtime_output, module)}
+
+
+def flatten(results):
+    return {f"{module}.median": stats["median"] for module, stats in results["modules"].items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import-time benchmark")
+    parser.add_argument("--modules", nargs="+", choices=list(MODULES), default=list(MODULES))
+    parser.add_argument("--repeat", type=int, default=5, help="fresh imports per module")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/)")
+    parser.add_argument("--compare", metavar="BASELINE", help="baseline results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed regression as a fraction (default 0.2)")
+    args = parser.parse_args(argv)
+
+    results = {"benchmark": "startup", "meta": metadata(repeat=args.repeat), "modules": {}}
+    failures = []
+    for module in args.modules:
+        stats = measure(module, MODULES[module], args.repeat)
+        results["modules"][module] = stats
+        heaviest = ", ".join(f"{item['module']} {item['seconds']:.2f}s" for item in stats["heaviest"][:3])
+        print(f"{module:<12} {stats['median']:.3f}s  (heaviest: {heaviest})")
+        if stats["forbidden_loaded"]:
+            failures.append(f"{module} imports {', '.join(stats['forbidden_loaded'])}")
+
+    path = write_results("startup", results, args.output)
+    print(f"Results written to {path}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        failures += compare(flatten(results), flatten(baseline), args.threshold)
+    for message in failures:
+        print(f"REGRESSION {message}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# Cancel blocking HTTP calls from another thread. A thread runs its calls in
+# a CancelScope; cancelling it shuts down the sockets of the requests made in
+# that scope, which also wakes a read still waiting for the first byte
+# (closing a socket from another thread does not). Those requests get a
+# connection of their own, so a late cancel never reaches a socket that a
+# later request is using.
+
+import contextvars
+import socket
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.utils import select_proxy
+from urllib3 import PoolManager
+from urllib3.connection import HTTPConnection, HTTPSConnection
+
+_scope = contextvars.ContextVar("cancel_scope", default=None)
+
+
+class CancelledError(Exception):
+    """The call's CancelScope was cancelled"""
+
+
+class CancelScope:
+    """Callbacks that tear down the calls made in one context"""
+
+    def __init__(self):
+        self.cancelled = False
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def on_cancel(self, callback):
+        """Run callback when the scope is cancelled, or now if it already is"""
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def cancel(self):
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+
+def enter(scope):
+    """Make scope the current one for this context (run inside the context)"""
+    _scope.set(scope)
+
+
+def current_scope():
+    """The current context's scope, or None"""
+    return _scope.get()
+
+
+def cancelled():
+    """Whether the current context's scope has been cancelled"""
+    scope = _scope.get()
+    return scope is not None and scope.cancelled
+
+
+def _shutdown_on_cancel(scope, sock):
+    def shutdown():
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    scope.on_cancel(shutdown)
+
+
+class _ScopedConnection:
+    def connect(self):
+        super().connect()
+        scope = _scope.get()
+        if scope is not None:
+            _shutdown_on_cancel(scope, self.sock)
+
+
+class _ScopedHTTPConnection(_ScopedConnection, HTTPConnection):
+    pass
+
+
+class _ScopedHTTPSConnection(_ScopedConnection, HTTPSConnection):
+    pass
+
+
+class _ScopedAdapter(HTTPAdapter):
+    """Sends a request made inside a scope over a pool of its own, never shared"""
+
+    def get_connection_with_tls_context(self, request, verify, proxies=None, cert=None):
+        scope = _scope.get()
+        if scope is None or select_proxy(request.url, proxies):
+            return super().get_connection_with_tls_context(request, verify, proxies, cert)
+        if scope.cancelled:
+            raise CancelledError("request cancelled")
+        host_params, pool_kwargs = self.build_connection_pool_key_attributes(
+            request, verify, cert)
+        pool = PoolManager(num_pools=1, maxsize=1).connection_from_host(
+            **host_params, pool_kwargs=pool_kwargs)
+        pool.ConnectionCls = (_ScopedHTTPSConnection if host_params["scheme"] == "https"
+                              else _ScopedHTTPConnection)
+        return pool
+
+
+def cancellable_session():
+    """A requests.Session whose requests are shut down when the current scope is cancelled"""
+    session = requests.Session()
+    adapter = _ScopedAdapter()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _trace_connections(request):
+    scope = _scope.get()
+    if scope is None:
+        return
+
+    def trace(event, info):
+        if event == "connection.connect_tcp.complete":
+            _shutdown_on_cancel(scope, info["return_value"].get_extra_info("socket"))
+
+    request.extensions = {**request.extensions, "trace": trace}
+
+
+def httpx_event_hooks():
+    """
+    event_hooks for an httpx client (such as ollama.Client) whose new
+    connections are shut down when the scope they were opened in is cancelled.
+    Use a client per call inside a scope, so its connection is not pooled.
+    """
+    return {"request": [_trace_connections]}
@@ -0,0 +1,234 @@
+# Record/replay of model calls: LLM_CASSETTE=record saves each call's request
+# key and response (with streamed chunk timing) to a JSONL cassette; replay
+# serves them back instantly, replay_timed with the recorded timing.
+#
+#   LLM_CASSETTE=record python -m benchmarks.e2e
+#   LLM_CASSETTE=replay python -m benchmarks.e2e
+
+import contextvars
+import functools
+import hashlib
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from singleflight import _image_digest, _normalize
+
+LLM_CASSETTE = os.getenv("LLM_CASSETTE", "")  # "record", "replay", "replay_timed" or empty
+LLM_CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH", "cassettes/llm.jsonl")
+
+# Set while a recorded call runs, so calls it makes itself are not recorded twice
+_inside = contextvars.ContextVar("inside_cassette_call", default=False)
+
+
+class CassetteMiss(Exception):
+    """A replayed call has no recording"""
+
+
+def _canonical(value):
+    """JSON-able form of call arguments with image contents replaced by their digest"""
+    if isinstance(value, dict):
+        if "role" in value:
+            return _normalize(value)
+        return {k: _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return value
+
+
+def call_key(name, fn, args, kwargs):
+    """Content hash of a call: its name and arguments, bound to parameter names"""
+    bound = inspect.signature(fn).bind(*args, **kwargs)
+    bound.apply_defaults()
+    arguments = {k: ([_image_digest(image) for image in v] if k == "images" and v else _canonical(v))
+                 for k, v in bound.arguments.items()}
+    payload = json.dumps({"name": name, "arguments": arguments}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    The recordings in one JSONL file, one line per call
+
+    Identical calls are replayed in the order they were recorded; once those
+    run out the last recording is repeated.
+    """
+
+    def __init__(self, path=LLM_CASSETTE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None
+        self._served = defaultdict(int)
+
+    def _load(self):
+        entries = defaultdict(list)
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as cassette_file:
+                for line in cassette_file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        entries[entry["key"]].append(entry)
+        return entries
+
+    def find(self, key, name):
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            recordings = self._entries.get(key)
+            if not recordings:
+                raise CassetteMiss(f"No recording of this {name} call in {self.path}; "
+                                   "run with LLM_CASSETTE=record first")
+            index = min(self._served[key], len(recordings) - 1)
+            self._served[key] += 1
+            return recordings[index]
+
+    def record(self, entry):
+        line = json.dumps(entry, separators=(",", ":"), default=str)
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as cassette_file:
+                cassette_file.write(line + "\n")
+
+
+cassette = Cassette()
+
+
+def _error_fields(error):
+    """What a recording keeps of an exception: its message and qualified class name"""
+    error_type = type(error)
+    return {"error": str(error), "error_type": f"{error_type.__module__}.{error_type.__qualname__}"}
+
+
+def _replayed_error(entry):
+    """
+    The recorded exception, as an instance of its original class when that
+    class's module is loaded (callers catch e.g. requests' exceptions), else
+    a plain Exception. Only the message is restored, not other attributes.
+    """
+    module, _, qualname = entry.get("error_type", "").rpartition(".")
+    error_type = sys.modules.get(module)
+    for part in qualname.split(".") if error_type is not None else ():
+        error_type = getattr(error_type, part, None)
+    if not (isinstance(error_type, type) and issubclass(error_type, Exception)):
+        return Exception(entry["error"])
+    try:
+        return error_type(entry["error"])
+    except Exception:
+        # Constructors with other required arguments
+        error = error_type.__new__(error_type)
+        error.args = (entry["error"],)
+        return error
+
+
+def _replay_result(entry, timed):
+    if timed:
+        time.sleep(entry["elapsed"])
+    if entry.get("error"):
+        raise _replayed_error(entry)
+    result = entry["result"]
+    return tuple(result) if entry.get("tuple") else result
+
+
+def _replay_chunks(entry, timed):
+    start = time.monotonic()
+    for offset, chunk in entry["chunks"]:
+        if timed:
+            time.sleep(max(0.0, start + offset - time.monotonic()))
+        yield chunk
+    if entry.get("truncated"):
+        # The recording stops where the recorded caller stopped reading
+        raise CassetteMiss(f"The recording of this {entry['name']} stream ends after "
+                           f"{len(entry['chunks'])} chunks; record it with a caller that "
+                           "reads further")
+    if timed:
+        time.sleep(max(0.0, start + entry["elapsed"] - time.monotonic()))
+    if entry.get("error"):
+        raise _replayed_error(entry)
+
+
+def recorded(name, mode=None):
+    """
+    Decorator: record or replay a model call function under name
+
+    Generator functions are recorded chunk by chunk with each chunk's offset
+    from the start of the call; a stream closed early by its caller is kept
+    up to that point and marked truncated, and a replay that reads past that
+    point raises CassetteMiss. Errors are replayed as their recorded class.
+    Without a cassette mode the function is returned unchanged.
+    """
+    mode = LLM_CASSETTE if mode is None else mode
+
+    def decorator(fn):
+        if mode not in ("record", "replay", "replay_timed"):
+            return fn
+        timed = mode == "replay_timed"
+
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def stream_wrapper(*args, **kwargs):
+                if _inside.get():
+                    yield from fn(*args, **kwargs)
+                    return
+                key = call_key(name, fn, args, kwargs)
+                if mode != "record":
+                    yield from _replay_chunks(cassette.find(key, name), timed)
+                    return
+                # The stream runs in its own context so the flag does not leak
+                # to the caller between chunks
+                context = contextvars.copy_context()
+                context.run(_inside.set, True)
+                chunks = context.run(fn, *args, **kwargs)
+                entry = {"key": key, "name": name, "chunks": []}
+                start = time.monotonic()
+                try:
+                    while True:
+                        try:
+                            chunk = context.run(next, chunks)
+                        except StopIteration:
+                            break
+                        entry["chunks"].append([round(time.monotonic() - start, 4), chunk])
+                        yield chunk
+                except Exception as e:
+                    entry.update(_error_fields(e))
+                    raise
+                except BaseException:
+                    # Closed early by the caller (e.g. stopped at </table>): the
+                    # chunks it consumed are what a replay has to serve
+                    entry["truncated"] = True
+                    raise
+                finally:
+                    context.run(chunks.close)
+                    entry["elapsed"] = round(time.monotonic() - start, 4)
+                    cassette.record(entry)
+            return stream_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _inside.get():
+                return fn(*args, **kwargs)
+            key = call_key(name, fn, args, kwargs)
+            if mode != "record":
+                return _replay_result(cassette.find(key, name), timed)
+            token = _inside.set(True)
+            entry = {"key": key, "name": name}
+            start = time.monotonic()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                entry.update(_error_fields(e), elapsed=round(time.monotonic() - start, 4))
+                cassette.record(entry)
+                raise
+            finally:
+                _inside.reset(token)
+            entry.update(result=result, tuple=isinstance(result, tuple),
+                         elapsed=round(time.monotonic() - start, 4))
+            cassette.record(entry)
+            return result
+        return wrapper
+    return decorator
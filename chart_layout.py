@@ -0,0 +1,188 @@
+# Local layout detection for dashboard screenshots: split an image into chart
+# regions along whitespace gutters (recursive XY-cut on projection profiles).
+
+import contextvars
+import html
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+from PIL import Image
+
+from table_utils import new_export_dir, process_table_response, render_table_list
+from tracing import span
+
+# Maximum number of chart crops converted at the same time
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "4"))
+
+
+def _ink_mask(img, threshold=24):
+    """Mark pixels that differ from the background colour (taken from the border)"""
+    gray = np.asarray(img.convert("L"), dtype=np.int16)
+    border = np.concatenate([gray[0], gray[-1], gray[:, 0], gray[:, -1]])
+    background = np.median(border)
+    return np.abs(gray - background) > threshold
+
+
+def _split_profile(profile, min_gap, min_size, noise):
+    """
+    Return (start, end) spans of a 1-D profile separated by gutters of >= min_gap.
+    Spans shorter than min_size (titles, legends, bars of a bar chart) are merged
+    into the neighbour across the narrower gutter instead of becoming regions.
+    """
+    spans = []
+    start = None
+    gap = 0
+    for i, value in enumerate(profile):
+        if value > noise:
+            if start is None:
+                start = i
+            gap = 0
+            end = i + 1
+        elif start is not None:
+            gap += 1
+            if gap >= min_gap:
+                spans.append([start, end])
+                start = None
+    if start is not None:
+        spans.append([start, end])
+
+    while len(spans) > 1:
+        small = [i for i, (a, b) in enumerate(spans) if b - a < min_size]
+        if not small:
+            break
+        i = small[0]
+        gap_before = spans[i][0] - spans[i - 1][1] if i > 0 else None
+        gap_after = spans[i + 1][0] - spans[i][1] if i + 1 < len(spans) else None
+        if gap_after is None or (gap_before is not None and gap_before <= gap_after):
+            spans[i - 1][1] = spans.pop(i)[1]
+        else:
+            spans[i][0] = spans.pop(i)[0]
+    return [tuple(span) for span in spans]
+
+
+def _xy_cut(mask, box, gap_ratio, size_ratio, depth, horizontal):
+    """Alternately cut the box along row and column gutters, depth levels deep"""
+    left, top, right, bottom = box
+    region = mask[top:bottom, left:right]
+    axis = 1 if horizontal else 0
+    profile = region.sum(axis=axis)
+    noise = region.shape[axis] * 0.001
+    extent = mask.shape[1 - axis]
+    min_gap = max(4, int(extent * gap_ratio))
+    min_size = max(16, int(extent * size_ratio))
+    spans = _split_profile(profile, min_gap, min_size, noise)
+    if not spans:
+        return []
+
+    if horizontal:
+        children = [(left, top + a, right, top + b) for a, b in spans]
+    else:
+        children = [(left + a, top, left + b, bottom) for a, b in spans]
+    if depth == 0:
+        return children
+
+    regions = []
+    for child in children:
+        regions.extend(_xy_cut(mask, child, gap_ratio, size_ratio, depth - 1, not horizontal)
+                       or [child])
+    return regions
+
+
+def detect_chart_regions(image, min_gap_ratio=0.03, min_size_ratio=0.2,
+                         min_area_ratio=0.05, max_depth=2, padding=8):
+    """
+    Find chart regions in a dashboard image
+
+    Args:
+        image: image path or PIL image
+        min_gap_ratio: minimum whitespace gutter, as a fraction of the image
+            width (vertical gutters) or height (horizontal gutters)
+        min_size_ratio: minimum region extent along the cut, same convention
+        min_area_ratio: regions smaller than this fraction of the image are dropped
+        max_depth: number of alternating horizontal/vertical cuts
+        padding: pixels of margin kept around each region
+
+    Returns:
+        list: (left, top, right, bottom) boxes in reading order; the whole image
+        when no split is found
+    """
+    img = Image.open(image) if isinstance(image, str) else image
+    width, height = img.size
+    whole = [(0, 0, width, height)]
+    mask = _ink_mask(img)
+    if not mask.any():
+        return whole
+
+    regions = _xy_cut(mask, (0, 0, width, height), min_gap_ratio, min_size_ratio,
+                      max_depth, True)
+    regions = [r for r in regions
+               if (r[2] - r[0]) * (r[3] - r[1]) >= min_area_ratio * width * height]
+    if len(regions) <= 1:
+        return whole
+
+    return [(max(0, l - padding), max(0, t - padding),
+             min(width, r + padding), min(height, b + padding))
+            for l, t, r, b in regions]
+
+
+def crop_regions(image_path, boxes, directory=None):
+    """Save each region of the image as a PNG and return the file paths"""
+    directory = directory or new_export_dir("chart_regions_")
+    img = Image.open(image_path)
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    paths = []
+    for i, box in enumerate(boxes, start=1):
+        path = os.path.join(directory, f"chart_{i}.png")
+        img.crop(box).save(path)
+        paths.append(path)
+    return paths
+
+
+def charts_to_tables(image_path, boxes, convert, workers=CHART_WORKERS):
+    """
+    Convert each chart region concurrently, one table per chart
+
+    Args:
+        image_path (str): Path to the dashboard image
+        boxes (list): Chart regions from detect_chart_regions
+        convert (callable): convert(crop_path) -> model response for one chart
+
+    Yields:
+        tuple: (HTML with one table per chart, list of exported file paths)
+    """
+    export_dir = new_export_dir()
+    with span("crop_charts", charts=len(boxes)):
+        crops = crop_regions(image_path, boxes, export_dir)
+
+    def convert_chart(i, crop):
+        with span("convert_chart", chart=i + 1):
+            return convert(crop)
+
+    executor = ThreadPoolExecutor(max_workers=min(workers, len(crops)))
+    try:
+        sections = ["<p><i>Converting...</i></p>"] * len(crops)
+        export_paths = []
+        # Each worker runs in a copy of this context, so its spans nest under ours
+        futures = {executor.submit(contextvars.copy_context().run, convert_chart, i, crop): i
+                   for i, crop in enumerate(crops)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                with span("parse_export", chart=i + 1):
+                    table_html, table, paths = process_table_response(
+                        future.result(), export_dir, f"chart_{i + 1}")
+            except Exception as e:
+                table_html, paths = f"<p>Error converting chart: {html.escape(str(e))}</p>", None
+            sections[i] = table_html
+            export_paths.extend(paths or [])
+            yield render_table_list(sections), None
+    finally:
+        # A closed generator (client gone) drops the charts not started yet
+        # instead of waiting for them
+        executor.shutdown(wait=False, cancel_futures=True)
+        # The exports stay for download; the crops are only model input
+        for crop in crops:
+            os.remove(crop)
+    yield render_table_list(sections), sorted(export_paths)
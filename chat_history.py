@@ -0,0 +1,184 @@
+# Token-window-aware chat history: recent turns verbatim, older turns folded
+# into a cached rolling summary, everything kept inside a per-model budget.
+# Summaries are computed in the background between turns, never while a
+# reply is waiting on them.
+
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Rough characters per token for Llama-family tokenizers on English text
+CHARS_PER_TOKEN = 4
+# Per-message overhead for role markers and separators
+MESSAGE_OVERHEAD = 4
+# Older turns are folded in batches so the summary (the prompt prefix) changes
+# rarely and Ollama can keep reusing its cached prefix between turns
+FOLD_BATCH = 4
+
+SUMMARY_PROMPT = ("Summarize the conversation below in a few sentences. Keep names, "
+                  "facts, decisions and open questions; drop pleasantries.\n\n"
+                  "{previous}{turns}")
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def turn_tokens(turn):
+    human, assistant = turn
+    return estimate_tokens(human) + estimate_tokens(assistant or "") + 2 * MESSAGE_OVERHEAD
+
+
+def _format_turns(turns):
+    return "\n".join(f"User: {human}\nAssistant: {assistant}" for human, assistant in turns)
+
+
+class HistoryManager:
+    """
+    Build the messages for the next turn within a model's token budget
+
+    Args:
+        budgets (dict): model name -> prompt token budget
+        summarize_fn: summarize_fn(prompt) -> summary text
+        default_budget (int): budget for models missing from budgets
+        summary_share (float): part of the budget reserved for the summary
+        min_recent_turns (int): turns always kept verbatim
+        store: optional persistent summary store with find_summaries(digests)
+            and put_summary(digest, summary), so resumed conversations reuse them
+    """
+
+    def __init__(self, budgets, summarize_fn, default_budget=4096, summary_share=0.2,
+                 min_recent_turns=1, cache_size=256, store=None):
+        self.budgets = budgets
+        self.summarize_fn = summarize_fn
+        self.store = store
+        self.default_budget = default_budget
+        self.summary_share = summary_share
+        self.min_recent_turns = min_recent_turns
+        self.cache_size = cache_size
+        self._summaries = OrderedDict()  # chained digest of folded turns -> summary
+        self._pending = set()  # digests being summarized in the background
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarize")
+
+    def budget(self, model_name):
+        return self.budgets.get(model_name, self.default_budget)
+
+    def build_messages(self, prompt, history, model_name):
+        """
+        Return Ollama chat messages for history (list of (human, assistant)) plus
+        prompt. Folded turns are replaced by the longest summary already computed;
+        turns it does not cover yet are dropped rather than waited for.
+        """
+        history = [tuple(turn) for turn in history]
+        cut = self._fold_cut(history, self.budget(model_name), estimate_tokens(prompt))
+
+        messages = []
+        if cut:
+            _, summary = self._cached_prefix(self._chain_digests(history[:cut]))
+            if summary:
+                messages.append({"role": "system",
+                                 "content": f"Summary of the earlier conversation: {summary}"})
+        for human, assistant in history[cut:]:
+            messages.extend([
+                {"role": "user", "content": human},
+                {"role": "assistant", "content": assistant}
+            ])
+        messages.append({"role": "user", "content": prompt})
+        return messages
+
+    def prepare(self, history, model_name):
+        """
+        Call after a turn completes: summarize in the background the turns the
+        next build_messages will fold, so the next reply does not wait for it
+        """
+        history = [tuple(turn) for turn in history]
+        cut = self._fold_cut(history, self.budget(model_name), 0)
+        if not cut:
+            return
+        turns = history[:cut]
+        digest = self._chain_digests(turns)[-1]
+        with self._lock:
+            if digest in self._summaries or digest in self._pending:
+                return
+            self._pending.add(digest)
+        self._executor.submit(self._summarize_in_background, turns, digest)
+
+    def _summarize_in_background(self, turns, digest):
+        try:
+            self.summary(turns)
+        except Exception:
+            pass  # retried after the next turn; until then older turns are truncated
+        finally:
+            with self._lock:
+                self._pending.discard(digest)
+
+    def _fold_cut(self, history, budget, prompt_tokens):
+        """Number of leading turns to fold into the summary"""
+        available = budget - prompt_tokens - MESSAGE_OVERHEAD
+        recent_budget = available - int(budget * self.summary_share)
+
+        # Keep as many recent turns verbatim as the budget allows
+        cut = len(history)
+        used = 0
+        while cut > 0:
+            cost = turn_tokens(history[cut - 1])
+            if used + cost > recent_budget and len(history) - cut >= self.min_recent_turns:
+                break
+            used += cost
+            cut -= 1
+
+        # Fold whole batches, so the summary only changes every FOLD_BATCH turns
+        if cut % FOLD_BATCH:
+            cut = min(cut + FOLD_BATCH - cut % FOLD_BATCH,
+                      len(history) - self.min_recent_turns)
+        return max(cut, 0)
+
+    def summary(self, turns):
+        """Rolling summary of turns, reusing the summary of the longest cached prefix"""
+        digests = self._chain_digests(turns)
+        start, previous = self._cached_prefix(digests)
+        if start == len(turns):
+            return previous
+
+        prompt = SUMMARY_PROMPT.format(
+            previous=f"Earlier summary: {previous}\n\n" if previous else "",
+            turns=_format_turns(turns[start:]))
+        summary = self.summarize_fn(prompt).strip()
+        self._remember(digests[-1], summary)
+        if self.store is not None:
+            self.store.put_summary(digests[-1], summary)
+        return summary
+
+    def _cached_prefix(self, digests):
+        """(turn count, summary) of the longest summarized prefix, or (0, "")"""
+        with self._lock:
+            for end in range(len(digests), 0, -1):
+                if digests[end - 1] in self._summaries:
+                    self._summaries.move_to_end(digests[end - 1])
+                    return end, self._summaries[digests[end - 1]]
+        if self.store is not None:
+            stored = self.store.find_summaries(digests)
+            for end in range(len(digests), 0, -1):
+                if digests[end - 1] in stored:
+                    self._remember(digests[end - 1], stored[digests[end - 1]])
+                    return end, stored[digests[end - 1]]
+        return 0, ""
+
+    def _remember(self, digest, summary):
+        with self._lock:
+            self._summaries[digest] = summary
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+
+    @staticmethod
+    def _chain_digests(turns):
+        digests = []
+        digest = b""
+        for human, assistant in turns:
+            digest = hashlib.sha1(
+                digest + human.encode("utf-8") + b"\0" + (assistant or "").encode("utf-8")
+            ).digest()
+            digests.append(digest)
+        return digests
@@ -1,6 +1,18 @@
 import gradio as gr
 import requests
 import json
+import os
+import time
+from chat_history import HistoryManager
+from stream_utils import coalesce_chunks
+from model_compare import compare_models_stream, format_stats_table
+from ollama_scheduler import scheduler
+from story_edit import edit_story_stream
+from conversation_store import ConversationStore
+from health import CircuitOpenError, get_breaker, monitor
+from metrics import model_call, start_metrics_server
+from cassette import recorded
+from profiling import profiled
 
 # Available models with correct Ollama model names
 AVAILABLE_MODELS = {
@@ -9,54 +21,252 @@ AVAILABLE_MODELS = {
     "qwq": "qwq:latest"
 }
 
+# Prompt token budget per model; the reply gets RESPONSE_TOKENS on top of it
+MODEL_TOKEN_BUDGETS = {
+    "llama3.1:latest": 6144,
+    "deepseek-r1:32b": 3072,
+    "qwq:latest": 3072
+}
+RESPONSE_TOKENS = 2048
+SUMMARY_MODEL = AVAILABLE_MODELS["llama"]
+
+COMPARE_CHOICES = ["Llama 3.1", "Deepseek R1", "QWQ"]
+
+# Streamed chat updates are batched to at most one per interval (seconds)
+STREAM_INTERVAL = float(os.getenv("CHAT_STREAM_INTERVAL", "0.05"))
+STREAM_MAX_CHARS = int(os.getenv("CHAT_STREAM_MAX_CHARS", "512"))
+
+# The chat shows only the last CHAT_TAIL_TURNS turns; older ones page in on demand
+CHAT_TAIL_TURNS = int(os.getenv("CHAT_TAIL_TURNS", "20"))
+CHAT_PAGE_TURNS = int(os.getenv("CHAT_PAGE_TURNS", "20"))
+
 # Ollama API endpoints
-OLLAMA_BASE_URL = "http://localhost:11434/api"
+OLLAMA_BASE_URL = f"{os.getenv('OLLAMA_HOST', 'http://localhost:11434')}/api"
 CHAT_ENDPOINT = f"{OLLAMA_BASE_URL}/chat"
+# (connect, read) seconds; a hung daemon counts as a failure for the breaker
+OLLAMA_TIMEOUT = (5, float(os.getenv("OLLAMA_TIMEOUT", "300")))
 
-def generate_streaming_response(prompt, conversation_history, model_name="llama3.1:latest"):
-    """Generate streaming response for general chat"""
-    messages = []
-    for human, assistant in conversation_history:
-        messages.extend([
-            {"role": "user", "content": human},
-            {"role": "assistant", "content": assistant}
-        ])
-    
-    messages.append({"role": "user", "content": prompt})
-    
+ollama_breaker = get_breaker("ollama")
+
+@recorded("ollama.summarize_history")
+def summarize_history(prompt):
+    """Summarize older chat turns with the fast model"""
+    payload = {
+        "model": SUMMARY_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "stream": False
+    }
+    ollama_breaker.check()
+    with scheduler.slot(SUMMARY_MODEL), ollama_breaker.guard(), \
+         model_call("ollama", SUMMARY_MODEL, payload) as call:
+        response = requests.post(CHAT_ENDPOINT, json=payload, timeout=OLLAMA_TIMEOUT)
+        call.first_byte(response.elapsed.total_seconds())
+        response.raise_for_status()
+        result = response.json()
+        call.ollama_stats(result)
+    return result['message']['content']
+
+conversations = ConversationStore()
+history_manager = HistoryManager(MODEL_TOKEN_BUDGETS, summarize_history, store=conversations)
+
+def stream_response(prompt, conversation_history, model_name="llama3.1:latest"):
+    """Stream the reply text; request errors are raised, not yielded"""
     payload = {
         "model": model_name,
-        "messages": messages,
-        "stream": True
+        "messages": history_manager.build_messages(prompt, conversation_history, model_name),
+        "stream": True,
+        # Size the context window to the budget so Ollama never truncates silently
+        "options": {"num_ctx": history_manager.budget(model_name) + RESPONSE_TOKENS}
     }
-    
+    for json_response in stream_ollama_chat(payload):
+        if 'message' in json_response and 'content' in json_response['message']:
+            yield json_response['message']['content']
+
+def generate_streaming_response(prompt, conversation_history, model_name="llama3.1:latest"):
+    """Generate streaming response for general chat"""
     try:
-        response = requests.post(CHAT_ENDPOINT, json=payload, stream=True)
-        response.raise_for_status()
-        
-        for line in response.iter_lines():
-            if line:
-                json_response = json.loads(line)
-                if 'message' in json_response and 'content' in json_response['message']:
-                    yield json_response['message']['content']
-                
-    except requests.exceptions.RequestException as e:
+        yield from stream_response(prompt, conversation_history, model_name)
+    except (requests.exceptions.RequestException, CircuitOpenError) as e:
         yield f"Error: {str(e)}\nMake sure Ollama is running and the model is installed."
 
-def chat_respond(message, chat_history, model_choice):
-    """Handle chat responses with streaming"""
-    model_name = AVAILABLE_MODELS[model_choice.lower().replace(" 3.1", "")]
-    chat_history = chat_history + [(message, "")]
-    yield "", chat_history
+@recorded("ollama.stream_ollama_chat")
+def stream_ollama_chat(payload, schedule=True):
+    """
+    Yield each JSON part of a streaming Ollama /api/chat response. The
+    request holds a scheduler slot for its model until the stream ends.
+    """
+    if schedule:
+        ollama_breaker.check()
+        with scheduler.slot(payload["model"]) as ticket:
+            for part in stream_ollama_chat(payload, schedule=False):
+                ticket.touch()
+                yield part
+        return
+    with ollama_breaker.guard(), model_call("ollama", payload["model"], payload) as call:
+        with requests.post(CHAT_ENDPOINT, json=payload, stream=True,
+                           timeout=OLLAMA_TIMEOUT) as response:
+            call.first_byte(response.elapsed.total_seconds())
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    part = json.loads(line)
+                    if part.get('message', {}).get('content'):
+                        call.token()
+                    if part.get('done'):
+                        call.ollama_stats(part)
+                    yield part
+
+@profiled("chat_respond")
+def chat_respond(message, conversation_id, model_choice, shown_turns):
+    """
+    Handle chat responses with streaming. The conversation lives in the
+    server-side store; the browser only gets the turns it is showing.
+    """
+    model_name = AVAILABLE_MODELS[model_choice.lower().replace(" 3.1", "").split()[0]]
+    if not conversations.exists(conversation_id):
+        conversation_id = conversations.create("chat")
+        shown_turns = 0
+    history = conversations.turns(conversation_id)
+    shown_turns = min(len(history), max(shown_turns or 0, CHAT_TAIL_TURNS))
+    chat_history = (history[-shown_turns:] if shown_turns else []) + [(message, "")]
+    yield "", chat_history, conversation_id, shown_turns + 1
     
+    # Gradio sends only the diff of each update; batching chunks also cuts the
+    # number of times the whole history is post-processed and diffed
     current_response = ""
-    for chunk in generate_streaming_response(message, chat_history[:-1], model_name):
+    chunks = generate_streaming_response(message, history, model_name)
+    for chunk in coalesce_chunks(chunks, STREAM_INTERVAL, STREAM_MAX_CHARS):
         current_response += chunk
         chat_history[-1] = (message, current_response)
-        yield "", chat_history
+        yield gr.skip(), chat_history, gr.skip(), gr.skip()
+    conversations.append(conversation_id, message, current_response)
+    history_manager.prepare(history + [(message, current_response)], model_name)
 
-# [Previous functions remain unchanged]
-[... Keep all the previous functions for story creation ...]
+def load_older_turns(conversation_id, shown_turns):
+    """Page CHAT_PAGE_TURNS older turns into the chat"""
+    if not conversations.exists(conversation_id):
+        return [], 0
+    shown_turns = (shown_turns or 0) + CHAT_PAGE_TURNS
+    return conversations.turns(conversation_id, limit=shown_turns), shown_turns
+
+def resume_conversation(conversation_id):
+    """Show the tail of a stored conversation"""
+    conversation_id = (conversation_id or "").strip()
+    if not conversations.exists(conversation_id):
+        return [], "", 0
+    turns = conversations.turns(conversation_id, limit=CHAT_TAIL_TURNS)
+    return turns, conversation_id, len(turns)
+
+def resume_from_url(request: gr.Request):
+    """Resume the conversation named by the ?session= query parameter, if any"""
+    return resume_conversation(request.query_params.get("session", ""))
+
+def build_story_prompt(name, culture, language, content):
+    """Prompt used to create a story for the given reader and culture"""
+    prompt = (f"Write a short story in {language or 'English'} that fits "
+              f"{culture or 'a general'} culture, based on: {content}")
+    if name and name.strip():
+        prompt += f"\nThe story is for {name.strip()}; include them as a character."
+    return prompt
+
+def story_tail(story_id, shown_turns):
+    """
+    Start a story conversation unless story_id is a stored one; returns
+    (story_id, visible turns, shown turn count) for the story chat
+    """
+    if not conversations.exists(story_id):
+        return conversations.create("story"), [], 0
+    shown_turns = min(conversations.count(story_id), max(shown_turns or 0, CHAT_TAIL_TURNS))
+    turns = conversations.turns(story_id, limit=shown_turns) if shown_turns else []
+    return story_id, turns, shown_turns
+
+def compare_models(name, culture, language, content, selected_models):
+    """
+    Create the same story with every selected model at once, streaming each
+    model into its own column with TTFT, tokens/sec and total time
+    """
+    # Each choice owns the output column at its position in COMPARE_CHOICES
+    column_of = {AVAILABLE_MODELS[choice.lower().replace(" 3.1", "").split()[0]]: i
+                 for i, choice in enumerate(COMPARE_CHOICES)}
+    selected = set(selected_models or COMPARE_CHOICES)
+    model_names = [model for model, i in column_of.items() if COMPARE_CHOICES[i] in selected]
+    prompt = build_story_prompt(name, culture, language, content)
+
+    def stream_fn(model_name):
+        # compare_models_stream already holds the scheduler slot
+        return stream_ollama_chat({
+            "model": model_name,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True
+        }, schedule=False)
+
+    columns = [""] * len(COMPARE_CHOICES)
+    for results in compare_models_stream(model_names, stream_fn, scheduler):
+        for model_name, result in results.items():
+            text = result["text"] or f"*{result['status']}...*"
+            if result["error"]:
+                text += f"\n\nError: {result['error']}"
+            columns[column_of[model_name]] = f"**{model_name}**\n\n{text}"
+        yield ("", *columns, format_stats_table(results))
+
+def edit_story(edit_instructions, story_id, shown_turns, model_choice):
+    """
+    Edit the latest story by rewriting only the paragraphs the instruction
+    touches; the rest is spliced back verbatim. The edit is stored as a new
+    turn of the story conversation.
+    """
+    latest = conversations.turns(story_id, limit=1) if conversations.exists(story_id) else []
+    if not edit_instructions.strip() or not latest:
+        yield edit_instructions, gr.skip(), story_id, shown_turns
+        return
+    model_name = AVAILABLE_MODELS[model_choice.lower().replace(" 3.1", "").split()[0]]
+    story = latest[0][1]
+
+    # Errors are raised rather than streamed, so they never replace story text
+    def complete_fn(prompt):
+        return "".join(stream_response(prompt, [], model_name))
+
+    def stream_fn(prompt):
+        return stream_response(prompt, [], model_name)
+
+    story_id, story_history, shown_turns = story_tail(story_id, shown_turns)
+    story_history = story_history + [(edit_instructions, story)]
+    yield "", story_history, gr.skip(), shown_turns + 1
+    edited = story
+    last_update = 0
+    try:
+        for edited in edit_story_stream(story, edit_instructions, complete_fn, stream_fn):
+            story_history[-1] = (edit_instructions, edited)
+            if time.monotonic() - last_update >= STREAM_INTERVAL:
+                last_update = time.monotonic()
+                yield gr.skip(), story_history, gr.skip(), gr.skip()
+    except (requests.exceptions.RequestException, CircuitOpenError) as e:
+        gr.Warning(f"Edit stopped: {e}. Make sure Ollama is running and the model is installed.")
+    conversations.append(story_id, edit_instructions, edited)
+    yield gr.skip(), story_history, gr.skip(), gr.skip()
+
+def create_story(name, culture, language, content, model_choice, story_id, shown_turns):
+    """
+    Create a story with the chosen model, streaming it into the story chat.
+    Stories are stored as turns of a "story" conversation; the chat only
+    gets the turns it is showing.
+    """
+    if not content or not content.strip():
+        yield "", gr.skip(), story_id, shown_turns
+        return
+    model_name = AVAILABLE_MODELS[model_choice.lower().replace(" 3.1", "").split()[0]]
+    prompt = build_story_prompt(name, culture, language, content)
+    story_id, story_history, shown_turns = story_tail(story_id, shown_turns)
+    story_history = story_history + [(content, "")]
+    yield "", story_history, story_id, shown_turns + 1
+
+    story = ""
+    chunks = generate_streaming_response(prompt, [], model_name)
+    for chunk in coalesce_chunks(chunks, STREAM_INTERVAL, STREAM_MAX_CHARS):
+        story += chunk
+        story_history[-1] = (content, story)
+        yield gr.skip(), story_history, gr.skip(), gr.skip()
+    conversations.append(story_id, content, story)
 
 # Create Gradio interface
 with gr.Blocks(title="AI Story Creation & Chat") as demo:
@@ -82,14 +292,33 @@ with gr.Blocks(title="AI Story Creation & Chat") as demo:
                     placeholder="Type your message here...",
                     show_label=False
                 )
-                clear_chat = gr.ClearButton([msg, chatbox])
+                with gr.Row():
+                    chat_session = gr.Textbox(
+                        label="Session ID",
+                        placeholder="Paste a session ID to resume a conversation"
+                    )
+                    resume_btn = gr.Button("Resume")
+                    older_btn = gr.Button("Load Older Messages")
+                shown_turns = gr.State(0)
+                clear_chat = gr.ClearButton([msg, chatbox, chat_session])
 
                 # Connect chat components
                 msg.submit(
                     chat_respond,
-                    inputs=[msg, chatbox, chat_model_choice],
-                    outputs=[msg, chatbox]
+                    inputs=[msg, chat_session, chat_model_choice, shown_turns],
+                    outputs=[msg, chatbox, chat_session, shown_turns]
                 )
+                resume_btn.click(
+                    resume_conversation,
+                    inputs=[chat_session],
+                    outputs=[chatbox, chat_session, shown_turns]
+                )
+                older_btn.click(
+                    load_older_turns,
+                    inputs=[chat_session, shown_turns],
+                    outputs=[chatbox, shown_turns]
+                )
+                demo.load(resume_from_url, outputs=[chatbox, chat_session, shown_turns])
         
         # Story Creation Tab
         with gr.Tab("Story Creation"):
@@ -120,6 +349,12 @@ with gr.Blocks(title="AI Story Creation & Chat") as demo:
                         create_btn = gr.Button("Create Story", variant="primary")
                         compare_btn = gr.Button("Compare Models")
                     
+                    compare_choice = gr.CheckboxGroup(
+                        choices=COMPARE_CHOICES,
+                        value=COMPARE_CHOICES,
+                        label="Models to Compare"
+                    )
+                    
                     edit_input = gr.Textbox(
                         label="Edit Instructions",
                         lines=2,
@@ -133,25 +368,41 @@ with gr.Blocks(title="AI Story Creation & Chat") as demo:
                         show_label=False,
                         bubble_full_width=False
                     )
-                    clear_story = gr.ClearButton([story_chatbot])
+                    older_stories_btn = gr.Button("Load Older Stories")
+                    story_session = gr.State(None)
+                    story_shown = gr.State(0)
+                    clear_story = gr.ClearButton([story_chatbot, story_session, story_shown])
+
+                    # Side-by-side model comparison
+                    with gr.Row():
+                        compare_outputs = [gr.Markdown() for _ in COMPARE_CHOICES]
+                    compare_stats = gr.Markdown()
 
                 # Connect story components
                 create_btn.click(
                     create_story,
-                    inputs=[name_input, culture_input, language_input, content_input, model_choice, story_chatbot],
-                    outputs=[edit_input, story_chatbot]
+                    inputs=[name_input, culture_input, language_input, content_input, model_choice,
+                            story_session, story_shown],
+                    outputs=[edit_input, story_chatbot, story_session, story_shown]
                 )
                 
                 edit_btn.click(
                     edit_story,
-                    inputs=[edit_input, story_chatbot, model_choice],
-                    outputs=[edit_input, story_chatbot]
+                    inputs=[edit_input, story_session, story_shown, model_choice],
+                    outputs=[edit_input, story_chatbot, story_session, story_shown]
                 )
                 
                 compare_btn.click(
                     compare_models,
-                    inputs=[name_input, culture_input, language_input, content_input, story_chatbot],
-                    outputs=[edit_input, story_chatbot]
+                    inputs=[name_input, culture_input, language_input, content_input,
+                            compare_choice],
+                    outputs=[edit_input, *compare_outputs, compare_stats]
+                )
+                
+                older_stories_btn.click(
+                    load_older_turns,
+                    inputs=[story_session, story_shown],
+                    outputs=[story_chatbot, story_shown]
                 )
 
     gr.Markdown("""
@@ -167,4 +418,6 @@ with gr.Blocks(title="AI Story Creation & Chat") as demo:
 
 if __name__ == "__main__":
     print("Starting AI Story Creation & Chat... Please ensure Ollama is running.")
+    monitor.start()
+    start_metrics_server()
     demo.launch(server_name="0.0.0.0", share=True)
\ No newline at end of file
@@ -0,0 +1,163 @@
+# Server-side store for chat and story conversations (SQLite). The UI only
+# receives the visible tail of a conversation and pages older turns in on
+# demand; the model is fed from here, not from the browser.
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+DB_PATH = os.getenv("CHAT_DB_PATH", "chat_sessions.db")
+# Conversations idle longer than this (seconds) are deleted, as are the
+# least recently updated ones beyond the cap
+CONVERSATION_TTL = float(os.getenv("CHAT_CONVERSATION_TTL", str(30 * 24 * 3600)))
+CONVERSATION_MAX = int(os.getenv("CHAT_CONVERSATION_MAX", "10000"))
+# Texts longer than this are stored zlib-compressed
+COMPRESS_MIN_BYTES = 512
+# Digests per IN (...) query, below SQLite's default limit of 999 variables
+SUMMARY_QUERY_BATCH = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversations_by_updated ON conversations (updated);
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    human BLOB NOT NULL,
+    assistant BLOB NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turns_by_conversation ON turns (conversation_id, id);
+CREATE TABLE IF NOT EXISTS summaries (
+    digest BLOB PRIMARY KEY,
+    summary TEXT NOT NULL,
+    used REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+def _pack(text):
+    data = (text or "").encode("utf-8")
+    if len(data) >= COMPRESS_MIN_BYTES:
+        return zlib.compress(data)
+    return text or ""
+
+
+def _unpack(value):
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode("utf-8")
+    return value
+
+
+class ConversationStore:
+    """
+    Conversations as ordered (human, assistant) turns, keyed by conversation ID
+
+    Expired conversations are deleted whenever a new one is created, and
+    so are history summaries that have not been used for as long.
+    """
+
+    def __init__(self, path=DB_PATH, ttl=CONVERSATION_TTL, max_conversations=CONVERSATION_MAX):
+        self.ttl = ttl
+        self.max_conversations = max_conversations
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(summaries)")]
+            if "used" not in columns:
+                # Databases from before summaries expired; the old rows go at the next eviction
+                self._conn.execute(
+                    "ALTER TABLE summaries ADD COLUMN used REAL NOT NULL DEFAULT 0")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS summaries_by_used ON summaries (used)")
+
+    def create(self, kind="chat"):
+        conversation_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO conversations VALUES (?, ?, ?, ?)",
+                               (conversation_id, kind, now, now))
+            self._evict_locked(now)
+        return conversation_id
+
+    def exists(self, conversation_id):
+        if not conversation_id:
+            return False
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM conversations WHERE id = ?",
+                                     (conversation_id,)).fetchone()
+        return row is not None
+
+    def append(self, conversation_id, human, assistant):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO turns (conversation_id, human, assistant, created) "
+                "VALUES (?, ?, ?, ?)", (conversation_id, _pack(human), _pack(assistant), now))
+            self._conn.execute("UPDATE conversations SET updated = ? WHERE id = ?",
+                               (now, conversation_id))
+
+    def count(self, conversation_id):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM turns WHERE conversation_id = ?",
+                                      (conversation_id,)).fetchone()[0]
+
+    def turns(self, conversation_id, limit=None):
+        """All turns in order, or only the last `limit` turns"""
+        with self._lock:
+            if limit is None:
+                rows = self._conn.execute(
+                    "SELECT human, assistant FROM turns WHERE conversation_id = ? ORDER BY id",
+                    (conversation_id,)).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT human, assistant FROM turns WHERE conversation_id = ? "
+                    "ORDER BY id DESC LIMIT ?", (conversation_id, limit)).fetchall()[::-1]
+        return [(_unpack(human), _unpack(assistant)) for human, assistant in rows]
+
+    def _evict_locked(self, now):
+        expired = [row[0] for row in self._conn.execute(
+            "SELECT id FROM conversations WHERE updated < ? UNION "
+            "SELECT id FROM (SELECT id FROM conversations ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+            (now - self.ttl, self.max_conversations))]
+        if expired:
+            self._conn.executemany("DELETE FROM turns WHERE conversation_id = ?",
+                                   [(i,) for i in expired])
+            self._conn.executemany("DELETE FROM conversations WHERE id = ?",
+                                   [(i,) for i in expired])
+        # Summaries are keyed by the content of the turns they cover, not by
+        # conversation, and a conversation only reuses its latest one
+        self._conn.execute(
+            "DELETE FROM summaries WHERE used < ? OR digest IN "
+            "(SELECT digest FROM summaries ORDER BY used DESC LIMIT -1 OFFSET ?)",
+            (now - self.ttl, self.max_conversations))
+
+    def find_summaries(self, digests):
+        """Stored summaries for any of the given digests, as {digest: summary}"""
+        digests = list(digests)
+        found = {}
+        with self._lock, self._conn:
+            for i in range(0, len(digests), SUMMARY_QUERY_BATCH):
+                batch = digests[i:i + SUMMARY_QUERY_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                found.update(self._conn.execute(
+                    f"SELECT digest, summary FROM summaries WHERE digest IN ({placeholders})",
+                    batch).fetchall())
+            if found:
+                self._conn.executemany("UPDATE summaries SET used = ? WHERE digest = ?",
+                                       [(time.time(), d) for d in found])
+        return found
+
+    def put_summary(self, digest, summary):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?)",
+                               (digest, summary, time.time()))
@@ -0,0 +1,113 @@
+# Optional "Performance" tab: request rates and latency percentiles per task
+# and per backend, cache hit ratios, queue depth and backend health, read from
+# the in-process metrics and refreshed with gr.Timer. Enabled by PERFORMANCE_TAB=1.
+
+import html
+import os
+import time
+
+import gradio as gr
+
+from health import monitor
+from metrics import recent_calls, recent_tasks
+from ollama_scheduler import scheduler
+
+PERFORMANCE_TAB = os.getenv("PERFORMANCE_TAB", "0") == "1"
+DASHBOARD_REFRESH = float(os.getenv("DASHBOARD_REFRESH", "2"))  # seconds between updates
+DASHBOARD_WINDOW = float(os.getenv("DASHBOARD_WINDOW", "300"))  # seconds summarized
+
+TASK_NAMES = {
+    "interior_design": "Interior Design",
+    "interior_followup": "Interior Design follow-up",
+    "read_receipts": "Read Receipts",
+    "graph_to_table": "Graph to Table",
+}
+
+
+def _seconds(value):
+    return "-" if value is None else f"{value:.2f}s"
+
+
+def _percent(value):
+    return "-" if value is None else f"{value:.0%}"
+
+
+def _table(headers, rows):
+    head = "".join(f"<th>{html.escape(h)}</th>" for h in headers)
+    if not rows:
+        rows = [["no data"] + [""] * (len(headers) - 1)]
+    body = "".join("<tr>" + "".join(f"<td>{html.escape(str(cell))}</td>" for cell in row) + "</tr>"
+                   for row in rows)
+    return f"<table><tr>{head}</tr>{body}</table>"
+
+
+def _latency_rows(summary, names=None):
+    return [[(names or {}).get(key, key), stats["count"], f"{stats['rate'] * 60:.1f}",
+             _seconds(stats["p50"]), _seconds(stats["p95"]), _seconds(stats["p99"]),
+             _percent(stats["error_rate"])]
+            for key, stats in summary.items()]
+
+
+def _ratio(hits, total):
+    return _percent(hits / total) if total else "-"
+
+
+def render(router=None, speculator=None, window=DASHBOARD_WINDOW):
+    """The dashboard as HTML"""
+    latency_headers = ["", "Requests", "Per min", "p50", "p95", "p99", "Errors"]
+    sections = [
+        f"<p><i>Last {window / 60:g} minutes, updated {time.strftime('%H:%M:%S')}</i></p>",
+        "<h3>Tasks</h3>",
+        _table(latency_headers, _latency_rows(recent_tasks.summary(window), TASK_NAMES)),
+        "<h3>Model calls by backend</h3>",
+        _table(latency_headers, _latency_rows(recent_calls.summary(window))),
+    ]
+
+    caches = []
+    if speculator is not None:
+        caches.append(["Speculative follow-ups", speculator.hits, speculator.hits + speculator.misses,
+                       _ratio(speculator.hits, speculator.hits + speculator.misses)])
+    flights = getattr(router, "flights", None)
+    if flights is not None:
+        total = flights.started + flights.coalesced
+        caches.append(["Coalesced model requests", flights.coalesced, total,
+                       _ratio(flights.coalesced, total)])
+    if caches:
+        sections += ["<h3>Cache hits</h3>", _table(["", "Hits", "Lookups", "Hit ratio"], caches)]
+
+    stats = scheduler.stats()
+    queue_rows = [[model, depth, stats["running"].get(model, 0)]
+                  for model, depth in sorted(stats["queue_depth"].items())]
+    queue_rows += [[model, 0, running] for model, running in sorted(stats["running"].items())
+                   if model not in stats["queue_depth"]]
+    sections += ["<h3>Ollama queue</h3>", _table(["Model", "Waiting", "Running"], queue_rows),
+                 f"<p>Mean wait {_seconds(stats['mean_wait'])}, "
+                 f"{stats['completed']} completed, {stats['model_switches']} model switches</p>"]
+
+    routes = router.snapshot() if router is not None else {}
+    backend_rows = []
+    for name, health in monitor.status().items():
+        backend_rows.append([name, health["state"],
+                             {True: "up", False: "down"}.get(health["healthy"], "unknown"),
+                             _percent(health["failure_rate"]), "", "", ""])
+    for provider in getattr(router, "providers", []):
+        entry = routes.get(provider.name, {})
+        complete = entry.get("complete", {})
+        backend_rows.append([f"route: {provider.name}",
+                             "available" if entry.get("available") else "unavailable", "",
+                             _percent(complete.get("error_rate")), entry.get("queue_depth", ""),
+                             _seconds(complete.get("p50")), _seconds(complete.get("p95"))])
+    sections += ["<h3>Backends</h3>",
+                 _table(["Backend", "State", "Probe", "Failures", "Queue", "p50", "p95"],
+                        backend_rows)]
+    return "\n".join(sections)
+
+
+def performance_tab(router=None, speculator=None):
+    """Add the Performance tab to the enclosing gr.Blocks"""
+    with gr.Tab("Performance"):
+        dashboard = gr.HTML(render(router, speculator))
+        timer = gr.Timer(DASHBOARD_REFRESH)
+        # Unqueued so the dashboard still updates while the model queue is full
+        timer.tick(lambda: render(router, speculator), outputs=dashboard,
+                   queue=False, show_progress="hidden", show_api=False)
@@ -0,0 +1,257 @@
+# Per-backend circuit breakers plus a background health probe. While a backend
+# is down, requests fail immediately instead of each one holding a worker and a
+# scheduler slot until its connection error or timeout.
+
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import requests
+
+import cancellation
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+
+# A breaker opens after BREAKER_CONSECUTIVE failures in a row, or when at least
+# BREAKER_FAILURE_RATE of its last BREAKER_WINDOW requests (and no fewer than
+# BREAKER_MIN_REQUESTS) failed. After BREAKER_OPEN_SECONDS one trial request
+# is let through (half-open); it closes or re-opens the breaker.
+BREAKER_WINDOW = 20
+BREAKER_MIN_REQUESTS = 5
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_CONSECUTIVE = int(os.getenv("BREAKER_CONSECUTIVE", "3"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "15"))
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "3"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend whose breaker is open"""
+
+
+def is_backend_failure(error):
+    """Connection errors, timeouts and 5xx responses count against a backend; 4xx do not"""
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                          ConnectionError, TimeoutError)):
+        return True
+    # The ollama library talks to the daemon through httpx
+    httpx = sys.modules.get("httpx")
+    if httpx is not None and isinstance(error, httpx.TransportError):
+        return True
+    # requests.HTTPError carries the response, ollama.ResponseError the status
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is None:
+        status = getattr(error, "status_code", None)
+    return isinstance(status, int) and status >= 500
+
+
+class CircuitBreaker:
+    def __init__(self, name, open_seconds=BREAKER_OPEN_SECONDS):
+        self.name = name
+        self.open_seconds = open_seconds
+        self._outcomes = deque(maxlen=BREAKER_WINDOW)
+        self._consecutive = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def _current_state(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = HALF_OPEN
+        return self._state
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def available(self):
+        """Whether a request would be let through now"""
+        with self._lock:
+            state = self._current_state()
+            return state == CLOSED or (state == HALF_OPEN and not self._trial)
+
+    def check(self):
+        """Fail fast before queueing for a backend that is down"""
+        if not self.available():
+            raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+
+    def acquire(self):
+        # Probing starts with the first request, however the app was launched
+        monitor.start()
+        with self._lock:
+            state = self._current_state()
+            if state == OPEN or (state == HALF_OPEN and self._trial):
+                raise CircuitOpenError(f"{self.name} is unavailable (circuit open)")
+            if state == HALF_OPEN:
+                self._trial = True
+
+    def record_success(self):
+        with self._lock:
+            self._outcomes.append(True)
+            self._consecutive = 0
+            if self._current_state() == HALF_OPEN:
+                self._close()
+
+    def record_failure(self):
+        with self._lock:
+            self._outcomes.append(False)
+            self._consecutive += 1
+            failures = self._outcomes.count(False)
+            if (self._current_state() == HALF_OPEN
+                    or self._consecutive >= BREAKER_CONSECUTIVE
+                    or (len(self._outcomes) >= BREAKER_MIN_REQUESTS
+                        and failures / len(self._outcomes) >= BREAKER_FAILURE_RATE)):
+                self._open()
+
+    def trip(self):
+        """Open the breaker now, e.g. after a failed health probe"""
+        with self._lock:
+            self._open()
+
+    def probe_succeeded(self):
+        """A health probe reached the backend: let the next request through"""
+        with self._lock:
+            if self._current_state() == OPEN:
+                self._state = HALF_OPEN
+                self._trial = False
+
+    def _open(self):
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._trial = False
+
+    def _close(self):
+        self._state = CLOSED
+        self._outcomes.clear()
+        self._consecutive = 0
+        self._trial = False
+
+    def release(self):
+        """End a request without recording an outcome"""
+        with self._lock:
+            self._trial = False
+
+    @contextmanager
+    def guard(self):
+        """Run one backend request, recording its outcome"""
+        self.acquire()
+        try:
+            yield
+        except Exception as e:
+            if cancellation.cancelled():
+                # Cancelled by the caller (a losing hedge): says nothing about the backend
+                self.release()
+            elif is_backend_failure(e):
+                self.record_failure()
+            else:
+                # The backend answered, e.g. 4xx for a bad request or a missing model
+                self.record_success()
+            raise
+        except BaseException:
+            # Closed by the caller (e.g. a stream stopped early): the backend answered
+            self.record_success()
+            raise
+        else:
+            self.record_success()
+
+    def status(self):
+        with self._lock:
+            outcomes = list(self._outcomes)
+            return {
+                "state": self._current_state(),
+                "failure_rate": outcomes.count(False) / len(outcomes) if outcomes else 0.0,
+                "requests": len(outcomes),
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """Shared breaker for a backend ("ollama", "together")"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def probe_ollama():
+    """True when the Ollama daemon answers /api/tags"""
+    response = requests.get(f"{OLLAMA_HOST}/api/tags", timeout=HEALTH_PROBE_TIMEOUT)
+    return response.ok
+
+
+def probe_together():
+    """True when Together lists models; None (not probed) without an API key"""
+    api_key = os.getenv("TOGETHER_API_KEY")
+    if not api_key:
+        return None
+    url = f"{os.getenv('DLAI_TOGETHER_API_BASE', 'https://api.together.xyz')}/v1/models"
+    response = requests.get(url, headers={"Authorization": f"Bearer {api_key}"},
+                            timeout=HEALTH_PROBE_TIMEOUT)
+    return response.ok
+
+
+class HealthMonitor:
+    """
+    Probe each backend every interval seconds in a daemon thread. A failed
+    probe opens the backend's breaker; a successful one lets a trial request
+    through an open breaker.
+    """
+
+    def __init__(self, probes, interval=HEALTH_PROBE_INTERVAL):
+        self.probes = probes
+        self.interval = interval
+        self.results = {}  # backend -> (healthy, checked_at)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None and self.interval > 0:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self.probe_all()
+            time.sleep(self.interval)
+
+    def probe_all(self):
+        for name, probe in self.probes.items():
+            try:
+                healthy = probe()
+            except Exception:
+                healthy = False
+            if healthy is None:
+                continue
+            self.results[name] = (healthy, time.time())
+            if healthy:
+                get_breaker(name).probe_succeeded()
+            else:
+                get_breaker(name).trip()
+
+    def status(self):
+        """Breaker state and last probe result per backend"""
+        status = {}
+        for name in self.probes:
+            healthy, checked_at = self.results.get(name, (None, None))
+            status[name] = {**get_breaker(name).status(), "healthy": healthy,
+                            "checked_at": checked_at}
+        return status
+
+
+monitor = HealthMonitor({"ollama": probe_ollama, "together": probe_together})
@@ -1,13 +1,28 @@
 import gradio as gr
 import warnings
 import base64
-from local_utils import load_env, llama32, disp_image, merge_images, resize_image
-from PIL import Image
-import io
-import requests
+from local_utils import load_env, llama32_generate
+from providers import default_router
+from health import monitor
+from metrics import start_metrics_server, timed_task
+from dashboard import PERFORMANCE_TAB, performance_tab
+from tracing import span, traced
+from profiling import profiled
+from table_utils import (collect_table_text, process_table_response, render_partial_table,
+                         stream_table_text)
+from chart_layout import charts_to_tables, detect_chart_regions
+from vision_sessions import SessionStore
+from speculation import FollowupSpeculator
 warnings.filterwarnings('ignore')
 load_env()
 
+# Ollama first, Together when configured, picked per request by recent latency.
+# Design sessions stay on the ollama library: they continue from its context.
+llm = default_router("ollama,ollama_http,together")
+
+# Interior design conversations, keyed by the session ID kept in gr.State
+design_sessions = SessionStore()
+
 def encode_image_for_llama(image_path):
     """Convert image to base64 string"""
     with open(image_path, "rb") as image_file:
@@ -26,22 +41,62 @@ def process_image_query(image_path, prompt):
     #encoded_img = encode_image_for_llama(image_path)
     message = create_vision_message(image_path, prompt)
     
-    response = llama32(message)
+    response = llm.complete(message)
     
     return response
     
-def interior_design(image_path, initial_question, followup_question):
+def speculate_answer(session, question, base_turns):
+    """
+    Answer a likely follow-up in the background from the context the session
+    had after its first base_turns turns, without touching the session
+    """
+    if len(session.turns) != base_turns:
+        return None
+    return llama32_generate(question, context=session.context)
+
+# Likely follow-ups are answered ahead of time and dropped with their session
+speculator = FollowupSpeculator(speculate_answer)
+design_sessions.on_evict(speculator.cancel)
+
+def ask_session(session, question):
+    """
+    Ask the next question in a design session. The image is only sent with
+    the first question; follow-ups continue from Ollama's returned context,
+    so they cost only the new question's tokens.
+    """
+    with session.lock, span("ask_session", turn=len(session.turns)) as ask_span:
+        hit = speculator.take(session, question)
+        ask_span.set_attribute("speculative_hit", bool(hit))
+        if hit:
+            answer, context, base_turns = hit
+            # The speculative context only extends the history it started from
+            if base_turns != len(session.turns):
+                context = None
+        else:
+            images = None if session.context else [session.image_path]
+            answer, context = llama32_generate(question, images=images,
+                                               context=session.context)
+        session.add_turn(question, answer, context)
+    return answer
+
+@traced("interior_design")
+@profiled("interior_design")
+@timed_task("interior_design")
+def interior_design(image_path, initial_question, followup_question, previous_session_id=None):
     """
     Analyze interior design image with custom questions
     Args:
         image_path (str): Path to the image file
         initial_question (str): Initial analysis question
         followup_question (str): Optional follow-up question
+        previous_session_id (str): The tab's last session, closed here
     Returns:
-        str: Analysis result
+        tuple: (analysis result, session ID for later follow-ups)
     """
+    # A new analysis replaces the old one; closing it cancels its speculation
+    design_sessions.close(previous_session_id)
     if image_path is None:
-        return "Please upload an image."
+        return "Please upload an image.", None
     
     if not initial_question.strip():
         initial_question = ("Describe the design, style, color, material and other "
@@ -49,21 +104,40 @@ def interior_design(image_path, initial_question, followup_question):
                           "the objects in the photo.")
     
     # First analysis
-    result = process_image_query(image_path, initial_question)
+    session = design_sessions.create(image_path)
+    ask_session(session, initial_question)
     
     # Follow-up analysis if provided
     if followup_question.strip():
-        prompt = followup_question + result
-        messages = [{
-            "role": "user",
-            "content": prompt,
-            "images": [image_path]
-        }]
-        final_result = llama32(messages)
-        return f"{result}\n\nFollow-up Analysis:\n{final_result}"
-    
-    return result
+        ask_session(session, followup_question)
+    
+    speculator.start(session)
+    return session.transcript(), session.id
 
+@traced("interior_followup")
+@profiled("interior_followup")
+@timed_task("interior_followup")
+def interior_followup(session_id, followup_question):
+    """
+    Ask another follow-up question in an existing design session
+    Args:
+        session_id (str): Session ID from gr.State
+        followup_question (str): Follow-up question
+    Returns:
+        tuple: (full analysis transcript, session ID)
+    """
+    session = design_sessions.get(session_id)
+    if session is None:
+        return "Session expired. Please analyze the image again.", None
+    if not followup_question.strip():
+        return session.transcript(), session.id
+    
+    ask_session(session, followup_question)
+    return session.transcript(), session.id
+
+@traced("read_receipts")
+@profiled("read_receipts")
+@timed_task("read_receipts")
 def read_receipts(files, question, summary_question):
     """
     Analyze multiple receipt images with custom questions
@@ -88,48 +162,71 @@ def read_receipts(files, question, summary_question):
     results = []
     total_response = ""
     
-    # Process each receipt
-    for file in files:
+    # Process each receipt. Failures are raised as gr.Error, which Gradio
+    # shows to the user and timed_task counts as a failed run
+    for i, file in enumerate(files):
+        temp_path = file.name
         try:
-            temp_path = file.name
-            result = process_image_query(temp_path, question)
-            if isinstance(result, str) and result.startswith("Error"):
-                return result
-            results.append(result)
-            total_response += f"{result}\n"
+            with span("receipt", index=i):
+                result = process_image_query(temp_path, question)
         except Exception as e:
-            return f"Error processing receipt: {str(e)}"
+            raise gr.Error(f"Error processing receipt: {str(e)}") from e
+        if isinstance(result, str) and result.startswith("Error"):
+            raise gr.Error(result)
+        results.append(result)
+        total_response += f"{result}\n"
     
     # Calculate total using custom summary question
+    messages = [
+        {"role": "user", 
+         "content": f"{summary_question}\n{total_response}"}
+    ]
     try:
-        messages = [
-            {"role": "user", 
-             "content": f"{summary_question}\n{total_response}"}
-        ]
-        total = llama32(messages)
-        return f"Individual Receipts:\n{total_response}\nSummary Analysis:\n{total}"
+        with span("summarize", receipts=len(results)):
+            total = llm.complete(messages)
     except Exception as e:
-        return f"Error generating summary: {str(e)}"
+        raise gr.Error(f"Error generating summary: {str(e)}") from e
+    return f"Individual Receipts:\n{total_response}\nSummary Analysis:\n{total}"
 
+@traced("graph_to_table")
+@profiled("graph_to_table")
+@timed_task("graph_to_table")
 def graph_to_table(image_path, question):
     """
-    Convert graph to HTML table with custom question
+    Convert graph to HTML table with custom question. Rows render as they
+    arrive and the Ollama stream is cancelled once </table> is seen.
     
     Args:
         image_path (str): Path to the graph image
         question (str): Question about the graph
     
-    Returns:
-        str: HTML table representation
+    Yields:
+        tuple: (sanitized HTML table, list of exported CSV/JSON/Parquet paths)
     """
     if image_path is None:
-        return "Please upload a graph image."
+        yield "Please upload a graph image.", None
+        return
     
     if not question.strip():
         question = "Convert the chart to an HTML table."
     
-    result = process_image_query(image_path, question)
-    return result
+    with span("detect_charts") as detect_span:
+        boxes = detect_chart_regions(image_path)
+        detect_span.set_attribute("charts", len(boxes))
+    if len(boxes) > 1:
+        yield from charts_to_tables(
+            image_path, boxes,
+            lambda crop: collect_table_text(llm.stream(create_vision_message(crop, question))))
+        return
+    
+    message = create_vision_message(image_path, question)
+    result = ""
+    with span("convert_chart", chart=1):
+        for result in stream_table_text(llm.stream(message)):
+            yield render_partial_table(result), None
+    with span("parse_export", chart=1):
+        table_html, table, export_paths = process_table_response(result)
+    yield table_html, export_paths
 
 # Create Gradio interface
 with gr.Blocks(title="Multimodal App powered by Local Llama") as demo:
@@ -145,12 +242,19 @@ with gr.Blocks(title="Multimodal App powered by Local Llama") as demo:
                 followup_q = gr.Textbox(
                     label="Follow-up Question (Optional)",
                     placeholder="Ask a follow-up question based on the initial analysis")
-                design_button = gr.Button("Analyze Interior")
+                with gr.Row():
+                    design_button = gr.Button("Analyze Interior")
+                    followup_button = gr.Button("Ask Follow-up")
             design_output = gr.Textbox(label="Analysis Result", lines=10)
+        design_session = gr.State(None)
         design_button.click(
             fn=interior_design, 
-            inputs=[image_input, initial_q, followup_q], 
-            outputs=design_output)
+            inputs=[image_input, initial_q, followup_q, design_session], 
+            outputs=[design_output, design_session])
+        followup_button.click(
+            fn=interior_followup,
+            inputs=[design_session, followup_q],
+            outputs=[design_output, design_session])
 
     with gr.Tab("Read Receipts"):
         with gr.Row():
@@ -177,11 +281,21 @@ with gr.Blocks(title="Multimodal App powered by Local Llama") as demo:
                     label="Question",
                     placeholder="Convert the chart to an HTML table")
                 graph_button = gr.Button("Convert to Table")
-            table_output = gr.HTML(label="Table Output")
+            with gr.Column():
+                table_output = gr.HTML(label="Table Output")
+                table_files = gr.File(label="Export (CSV / JSON / Parquet)",
+                                      file_count="multiple")
         graph_button.click(
             fn=graph_to_table, 
             inputs=[graph_input, graph_q], 
-            outputs=table_output)
+            outputs=[table_output, table_files])
+
+    if PERFORMANCE_TAB:
+        performance_tab(llm, speculator)
 
 if __name__ == "__main__":
+    # Background health probes open a backend's circuit breaker while it is down
+    monitor.start()
+    # Prometheus /metrics for every model call, on METRICS_PORT
+    start_metrics_server()
     demo.launch()
@@ -3,9 +3,42 @@
 import requests
 import json
 from dotenv import load_dotenv, find_dotenv
+import importlib
 import os
-import ollama
-from wolframalpha import Client
+from ollama_scheduler import scheduler
+from health import get_breaker
+from metrics import model_call
+from cassette import recorded
+from cancellation import current_scope, httpx_event_hooks
+
+# The ollama client (httpx, pydantic) is imported by the calls that use it,
+# which keeps importing this module cheap for code that never calls Ollama
+VISION_MODEL = "llama3.2-vision"
+# Fails fast while the Ollama daemon is down, before queueing for a slot
+ollama_breaker = get_breaker("ollama")
+# (connect, read) seconds for Ollama calls; a hung daemon counts as a failure
+OLLAMA_TIMEOUT = (5, float(os.getenv("OLLAMA_TIMEOUT", "300")))
+# (connect, read) seconds for the Together fallback in llama31
+TOGETHER_TIMEOUT = (float(os.getenv("TOGETHER_CONNECT_TIMEOUT", "5")),
+                    float(os.getenv("TOGETHER_TIMEOUT", "120")))
+
+_client = None
+
+def _ollama_client():
+    """
+    The shared ollama client, or inside a cancel scope (a hedged race) a
+    client of its own whose connection is shut down when the race is lost
+    """
+    global _client
+    import httpx
+    import ollama
+    connect, read = OLLAMA_TIMEOUT
+    timeout = httpx.Timeout(read, connect=connect)
+    if current_scope() is not None:
+        return ollama.Client(timeout=timeout, event_hooks=httpx_event_hooks())
+    if _client is None:
+        _client = ollama.Client(timeout=timeout)
+    return _client
 
 def load_env():
     _ = load_dotenv(find_dotenv())
@@ -13,19 +46,74 @@ def load_env():
   # The right API to pass in a prompt (of type string) is the completions API https://docs.together.ai/reference/completions-1
   # The right API to pass in a messages (of type of list of message) is The chat completions API https://docs.together.ai/reference/chat-completions-1
 
-def llama32(message, model_size=11):
+@recorded("ollama.llama32")
+def llama32(message, model_size=11, stop=None):
     
-    api_url = "http://localhost:11434/api/chat"
     # Convert Together AI format to Ollama format
     # model = f"meta-llama/Llama-3.2-{model_size}B-Vision-Instruct-Turbo"
     # url = f"{os.getenv('DLAI_TOGETHER_API_BASE', 'https://api.together.xyz')}/v1/chat/completions
-    response = ollama.chat(
-        model = "llama3.2-vision",
-        messages = message,
-    )
+    ollama_breaker.check()
+    client = _ollama_client()
+    with scheduler.slot(VISION_MODEL), ollama_breaker.guard(), \
+         model_call("ollama", VISION_MODEL, {"messages": message}) as call:
+        response = client.chat(
+            model = VISION_MODEL,
+            messages = message,
+            options = {"stop": stop} if stop else None,
+        )
+        call.ollama_stats(response)
     
     return response['message']['content']
 
+@recorded("ollama.llama32_generate")
+def llama32_generate(prompt, images=None, context=None):
+    """
+    Single-prompt llama3.2-vision call that also returns Ollama's `context`.
+    Passing that context back on the next call continues the conversation
+    without re-sending or re-processing the image.
+    """
+    ollama_breaker.check()
+    client = _ollama_client()
+    payload = {"prompt": prompt, "images": images, "context": context}
+    with scheduler.slot(VISION_MODEL), ollama_breaker.guard(), \
+         model_call("ollama", VISION_MODEL, payload) as call:
+        response = client.generate(
+            model = VISION_MODEL,
+            prompt = prompt,
+            images = images,
+            context = context,
+        )
+        call.ollama_stats(response)
+    return response['response'], response['context']
+
+@recorded("ollama.llama32_stream")
+def llama32_stream(message, model_size=11, stop=None):
+    """
+    Stream llama3.2-vision content chunks. Closing the generator early closes
+    the HTTP stream, which makes Ollama stop generating.
+    """
+    ollama_breaker.check()
+    client = _ollama_client()
+    with scheduler.slot(VISION_MODEL) as ticket, ollama_breaker.guard(), \
+         model_call("ollama", VISION_MODEL, {"messages": message}) as call:
+        stream = client.chat(
+            model = VISION_MODEL,
+            messages = message,
+            stream = True,
+            options = {"stop": stop} if stop else None,
+        )
+        try:
+            for chunk in stream:
+                ticket.touch()
+                content = chunk['message']['content']
+                if content:
+                    call.token()
+                    yield content
+                if chunk.get('done'):
+                    call.ollama_stats(chunk)
+        finally:
+            stream.close()
+
 def get_wolfram_alpha_api_key():
     load_env()
     wolfram_alpha_api_key = os.getenv("WOLFRAM_ALPHA_KEY")
@@ -37,6 +125,7 @@ def get_tavily_api_key():
     return tavily_api_key
 
 
+@recorded("ollama.llama31")
 def llama31(prompt_or_messages, model_size=8, temperature=0, raw=False, debug=False):
     model = f"meta-llama/Meta-Llama-3.1-{model_size}B-Instruct-Turbo"
     if isinstance(prompt_or_messages, str):
@@ -65,17 +154,21 @@ def llama31(prompt_or_messages, model_size=8, temperature=0, raw=False, debug=Fa
         "Authorization": f"Bearer {os.getenv('TOGETHER_API_KEY')}"
     }
 
-    try:
-        response = requests.post(
-            url, headers=headers, data=json.dumps(payload)
-        )
-        response.raise_for_status()  # Raises HTTPError for bad responses
-        res = response.json()
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Request failed: {e}")
-
-    if 'error' in res:
-        raise Exception(f"API Error: {res['error']}")
+    body = json.dumps(payload)
+    with model_call("together", model, payload, body) as call:
+        try:
+            response = requests.post(
+                url, headers=headers, data=body, timeout=TOGETHER_TIMEOUT
+            )
+            call.first_byte(response.elapsed.total_seconds())
+            response.raise_for_status()  # Raises HTTPError for bad responses
+            res = response.json()
+        except requests.exceptions.RequestException as e:
+            raise Exception(f"Request failed: {e}")
+
+        if 'error' in res:
+            raise Exception(f"API Error: {res['error']}")
+        call.usage(res.get('usage'))
 
     if raw:
         return res
@@ -85,103 +178,24 @@ def llama31(prompt_or_messages, model_size=8, temperature=0, raw=False, debug=Fa
     else:
         return res['choices'][0].get('message', {}).get('content', '')
 
-import os
-import requests
-from PIL import Image
-from io import BytesIO
-import matplotlib.pyplot as plt
-
-def disp_image(address):
-    if address.startswith("http://") or address.startswith("https://"):
-        response = requests.get(address)
-        img = Image.open(BytesIO(response.content))
-    else:
-        img = Image.open(address)
-    
-    plt.imshow(img)
-    plt.axis('off')
-    plt.show()
-
-def resize_image(img, max_dimension = 1120):
-  original_width, original_height = img.size
-
-  if original_width > original_height:
-      scaling_factor = max_dimension / original_width
-  else:
-      scaling_factor = max_dimension / original_height
-
-  new_width = int(original_width * scaling_factor)
-  new_height = int(original_height * scaling_factor)
-
-  # Resize the image while maintaining aspect ratio
-  resized_img = img.resize((new_width, new_height))
-
-  resized_img.save("images/resized_image.jpg")
-
-  print("Original size:", original_width, "x", original_height)
-  print("New size:", new_width, "x", new_height)
-
-  return resized_img
-
-
-from PIL import Image
-
-def merge_images(image_1, image_2, image_3):
-    img1 = Image.open(image_1)
-    img2 = Image.open(image_2)
-    img3 = Image.open(image_3)
-    
-    width1, height1 = img1.size
-    width2, height2 = img2.size
-    width3, height3 = img3.size
-    
-    print("Image 1 dimensions:", width1, height1)
-    print("Image 2 dimensions:", width2, height2)
-    print("Image 3 dimensions:", width3, height3)
-    
-    total_width = width1 + width2 + width3
-    max_height = max(height1, height2, height3)
-    
-    merged_image = Image.new("RGB", (total_width, max_height))
-    
-    merged_image.paste(img1, (0, 0))
-    merged_image.paste(img2, (width1, 0))
-    merged_image.paste(img3, (width1 + width2, 0))
-    
-    merged_image.save("images/merged_image_horizontal.jpg")
-    
-    print("Merged image dimensions:", merged_image.size)
-    return merged_image
-
-
-
-# pretty print JSON with syntax highlighting
-from pygments import highlight, lexers, formatters
-def cprint(response):
-    formatted_json = json.dumps(response, indent=4)
-    colorful_json = highlight(formatted_json,
-                              lexers.JsonLexer(),
-                              formatters.TerminalFormatter())
-    print(colorful_json)
-
-import nest_asyncio
-nest_asyncio.apply()
-
-def wolfram_alpha(query: str) -> str:
-    WOLFRAM_ALPHA_KEY = get_wolfram_alpha_api_key()
-    client = Client(WOLFRAM_ALPHA_KEY)
-    result = client.query(query)
-
-    results = []
-    for pod in result.pods:
-        if pod["@title"] == "Result" or pod["@title"] == "Results":
-          for sub in pod.subpods:
-            results.append(sub.plaintext)
-
-    return '\n'.join(results)
-
-
-
-def get_boiling_point(liquid_name, celsius):
-  # function body
-  return []
\ No newline at end of file
+# Display and tool helpers pull in matplotlib, pygments, wolframalpha and
+# nest_asyncio, which serving code never needs; they load on first use (PEP 562)
+_LAZY_HELPERS = {
+    "disp_image": "display_utils",
+    "resize_image": "display_utils",
+    "merge_images": "display_utils",
+    "cprint": "display_utils",
+    "wolfram_alpha": "tool_utils",
+    "get_boiling_point": "tool_utils",
+}
+
+def __getattr__(name):
+    module = _LAZY_HELPERS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_HELPERS))
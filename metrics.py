@@ -0,0 +1,390 @@
+# Per-call latency and token metrics for every model call, exposed in the
+# Prometheus text format on a small /metrics endpoint beside the Gradio app,
+# plus ring buffers of recent model calls and handler runs for the dashboard.
+
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import tracing
+
+# The apps filter out warnings, so problems are logged (stderr by default)
+logger = logging.getLogger(__name__)
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
+# Local only by default; set METRICS_HOST=0.0.0.0 for a scraper on another host
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# Recent events kept per key (task or backend) for the in-app dashboard
+RECENT_EVENTS = int(os.getenv("METRICS_RECENT_EVENTS", "2048"))
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 5e5, 1e6, 2e6, 5e6, 1e7, 2e7)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [c + (value <= bound) for c, bound in zip(counts, self.buckets)]
+            self._values[key] = (counts, total + value, count + 1)
+
+    def _render_value(self, key, value):
+        counts, total, count = value
+        lines = []
+        for bound, bucket_count in zip(self.buckets, counts):
+            labels = _format_labels(self.labels, key, [("le", f"{bound:g}")])
+            lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+        labels = _format_labels(self.labels, key, [("le", "+Inf")])
+        lines.append(f"{self.name}_bucket{labels} {count}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+        lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def _nearest_rank(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100 * len(sorted_values)))]
+
+
+class RecentEvents:
+    """
+    The last RECENT_EVENTS (time, seconds, ok) events of each key, in a ring
+    buffer per key so a busy key cannot push a quiet one out
+
+    Recording is O(1); summaries over a time window are computed on read, so
+    only the dashboard pays for them.
+    """
+
+    def __init__(self, size=RECENT_EVENTS):
+        self.size = size
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds, ok=True):
+        with self._lock:
+            events = self._events.get(key)
+            if events is None:
+                events = self._events[key] = deque(maxlen=self.size)
+            events.append((time.time(), seconds, ok))
+
+    def summary(self, window=300):
+        """
+        Per key: count, rate per second, error rate and latency p50/p95/p99
+        over window seconds, or over the part of it a full ring still covers
+        """
+        now = time.time()
+        since = now - window
+        with self._lock:
+            rings = {key: (list(events), len(events) == self.size)
+                     for key, events in self._events.items()}
+        summary = {}
+        for key, (events, full) in sorted(rings.items()):
+            values = [(seconds, ok) for at, seconds, ok in events if at >= since]
+            if not values:
+                continue
+            # A full ring has dropped events from inside the window
+            covered = now - events[0][0] if full and events[0][0] > since else window
+            latencies = sorted(seconds for seconds, _ in values)
+            errors = sum(1 for _, ok in values if not ok)
+            summary[key] = {"count": len(values), "rate": len(values) / (covered or window),
+                            "error_rate": errors / len(values),
+                            "p50": _nearest_rank(latencies, 50), "p95": _nearest_rank(latencies, 95),
+                            "p99": _nearest_rank(latencies, 99)}
+        return summary
+
+
+# Gradio handler runs by task, and model calls by backend
+recent_tasks = RecentEvents()
+recent_calls = RecentEvents()
+
+CALL_LABELS = ("backend", "model")
+requests_total = REGISTRY.counter(
+    "llm_requests_total", "Model calls by outcome", CALL_LABELS + ("status",))
+request_bytes = REGISTRY.histogram(
+    "llm_request_bytes", "Request payload size, images included", CALL_LABELS, BYTES_BUCKETS)
+request_images = REGISTRY.counter(
+    "llm_request_images_total", "Images sent to the model", CALL_LABELS)
+first_byte_seconds = REGISTRY.histogram(
+    "llm_time_to_first_byte_seconds", "Time until the response headers arrived", CALL_LABELS)
+first_token_seconds = REGISTRY.histogram(
+    "llm_time_to_first_token_seconds", "Time until the first streamed token", CALL_LABELS)
+duration_seconds = REGISTRY.histogram(
+    "llm_request_duration_seconds", "Total model call time", CALL_LABELS)
+queue_wait_seconds = REGISTRY.histogram(
+    "llm_queue_wait_seconds", "Time waiting for an Ollama scheduler slot", ("model",))
+load_seconds = REGISTRY.histogram(
+    "llm_model_load_seconds", "Ollama model load time", CALL_LABELS)
+prompt_eval_seconds = REGISTRY.histogram(
+    "llm_prompt_eval_seconds", "Ollama prompt processing time", CALL_LABELS)
+eval_seconds = REGISTRY.histogram(
+    "llm_eval_seconds", "Ollama generation time", CALL_LABELS)
+prompt_tokens = REGISTRY.counter(
+    "llm_prompt_tokens_total", "Prompt tokens processed", CALL_LABELS)
+completion_tokens = REGISTRY.counter(
+    "llm_completion_tokens_total", "Completion tokens generated", CALL_LABELS)
+
+
+def _text_size(value):
+    """Characters in the strings of a JSON-like value, without serializing it"""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(len(str(k)) + _text_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(_text_size(v) for v in value)
+    return 0
+
+
+def _payload_stats(payload, body=None):
+    """
+    (bytes, image count) of a request payload. body is the serialized request
+    when the caller has one; otherwise the size is estimated from the text in
+    the payload, image file paths counting their file size.
+    """
+    size = len(body) if body is not None else _text_size(payload)
+    images = 0
+    ollama_images = list(payload.get("images") or [])
+    for message in payload.get("messages") or []:
+        content = message.get("content")
+        if isinstance(content, list):
+            images += sum(1 for part in content if part.get("type") == "image_url")
+        ollama_images.extend(message.get("images") or [])
+    for image in ollama_images:
+        images += 1
+        if body is None and isinstance(image, str) and os.path.exists(image):
+            size += os.path.getsize(image)
+    return size, images
+
+
+class ModelCall:
+    """Timing and token counts of one model call; created by model_call()"""
+
+    def __init__(self, backend, model, span):
+        self.labels = {"backend": backend, "model": model}
+        self.span = span
+        self.start = time.monotonic()
+        self.ttft = None
+
+    def first_byte(self, seconds=None):
+        """Headers received; seconds defaults to the time since the call started"""
+        first_byte_seconds.observe(
+            time.monotonic() - self.start if seconds is None else seconds, **self.labels)
+
+    def token(self):
+        """Call for each streamed chunk; only the first one is recorded"""
+        if self.ttft is None:
+            self.ttft = time.monotonic() - self.start
+            first_token_seconds.observe(self.ttft, **self.labels)
+            self.span.set_attribute("ttft", self.ttft)
+
+    def usage(self, usage):
+        """Token counts from a Together `usage` object"""
+        if not usage:
+            return
+        prompt_tokens.inc(usage.get("prompt_tokens") or 0, **self.labels)
+        completion_tokens.inc(usage.get("completion_tokens") or 0, **self.labels)
+        self.span.set_attribute("prompt_tokens", usage.get("prompt_tokens") or 0)
+        self.span.set_attribute("completion_tokens", usage.get("completion_tokens") or 0)
+
+    def ollama_stats(self, response):
+        """Token counts and durations (ns) from the final Ollama response"""
+        def get(field):
+            return response.get(field) or 0
+
+        prompt_tokens.inc(get("prompt_eval_count"), **self.labels)
+        completion_tokens.inc(get("eval_count"), **self.labels)
+        self.span.set_attribute("prompt_tokens", get("prompt_eval_count"))
+        self.span.set_attribute("completion_tokens", get("eval_count"))
+        if get("load_duration"):
+            load_seconds.observe(get("load_duration") / 1e9, **self.labels)
+        if get("prompt_eval_duration"):
+            prompt_eval_seconds.observe(get("prompt_eval_duration") / 1e9, **self.labels)
+        if get("eval_duration"):
+            eval_seconds.observe(get("eval_duration") / 1e9, **self.labels)
+
+
+@contextmanager
+def model_call(backend, model, payload=None, body=None):
+    """
+    Record one model call (and its trace span): request size, outcome and
+    total time. Pass the serialized request as body when there is one, so
+    its size is not computed by serializing the payload again.
+    """
+    if not _server_started:
+        # However the app was launched (python app.py, gradio app.py, mounted
+        # in another server), /metrics is up once it makes model calls
+        start_metrics_server()
+    with tracing.span("llm.call", activate=False, backend=backend, model=model) as span:
+        call = ModelCall(backend, model, span)
+        if payload is not None:
+            size, images = _payload_stats(payload, body)
+            request_bytes.observe(size, **call.labels)
+            span.set_attribute("request_bytes", size)
+            span.set_attribute("images", images)
+            if images:
+                request_images.inc(images, **call.labels)
+        status = "error"
+        try:
+            yield call
+            status = "ok"
+        except GeneratorExit:
+            status = "cancelled"
+            raise
+        finally:
+            duration = time.monotonic() - call.start
+            duration_seconds.observe(duration, **call.labels)
+            requests_total.inc(status=status, **call.labels)
+            recent_calls.record(backend, duration, status != "error")
+
+
+def timed_task(task):
+    """Decorator: record each run of a Gradio handler (plain or generator) in recent_tasks"""
+    def decorator(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def stream_wrapper(*args, **kwargs):
+                start = time.monotonic()
+                ok = False
+                try:
+                    yield from fn(*args, **kwargs)
+                    ok = True
+                except GeneratorExit:
+                    # The client went away; not the handler's failure
+                    ok = True
+                    raise
+                finally:
+                    recent_tasks.record(task, time.monotonic() - start, ok)
+            return stream_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.monotonic()
+            ok = False
+            try:
+                result = fn(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                recent_tasks.record(task, time.monotonic() - start, ok)
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_started = False
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """
+    Serve /metrics on port in a daemon thread; 0 disables it. Called again
+    (or lazily by the first model_call) it does nothing.
+    """
+    global _server, _server_started
+    with _server_lock:
+        if _server_started or not port:
+            return _server
+        _server_started = True
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            logger.warning("Metrics endpoint not started on %s:%s: %s", host, port, e)
+            return None
+        threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server
@@ -0,0 +1,304 @@
+# Stand-in for the Together and Ollama APIs this project calls, with
+# configurable latency, token rate, concurrency and error-rate profiles, for
+# load and performance tests that must not burn credits or a GPU.
+#
+#   python mock_llm_server.py --port 8800 --profile together
+#   DLAI_TOGETHER_API_BASE=http://localhost:8800 OLLAMA_HOST=http://localhost:8800 python app.py
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Seconds are per request unless noted; tokens_per_sec of 0 means no delay
+PROFILES = {
+    "instant": {"latency": 0.0, "jitter": 0.0, "image_latency": 0.0,
+                "prompt_tokens_per_sec": 0, "tokens_per_sec": 0,
+                "completion_tokens": 64, "concurrency": 64, "error_rate": 0.0},
+    "together": {"latency": 0.35, "jitter": 0.3, "image_latency": 0.4,
+                 "prompt_tokens_per_sec": 5000, "tokens_per_sec": 80,
+                 "completion_tokens": 200, "concurrency": 32, "error_rate": 0.0},
+    "ollama": {"latency": 0.1, "jitter": 0.2, "image_latency": 1.5,
+               "prompt_tokens_per_sec": 800, "tokens_per_sec": 25,
+               "completion_tokens": 200, "concurrency": 1, "error_rate": 0.0},
+    "flaky": {"latency": 0.35, "jitter": 1.0, "image_latency": 0.4,
+              "prompt_tokens_per_sec": 5000, "tokens_per_sec": 80,
+              "completion_tokens": 200, "concurrency": 32, "error_rate": 0.1},
+}
+
+# Rough prompt tokens per image for llama3.2-vision
+IMAGE_TOKENS = 1601
+WORDS = ("the total charge is twelve dollars and the room has a warm modern style "
+         "with a stone fireplace wooden floor and large windows").split()
+
+
+def _prompt_text_and_images(messages):
+    texts, images = [], 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    texts.append(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    images += 1
+        elif content:
+            texts.append(str(content))
+        images += len(message.get("images") or [])
+    return "\n".join(texts), images
+
+
+def completion_text(prompt, length, stop=None):
+    """Deterministic reply for a prompt; an HTML table when one is asked for"""
+    seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+    rng = random.Random(seed)
+    if "table" in prompt.lower():
+        rows = "".join(f"<tr><td>{month}</td><td>{rng.randint(10, 99)}</td></tr>"
+                       for month in ("Jan", "Feb", "Mar", "Apr", "May", "Jun"))
+        text = f"<table><tr><th>Month</th><th>Value</th></tr>{rows}</table>\nThe table shows monthly values."
+    else:
+        text = " ".join(rng.choice(WORDS) for _ in range(max(1, length)))
+    for sequence in stop or []:
+        if sequence and sequence in text:
+            text = text[:text.index(sequence)]
+    return text
+
+
+def _tokens(text):
+    """Split text into streamable tokens that join back to the text"""
+    words = text.split(" ")
+    return [word + " " for word in words[:-1]] + [words[-1]]
+
+
+class MockBackend:
+    """Latency model shared by all request handlers of one server"""
+
+    def __init__(self, profile="instant", seed=None, **overrides):
+        self.settings = {**PROFILES[profile], **{k: v for k, v in overrides.items() if v is not None}}
+        self._slots = threading.BoundedSemaphore(max(1, int(self.settings["concurrency"])))
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def _jitter(self):
+        sigma = self.settings["jitter"]
+        with self._rng_lock:
+            return self._rng.lognormvariate(0, sigma) if sigma else 1.0
+
+    def fails(self):
+        with self._rng_lock:
+            failed = self._rng.random() < self.settings["error_rate"]
+            self.requests += 1
+            self.errors += failed
+        return failed
+
+    def prompt_delay(self, prompt_tokens, images):
+        """Seconds before the first token: base latency, image and prompt processing"""
+        s = self.settings
+        delay = (s["latency"] + s["image_latency"] * images) * self._jitter()
+        if s["prompt_tokens_per_sec"]:
+            delay += prompt_tokens / s["prompt_tokens_per_sec"]
+        return delay
+
+    def generate(self, messages, stop=None):
+        """
+        Yield (token, stats) pairs at the profile's pace while holding a
+        concurrency slot; stats is set on the last pair only
+        """
+        prompt, images = _prompt_text_and_images(messages)
+        prompt_tokens = len(prompt) // 4 + 1 + images * IMAGE_TOKENS
+        text = completion_text(prompt, int(self.settings["completion_tokens"]), stop)
+        tokens = _tokens(text)
+        rate = self.settings["tokens_per_sec"]
+        with self._slots:
+            start = time.monotonic()
+            time.sleep(self.prompt_delay(prompt_tokens, images))
+            first_token = time.monotonic()
+            for i, token in enumerate(tokens):
+                if rate:
+                    time.sleep(max(0.0, first_token + (i + 1) / rate - time.monotonic()))
+                stats = None
+                if i == len(tokens) - 1:
+                    end = time.monotonic()
+                    stats = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                             "prompt_seconds": first_token - start,
+                             "eval_seconds": end - first_token, "total_seconds": end - start}
+                yield token, stats
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    backend = None  # set on the handler subclass by make_server
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, body, status=200):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_stream(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+    def _write(self, text):
+        self.wfile.write(text.encode("utf-8"))
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.startswith("/api/tags"):
+            self._send_json({"models": [{"name": "llama3.2-vision:latest"},
+                                        {"name": "llama3.1:latest"}]})
+        elif self.path.startswith("/v1/models"):
+            self._send_json({"data": [{"id": "meta-llama/Llama-3.2-11B-Vision-Instruct-Turbo"}]})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        routes = {
+            "/v1/chat/completions": self._together_chat,
+            "/v1/completions": self._together_completions,
+            "/api/chat": self._ollama_chat,
+            "/api/generate": self._ollama_generate,
+        }
+        route = routes.get(self.path.split("?")[0])
+        if route is None:
+            self._send_json({"error": "not found"}, 404)
+            return
+        request = self._read_json()
+        if self.backend.fails():
+            self._send_json({"error": "mock backend error"}, 500)
+            return
+        try:
+            route(request)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream early
+            pass
+
+    # Together
+
+    def _together(self, request, messages, chat):
+        stop = request.get("stop")
+        tokens = self.backend.generate(messages, stop)
+        model = request.get("model", "mock")
+        if not request.get("stream"):
+            text, stats = "", None
+            for token, stats in tokens:
+                text += token
+            choice = {"index": 0, "finish_reason": "stop"}
+            choice.update({"message": {"role": "assistant", "content": text}} if chat else {"text": text})
+            self._send_json({"id": "mock", "object": "chat.completion" if chat else "text_completion",
+                             "model": model, "choices": [choice], "usage": self._usage(stats)})
+            return
+        self._start_stream("text/event-stream")
+        for token, stats in tokens:
+            choice = {"index": 0, "finish_reason": "stop" if stats else None}
+            choice.update({"delta": {"content": token}} if chat else {"text": token})
+            chunk = {"id": "mock", "object": "chat.completion.chunk", "model": model,
+                     "choices": [choice]}
+            if stats:
+                chunk["usage"] = self._usage(stats)
+            self._write(f"data: {json.dumps(chunk)}\n\n")
+        self._write("data: [DONE]\n\n")
+
+    @staticmethod
+    def _usage(stats):
+        return {"prompt_tokens": stats["prompt_tokens"],
+                "completion_tokens": stats["completion_tokens"],
+                "total_tokens": stats["prompt_tokens"] + stats["completion_tokens"]}
+
+    def _together_chat(self, request):
+        self._together(request, request.get("messages", []), chat=True)
+
+    def _together_completions(self, request):
+        self._together(request, [{"role": "user", "content": request.get("prompt", "")}], chat=False)
+
+    # Ollama
+
+    def _ollama_part(self, request, stats, **fields):
+        part = {"model": request.get("model", "mock"),
+                "created_at": datetime.now(timezone.utc).isoformat(), "done": bool(stats), **fields}
+        if stats:
+            part.update({
+                "done_reason": "stop",
+                "total_duration": int(stats["total_seconds"] * 1e9),
+                "load_duration": 0,
+                "prompt_eval_count": stats["prompt_tokens"],
+                "prompt_eval_duration": int(stats["prompt_seconds"] * 1e9),
+                "eval_count": stats["completion_tokens"],
+                "eval_duration": int(stats["eval_seconds"] * 1e9),
+            })
+        return part
+
+    def _ollama(self, request, messages, make_fields, final_fields=None):
+        stop = (request.get("options") or {}).get("stop")
+        tokens = self.backend.generate(messages, stop)
+        if request.get("stream", True) is False:
+            text, stats = "", None
+            for token, stats in tokens:
+                text += token
+            self._send_json(self._ollama_part(request, stats, **make_fields(text),
+                                              **(final_fields or {})))
+            return
+        self._start_stream("application/x-ndjson")
+        for token, stats in tokens:
+            self._write(json.dumps(self._ollama_part(request, None, **make_fields(token))) + "\n")
+        self._write(json.dumps(self._ollama_part(request, stats, **make_fields(""),
+                                                 **(final_fields or {}))) + "\n")
+
+    def _ollama_chat(self, request):
+        self._ollama(request, request.get("messages", []),
+                     lambda text: {"message": {"role": "assistant", "content": text}})
+
+    def _ollama_generate(self, request):
+        messages = [{"role": "user", "content": request.get("prompt", ""),
+                     "images": request.get("images") or []}]
+        context = list(request.get("context") or []) + [len(request.get("prompt", ""))]
+        self._ollama(request, messages, lambda text: {"response": text}, {"context": context})
+
+
+def make_server(host="127.0.0.1", port=8800, profile="instant", seed=None, **overrides):
+    """HTTP server answering like Together and Ollama; port 0 picks a free one"""
+    handler = type("Handler", (MockHandler,), {"backend": MockBackend(profile, seed, **overrides)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def start_mock_server(port=0, profile="instant", **overrides):
+    """Start a mock server in a daemon thread; returns (server, base_url)"""
+    server = make_server(port=port, profile=profile, **overrides)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Together / Ollama API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="together")
+    parser.add_argument("--seed", type=int, default=None)
+    for name in PROFILES["instant"]:
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name, type=float, default=None,
+                            help=f"override the profile's {name}")
+    args = vars(parser.parse_args())
+    server = make_server(**args)
+    print(f"Mock LLM server ({args['profile']}) on http://{args['host']}:{args['port']}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# Run the same prompt on several Ollama models at once, streaming each one
+# separately and recording TTFT, tokens/sec and total time per model.
+
+import queue
+import threading
+import time
+
+
+def _new_result():
+    return {"text": "", "status": "queued", "ttft": None, "tokens": 0,
+            "tokens_per_sec": None, "total": None, "error": None}
+
+
+def _run_model(model_name, stream_fn, scheduler, events, stop):
+    start = None
+    try:
+        with scheduler.slot(model_name) as ticket:
+            if stop.is_set():
+                return
+            start = time.monotonic()
+            events.put((model_name, "start", None))
+            parts = stream_fn(model_name)
+            try:
+                for part in parts:
+                    ticket.touch()
+                    if stop.is_set():
+                        break
+                    content = part.get("message", {}).get("content", "")
+                    if content:
+                        events.put((model_name, "chunk", (content, time.monotonic() - start)))
+                    if part.get("done"):
+                        events.put((model_name, "stats", part))
+            finally:
+                # Closing the stream drops the HTTP response and frees the slot
+                close = getattr(parts, "close", None)
+                if close:
+                    close()
+    except Exception as e:
+        events.put((model_name, "error", str(e)))
+    finally:
+        events.put((model_name, "done", time.monotonic() - start if start else 0.0))
+
+
+def compare_models_stream(model_names, stream_fn, scheduler, interval=0.1):
+    """
+    Stream the same request on several models concurrently
+
+    Args:
+        model_names (list): Ollama model names
+        stream_fn: stream_fn(model_name) -> iterator of Ollama /api/chat JSON parts
+        scheduler (ModelScheduler): shared scheduler; models only run side by
+            side while they fit its memory budget
+        interval (float): minimum seconds between yielded snapshots
+
+    Yields:
+        dict: model name -> result dict with text, status, ttft, tokens,
+        tokens_per_sec, total and error; the last snapshot is final
+
+    Closing the generator (for example when the client disconnects) stops
+    every model that is still queued or streaming.
+    """
+    results = {name: _new_result() for name in model_names}
+    events = queue.Queue()
+    stop = threading.Event()
+    for name in model_names:
+        threading.Thread(target=_run_model, daemon=True,
+                         args=(name, stream_fn, scheduler, events, stop)).start()
+
+    if not model_names:
+        yield results
+    try:
+        yield from _collect(results, events, len(model_names), interval)
+    finally:
+        stop.set()
+
+
+def _collect(results, events, running, interval):
+    last_yield = 0
+    while running:
+        name, kind, value = events.get()
+        result = results[name]
+        if kind == "start":
+            result["status"] = "running"
+        elif kind == "chunk":
+            content, elapsed = value
+            if result["ttft"] is None:
+                result["ttft"] = elapsed
+            result["text"] += content
+            result["tokens"] += 1
+        elif kind == "stats":
+            # Ollama reports the exact generated token count and generation time
+            if value.get("eval_count"):
+                result["tokens"] = value["eval_count"]
+            if value.get("eval_duration"):
+                result["tokens_per_sec"] = value["eval_count"] / (value["eval_duration"] / 1e9)
+        elif kind == "error":
+            result["error"] = value
+        elif kind == "done":
+            running -= 1
+            result["total"] = value
+            result["status"] = "error" if result["error"] else "done"
+            if result["tokens_per_sec"] is None and result["ttft"] is not None:
+                generating = value - result["ttft"]
+                if generating > 0:
+                    result["tokens_per_sec"] = result["tokens"] / generating
+        now = time.monotonic()
+        if kind != "chunk" or now - last_yield >= interval or not running:
+            last_yield = now
+            yield results
+
+
+def format_stats_table(results):
+    """Markdown table of the per-model timings"""
+    def seconds(value):
+        return f"{value:.1f}s" if value is not None else "-"
+
+    lines = ["| Model | Status | TTFT | Tokens | Tokens/sec | Total |",
+             "|---|---|---|---|---|---|"]
+    for name, r in results.items():
+        rate = f"{r['tokens_per_sec']:.1f}" if r["tokens_per_sec"] is not None else "-"
+        lines.append(f"| {name} | {r['status']} | {seconds(r['ttft'])} | {r['tokens']} "
+                     f"| {rate} | {seconds(r['total'])} |")
+    return "\n".join(lines)
@@ -0,0 +1,234 @@
+# Model-affinity scheduler in front of every Ollama call. Requests queue per
+# model; work for models that are already loaded goes first so Ollama does not
+# evict and reload multi-GB models between interleaved requests, and a
+# max-wait bound keeps requests for other models from starving.
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+import requests
+
+from cancellation import CancelledError, current_scope
+from metrics import queue_wait_seconds
+
+# Approximate resident size of each model in GB
+MODEL_MEMORY_GB = {
+    "llama3.1:latest": 6,
+    "deepseek-r1:32b": 21,
+    "qwq:latest": 21,
+    "llama3.2-vision": 8,
+}
+DEFAULT_MODEL_GB = 8
+
+
+class SlotTimeout(requests.exceptions.Timeout):
+    """No slot became free within the acquire timeout; handled like a request timeout"""
+
+
+class _Ticket:
+    def __init__(self, model):
+        self.model = model
+        self.enqueued = time.monotonic()
+        self.granted = False
+        self.released = False
+        self.last_used = None
+
+    def touch(self):
+        """Mark the slot as still in use; streams call this for every chunk"""
+        self.last_used = time.monotonic()
+
+
+class ModelScheduler:
+    """
+    Admit Ollama requests so that consecutive work for the same model is
+    batched together
+
+    Args:
+        capacity_gb (float): GPU/RAM budget for models loaded at the same time
+        max_wait (float): seconds after which a queued request for an unloaded
+            model stops new admissions until it can run
+        parallel (int): concurrent requests per model (OLLAMA_NUM_PARALLEL)
+        memory_gb (dict): model name -> resident size in GB
+        acquire_timeout (float): seconds a request may queue before SlotTimeout;
+            None waits forever
+        idle_timeout (float): a held slot not touched for this long is taken
+            back, so a stream abandoned without close() cannot block its model
+    """
+
+    def __init__(self, capacity_gb=24, max_wait=30, parallel=1, memory_gb=None,
+                 acquire_timeout=None, idle_timeout=None):
+        self.capacity_gb = capacity_gb
+        self.max_wait = max_wait
+        self.parallel = parallel
+        self.memory_gb = MODEL_MEMORY_GB if memory_gb is None else memory_gb
+        self.acquire_timeout = acquire_timeout
+        self.idle_timeout = idle_timeout
+        self._cond = threading.Condition()
+        self._waiting = deque()
+        self._held = set()  # granted tickets not yet released
+        self._running = {}  # model -> active requests
+        self._loaded = OrderedDict()  # models Ollama most likely has resident, LRU order
+        self.switches = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.reclaimed = 0
+        self.total_wait = 0.0
+
+    def size(self, model):
+        return self.memory_gb.get(model, DEFAULT_MODEL_GB)
+
+    @contextmanager
+    def slot(self, model, timeout=None):
+        """
+        Hold a slot for one Ollama request (or one whole stream) on model.
+        Yields the ticket; long streams call its touch() as chunks arrive.
+        """
+        ticket = self.acquire(model, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def acquire(self, model, timeout=None):
+        """
+        Queue for a slot on model and return its ticket. Raises SlotTimeout,
+        or CancelledError as soon as the caller's cancel scope is cancelled.
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        ticket = _Ticket(model)
+        deadline = ticket.enqueued + timeout if timeout is not None else None
+        scope = current_scope()
+        if scope is not None:
+            scope.on_cancel(self._wake)
+        with self._cond:
+            self._waiting.append(ticket)
+            self._dispatch()
+            while not ticket.granted:
+                if scope is not None and scope.cancelled:
+                    self._waiting.remove(ticket)
+                    self._dispatch()
+                    raise CancelledError("request cancelled while queued")
+                # Re-check periodically so overdue requests are noticed even
+                # when nothing is released
+                wait = min(1.0, self.max_wait)
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._waiting.remove(ticket)
+                        self.timeouts += 1
+                        self._dispatch()
+                        raise SlotTimeout(f"No Ollama slot for {model} within {timeout:g}s")
+                    wait = min(wait, remaining)
+                self._cond.wait(timeout=wait)
+                self._dispatch()
+            wait = time.monotonic() - ticket.enqueued
+            self.total_wait += wait
+        queue_wait_seconds.observe(wait, model=model)
+        return ticket
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def release(self, ticket):
+        """Free a ticket's slot; releasing it again (or after it was reclaimed) does nothing"""
+        with self._cond:
+            if ticket.released:
+                return
+            self._free(ticket)
+            self.completed += 1
+            self._dispatch()
+
+    def _free(self, ticket):
+        ticket.released = True
+        self._held.discard(ticket)
+        self._running[ticket.model] -= 1
+        if not self._running[ticket.model]:
+            del self._running[ticket.model]
+
+    def _reclaim_idle(self, now):
+        """Take back slots whose holder stopped touching them; called with the lock held"""
+        if self.idle_timeout is None:
+            return
+        for ticket in [t for t in self._held if now - t.last_used > self.idle_timeout]:
+            self._free(ticket)
+            self.reclaimed += 1
+
+    def _running_gb(self):
+        return sum(self.size(m) for m in self._running)
+
+    def _can_run(self, model):
+        if model in self._running:
+            return self._running[model] < self.parallel
+        # A model larger than the whole budget still runs, just on its own
+        return not self._running or self._running_gb() + self.size(model) <= self.capacity_gb
+
+    def _grant(self, ticket):
+        self._waiting.remove(ticket)
+        ticket.granted = True
+        ticket.touch()
+        self._held.add(ticket)
+        model = ticket.model
+        self._running[model] = self._running.get(model, 0) + 1
+        if model in self._loaded:
+            self._loaded.move_to_end(model)
+        else:
+            self.switches += 1
+            self._loaded[model] = True
+            while (sum(self.size(m) for m in self._loaded) > self.capacity_gb
+                   and len(self._loaded) > 1):
+                self._loaded.popitem(last=False)
+
+    def _dispatch(self):
+        """Grant every ticket that may run now; called with the lock held"""
+        now = time.monotonic()
+        self._reclaim_idle(now)
+        granted = False
+        while True:
+            starving = [t for t in self._waiting if now - t.enqueued > self.max_wait]
+            if starving:
+                # Oldest overdue request first; hold everything else back until it runs
+                candidates = starving[:1]
+            else:
+                # Loaded models first (no reload), then the rest in arrival order
+                candidates = ([t for t in self._waiting if t.model in self._loaded]
+                              + [t for t in self._waiting if t.model not in self._loaded])
+            ticket = next((t for t in candidates if self._can_run(t.model)), None)
+            if ticket is None:
+                break
+            self._grant(ticket)
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def stats(self):
+        """Queue depth per model, running requests, model switches and mean wait"""
+        with self._cond:
+            depth = {}
+            for ticket in self._waiting:
+                depth[ticket.model] = depth.get(ticket.model, 0) + 1
+            return {
+                "queue_depth": depth,
+                "running": dict(self._running),
+                "loaded": list(self._loaded),
+                "model_switches": self.switches,
+                "completed": self.completed,
+                "timeouts": self.timeouts,
+                "reclaimed": self.reclaimed,
+                "mean_wait": self.total_wait / max(1, self.completed + self.reclaimed
+                                                     + sum(self._running.values())),
+            }
+
+
+# Shared by every Ollama caller in this process
+scheduler = ModelScheduler(
+    capacity_gb=float(os.getenv("OLLAMA_MEMORY_GB", "24")),
+    max_wait=float(os.getenv("OLLAMA_MAX_WAIT", "30")),
+    parallel=int(os.getenv("OLLAMA_NUM_PARALLEL", "1")),
+    acquire_timeout=float(os.getenv("OLLAMA_ACQUIRE_TIMEOUT", "120")),
+    # Longer than any single request, so only abandoned streams are reclaimed
+    idle_timeout=float(os.getenv("OLLAMA_SLOT_IDLE", "600")),
+)
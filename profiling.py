@@ -0,0 +1,241 @@
+# On-demand profiling of single Gradio handler calls: a stack sampler (or
+# cProfile) plus tracemalloc, written per request to PROFILE_DIR. Requests are
+# picked at PROFILE_RATE or by sending the PROFILE_HEADER header; at most
+# PROFILE_CONCURRENCY are profiled at a time, so it can stay on in production.
+#
+#   PROFILE_HEADER=X-Profile python app.py    # then send "X-Profile: 1"
+#   flamegraph.pl profiles/*.folded > flame.svg
+
+import cProfile
+import functools
+import inspect
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+import tracing
+
+PROFILE_RATE = float(os.getenv("PROFILE_RATE", "0"))  # fraction of calls profiled
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "")  # e.g. "X-Profile"; empty ignores headers
+PROFILER = os.getenv("PROFILER", "stack")  # "stack" (folded stacks) or "cprofile" (.prof)
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))  # stack sampling period
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_TRACEMALLOC = os.getenv("PROFILE_TRACEMALLOC", "1") == "1"
+PROFILE_CONCURRENCY = int(os.getenv("PROFILE_CONCURRENCY", "1"))
+# Allocation sites listed in the memory report
+TRACEMALLOC_TOP = 25
+
+_slots = threading.BoundedSemaphore(max(1, PROFILE_CONCURRENCY))
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+def _header_requested():
+    if not PROFILE_HEADER:
+        return False
+    try:
+        from gradio.context import LocalContext
+    except ImportError:
+        return False
+    request = LocalContext.request.get()
+    headers = getattr(request, "headers", None) or {}
+    return headers.get(PROFILE_HEADER.lower(), "").lower() in ("1", "true", "yes")
+
+
+def should_profile():
+    return _header_requested() or (PROFILE_RATE > 0 and random.random() < PROFILE_RATE)
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Count the stacks of one thread every interval seconds, in folded form"""
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.counts = Counter()
+        self.thread_id = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            thread_id = self.thread_id
+            frame = sys._current_frames().get(thread_id) if thread_id is not None else None
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def folded(self):
+        """Brendan Gregg's collapsed-stack format, as read by flamegraph.pl and speedscope"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.counts.most_common())
+
+
+def _start_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc():
+    """Peak bytes, and the sites of allocations made since the start that are still held"""
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)])
+        top = snapshot.statistics("lineno")[:TRACEMALLOC_TOP]
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+    return peak, top
+
+
+class RequestProfile:
+    """
+    Profile of one handler call
+
+    The handler only runs between resume() and pause(); a generator handler
+    can resume on a different worker thread at each step.
+    """
+
+    def __init__(self, name, profiler=PROFILER):
+        self.name = name
+        self.profiler = profiler
+        self.steps = 0
+        self._sampler = StackSampler() if profiler == "stack" else None
+        self._cprofile = cProfile.Profile() if profiler == "cprofile" else None
+        self._start = time.perf_counter()
+        if self._sampler:
+            self._sampler.start()
+        if PROFILE_TRACEMALLOC:
+            _start_tracemalloc()
+
+    def resume(self):
+        self.steps += 1
+        if self._sampler:
+            self._sampler.thread_id = threading.get_ident()
+        if self._cprofile:
+            self._cprofile.enable()
+
+    def pause(self):
+        if self._sampler:
+            self._sampler.thread_id = None
+        if self._cprofile:
+            self._cprofile.disable()
+
+    def finish(self, error=None):
+        """Write the profile files; returns the path of the main one"""
+        duration = time.perf_counter() - self._start
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{self.name}-"
+                                         f"{random.getrandbits(32):08x}")
+        if self._sampler:
+            self._sampler.stop()
+            path = base + ".folded"
+            with open(path, "w", encoding="utf-8") as profile_file:
+                profile_file.write(self._sampler.folded())
+        else:
+            path = base + ".prof"
+            self._cprofile.dump_stats(path)
+
+        lines = [f"handler: {self.name}", f"duration: {duration:.3f}s", f"steps: {self.steps}",
+                 f"error: {error}" if error else "error: none"]
+        if PROFILE_TRACEMALLOC:
+            peak, top = _stop_tracemalloc()
+            lines.append(f"tracemalloc peak: {peak / 1024:.1f} KB")
+            lines.append("allocations still held, by site:")
+            lines.extend(f"  {stat}" for stat in top)
+        with open(base + ".txt", "w", encoding="utf-8") as summary_file:
+            summary_file.write("\n".join(lines) + "\n")
+        return path
+
+
+def _begin(name):
+    """A started RequestProfile if this call is picked and a slot is free, else None"""
+    if not should_profile() or not _slots.acquire(blocking=False):
+        return None
+    try:
+        return RequestProfile(name)
+    except Exception:
+        _slots.release()
+        raise
+
+
+def _end(profile, error=None):
+    try:
+        tracing.set_attribute("profile", profile.finish(error))
+    finally:
+        _slots.release()
+
+
+def profiled(name):
+    """Decorator: profile picked calls of a Gradio handler (plain or generator)"""
+    def decorator(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def stream_wrapper(*args, **kwargs):
+                profile = _begin(name)
+                if profile is None:
+                    yield from fn(*args, **kwargs)
+                    return
+                error = None
+                steps = fn(*args, **kwargs)
+                try:
+                    while True:
+                        profile.resume()
+                        try:
+                            value = next(steps)
+                        except StopIteration:
+                            return
+                        finally:
+                            profile.pause()
+                        yield value
+                except GeneratorExit:
+                    error = "cancelled by the client"
+                    raise
+                except BaseException as e:
+                    error = f"{type(e).__name__}: {e}"
+                    raise
+                finally:
+                    steps.close()
+                    _end(profile, error)
+            return stream_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            profile = _begin(name)
+            if profile is None:
+                return fn(*args, **kwargs)
+            error = None
+            profile.resume()
+            try:
+                return fn(*args, **kwargs)
+            except BaseException as e:
+                error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                profile.pause()
+                _end(profile, error)
+        return wrapper
+    return decorator
@@ -0,0 +1,567 @@
+# Python counterpart of src/lib/ai-provider.ts: a registry of llama3.2-vision
+# backends (Together, Ollama over HTTP, the ollama library) that routes each
+# request by recent latency, error rate and queue depth, with fallback.
+
+import base64
+import contextvars
+import importlib.util
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from cancellation import CancelScope, cancellable_session, enter
+from cassette import recorded
+from health import CircuitOpenError, get_breaker
+from metrics import model_call
+from ollama_scheduler import scheduler
+from singleflight import SingleFlight, request_key
+from tracing import span
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+OLLAMA_VISION_MODEL = "llama3.2-vision"
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "300"))
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Latency samples kept per provider, and how long a sample stays relevant. Old
+# samples expire so a provider that was slow once is tried again later.
+STATS_WINDOW = int(os.getenv("PROVIDER_STATS_WINDOW", "100"))
+STATS_TTL = float(os.getenv("PROVIDER_STATS_TTL", "300"))
+# Providers with fewer samples than this are tried before ranked ones
+MIN_SAMPLES = 3
+
+# Hedging (opt-in): when the primary has no first token after its rolling
+# first-token p90 (HEDGE_DEFAULT_DELAY until it has samples), the request is
+# also sent to a provider on another backend. At most HEDGE_BUDGET of recent
+# requests may be hedged.
+LLM_HEDGING = os.getenv("LLM_HEDGING", "0") == "1"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "90"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "10"))
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.1"))
+HEDGE_WINDOW = 200
+
+# Identical requests (same messages, image bytes and params) that overlap in
+# time share one backend call
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "1") == "1"
+
+
+def _image_b64(image):
+    """Base64 text for an Ollama-style image: a file path, raw bytes or base64"""
+    if isinstance(image, bytes):
+        return base64.b64encode(image).decode("utf-8")
+    if os.path.exists(image):
+        with span("encode_image", image_bytes=os.path.getsize(image)):
+            with open(image, "rb") as image_file:
+                return base64.b64encode(image_file.read()).decode("utf-8")
+    return image
+
+
+def to_ollama_messages(messages):
+    """Convert Together/OpenAI image_url content parts to Ollama text + images"""
+    converted = []
+    for message in messages:
+        content = message.get("content")
+        images = list(message.get("images") or [])
+        if isinstance(content, list):
+            texts = []
+            for part in content:
+                if part.get("type") == "text":
+                    texts.append(part["text"])
+                elif part.get("type") == "image_url":
+                    url = part["image_url"]["url"]
+                    images.append(url.split(",", 1)[1] if url.startswith("data:") else url)
+            content = "\n".join(texts)
+        message = {"role": message["role"], "content": content}
+        if images:
+            message["images"] = [_image_b64(image) for image in images]
+        converted.append(message)
+    return converted
+
+
+def to_together_messages(messages):
+    """Convert Ollama-style images to Together/OpenAI image_url content parts"""
+    converted = []
+    for message in messages:
+        if not message.get("images"):
+            converted.append(message)
+            continue
+        content = [{"type": "text", "text": message.get("content", "")}]
+        for image in message["images"]:
+            content.append({"type": "image_url",
+                            "image_url": {"url": f"data:image/jpeg;base64,{_image_b64(image)}"}})
+        converted.append({"role": message["role"], "content": content})
+    return converted
+
+
+class LatencyStats:
+    """Rolling latency and error samples for one provider and request kind"""
+
+    def __init__(self, window=STATS_WINDOW, ttl=STATS_TTL):
+        self.ttl = ttl
+        self._samples = deque(maxlen=window)  # (timestamp, seconds, ok)
+        self._lock = threading.Lock()
+
+    def record(self, seconds, ok=True):
+        with self._lock:
+            self._samples.append((time.monotonic(), seconds, ok))
+
+    def _recent(self):
+        cutoff = time.monotonic() - self.ttl
+        with self._lock:
+            while self._samples and self._samples[0][0] < cutoff:
+                self._samples.popleft()
+            return list(self._samples)
+
+    @property
+    def count(self):
+        return len(self._recent())
+
+    def percentile(self, q):
+        """q-th percentile (0-100) of successful latencies, or None without samples"""
+        latencies = sorted(seconds for _, seconds, ok in self._recent() if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q / 100))]
+
+    @property
+    def error_rate(self):
+        samples = self._recent()
+        if not samples:
+            return 0.0
+        return sum(1 for _, _, ok in samples if not ok) / len(samples)
+
+
+class Provider:
+    """
+    One backend able to answer llama3.2-vision requests
+
+    Args:
+        name (str): Registry name, as used in AI_PROVIDER_PRIORITY
+        backend (str): Service behind the provider; hedges go to a different one
+        complete_fn: complete_fn(messages, model_size, stop) -> text
+        stream_fn: stream_fn(messages, model_size, stop) -> iterator of text
+            chunks; without it streams fall back to one complete_fn chunk
+        available_fn: available_fn() -> None when usable, else the reason not
+        queue_fn: queue_fn() -> requests waiting in front of this backend
+        concurrency (int): requests the backend serves at the same time
+        breaker (CircuitBreaker): the backend's breaker; skipped while it is open
+    """
+
+    def __init__(self, name, complete_fn, stream_fn=None, available_fn=None,
+                 queue_fn=None, concurrency=1, backend=None, breaker=None):
+        self.name = name
+        self.backend = backend or name
+        self.complete_fn = complete_fn
+        self.stream_fn = stream_fn
+        self.available_fn = available_fn
+        self.queue_fn = queue_fn
+        self.concurrency = concurrency
+        self.breaker = breaker
+        self.stats = {"complete": LatencyStats(), "first_token": LatencyStats()}
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def unavailable_reason(self):
+        if self.breaker is not None and not self.breaker.available():
+            return "circuit open"
+        return self.available_fn() if self.available_fn else None
+
+    def queue_depth(self):
+        return self.in_flight + (self.queue_fn() if self.queue_fn else 0)
+
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def end(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stream(self, messages, model_size, stop):
+        if self.stream_fn is None:
+            yield self.complete_fn(messages, model_size, stop)
+        else:
+            yield from self.stream_fn(messages, model_size, stop)
+
+
+class _Racer(threading.Thread):
+    """Runs one provider's stream for a hedged request, posting chunks to events"""
+
+    def __init__(self, provider, messages, model_size, stop, events):
+        super().__init__(daemon=True)
+        self.provider = provider
+        self.args = (messages, model_size, stop)
+        self.events = events
+        self.cancelled = threading.Event()
+        self.scope = CancelScope()
+        self.context = contextvars.copy_context()
+        self.context.run(enter, self.scope)
+
+    def run(self):
+        self.context.run(self._race)
+
+    def cancel(self):
+        """Stop the race, closing the provider's connection if it is still waiting"""
+        self.cancelled.set()
+        self.scope.cancel()
+
+    def _race(self):
+        stats = self.provider.stats["first_token"]
+        start = time.monotonic()
+        started = False
+        self.provider.begin()
+        chunks = self.provider.stream(*self.args)
+        try:
+            for chunk in chunks:
+                if not started:
+                    stats.record(time.monotonic() - start)
+                    started = True
+                if self.cancelled.is_set():
+                    break
+                self.events.put((self, "chunk", chunk))
+            self.events.put((self, "done", None))
+        except Exception as e:
+            # A racer cancelled before its first token lost; it did not fail
+            if not started and not self.cancelled.is_set():
+                stats.record(time.monotonic() - start, ok=False)
+            self.events.put((self, "error", e))
+        finally:
+            # Closing the generator closes the HTTP stream, so the backend stops
+            chunks.close()
+            self.provider.end()
+
+
+class ProviderRouter:
+    """
+    Send each request to the provider expected to answer fastest, falling back
+    to the next one when it fails
+
+    Untried providers (or ones whose samples expired) go first, in priority
+    order. The rest are ranked by the mean of their p50 and p95 latency,
+    scaled up by queue depth per unit of concurrency and by error rate.
+
+    With hedge=True a slow primary is raced against a provider on another
+    backend; the first to produce a token wins and the other is cancelled.
+    With coalesce=True identical concurrent requests share one call.
+    """
+
+    def __init__(self, providers, hedge=False, hedge_budget=HEDGE_BUDGET, coalesce=False):
+        self.providers = list(providers)
+        self.hedge = hedge
+        self.flights = SingleFlight() if coalesce else None
+        self.hedge_budget = hedge_budget
+        # One [hedged] entry per recent request, updated in place by that request
+        self._hedged = deque(maxlen=HEDGE_WINDOW)
+        self._hedge_lock = threading.Lock()
+
+    def score(self, provider, kind):
+        stats = provider.stats[kind]
+        if stats.count < MIN_SAMPLES:
+            return 0.0
+        p50, p95 = stats.percentile(50), stats.percentile(95)
+        if p50 is None:
+            # Only failures recently
+            return float("inf")
+        queued = provider.queue_depth() / max(1, provider.concurrency)
+        return (p50 + p95) / 2 * (1 + queued) / max(0.05, 1 - stats.error_rate)
+
+    def ranked(self, kind="complete"):
+        """Available providers, best first"""
+        available = [p for p in self.providers if p.unavailable_reason() is None]
+        if not available:
+            reasons = ", ".join(f"{p.name} ({p.unavailable_reason()})" for p in self.providers)
+            raise Exception(f"No LLM providers are available: {reasons}")
+        return sorted(available, key=lambda p: self.score(p, kind))
+
+    def complete(self, messages, model_size=11, stop=None):
+        """Return the first successful completion, trying providers best first"""
+        if self.flights is None:
+            return self._complete(messages, model_size, stop)
+        key = request_key("complete", messages, model_size=model_size, stop=stop)
+        return self.flights.call(key, lambda: self._complete(messages, model_size, stop))
+
+    def _complete(self, messages, model_size, stop):
+        if self.hedge:
+            return "".join(self._hedged_stream(messages, model_size, stop))
+        errors = []
+        for provider in self.ranked("complete"):
+            stats = provider.stats["complete"]
+            start = time.monotonic()
+            provider.begin()
+            try:
+                result = provider.complete_fn(messages, model_size, stop)
+            except CircuitOpenError as e:
+                errors.append(f"{provider.name}: {e}")
+                continue
+            except Exception as e:
+                stats.record(time.monotonic() - start, ok=False)
+                errors.append(f"{provider.name}: {e}")
+                continue
+            finally:
+                provider.end()
+            stats.record(time.monotonic() - start)
+            return result
+        raise Exception("All LLM providers failed: " + "; ".join(errors))
+
+    def stream(self, messages, model_size=11, stop=None):
+        """
+        Stream from the provider with the best time to first token. A provider
+        that fails before its first chunk is skipped; once text has been
+        yielded there is no fallback.
+        """
+        if self.flights is None:
+            yield from self._stream(messages, model_size, stop)
+            return
+        key = request_key("stream", messages, model_size=model_size, stop=stop)
+        yield from self.flights.stream(key, lambda: self._stream(messages, model_size, stop))
+
+    def _stream(self, messages, model_size, stop):
+        if self.hedge:
+            return self._hedged_stream(messages, model_size, stop)
+        return self._fallback_stream(self.ranked("first_token"), messages, model_size, stop)
+
+    def _fallback_stream(self, providers, messages, model_size, stop, errors=None):
+        errors = errors or []
+        for provider in providers:
+            stats = provider.stats["first_token"]
+            start = time.monotonic()
+            started = False
+            provider.begin()
+            try:
+                for chunk in provider.stream(messages, model_size, stop):
+                    if not started:
+                        stats.record(time.monotonic() - start)
+                        started = True
+                    yield chunk
+                if not started:
+                    stats.record(time.monotonic() - start)
+                return
+            except CircuitOpenError as e:
+                errors.append(f"{provider.name}: {e}")
+            except Exception as e:
+                if started:
+                    raise
+                stats.record(time.monotonic() - start, ok=False)
+                errors.append(f"{provider.name}: {e}")
+            finally:
+                provider.end()
+        raise Exception("All LLM providers failed: " + "; ".join(errors))
+
+    def hedge_delay(self, provider):
+        """Seconds to wait for the provider's first token before hedging"""
+        stats = provider.stats["first_token"]
+        if stats.count < MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return stats.percentile(HEDGE_PERCENTILE) or HEDGE_DEFAULT_DELAY
+
+    def _take_hedge(self, entry):
+        """Whether the hedge budget allows one more hedged request; marks entry hedged"""
+        with self._hedge_lock:
+            hedged = sum(e[0] for e in self._hedged)
+            if hedged >= self.hedge_budget * max(len(self._hedged), 1):
+                return False
+            entry[0] = True
+            return True
+
+    @property
+    def hedge_rate(self):
+        with self._hedge_lock:
+            return sum(e[0] for e in self._hedged) / len(self._hedged) if self._hedged else 0.0
+
+    def _hedged_stream(self, messages, model_size, stop):
+        ranked = self.ranked("first_token")
+        primary = ranked[0]
+        backup = next((p for p in ranked[1:] if p.backend != primary.backend), None)
+        if backup is None:
+            yield from self._fallback_stream(ranked, messages, model_size, stop)
+            return
+
+        hedge_entry = [False]
+        with self._hedge_lock:
+            self._hedged.append(hedge_entry)
+        events = queue.Queue()
+        racers = [_Racer(primary, messages, model_size, stop, events)]
+        racers[0].start()
+        deadline = time.monotonic() + self.hedge_delay(primary)
+        winner = None
+        failed = set()
+        errors = []
+        start = time.monotonic()
+        try:
+            while winner is None:
+                hedging = len(racers) == 1 and deadline is not None
+                timeout = max(0.0, deadline - time.monotonic()) if hedging else None
+                try:
+                    racer, kind, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    deadline = None
+                    if self._take_hedge(hedge_entry):
+                        racers.append(_Racer(backup, messages, model_size, stop, events))
+                        racers[-1].start()
+                    continue
+                if kind == "error":
+                    errors.append(f"{racer.provider.name}: {value}")
+                    failed.add(racer)
+                    if len(racers) == 1:
+                        # The primary failed outright: fall back without waiting
+                        racers.append(_Racer(backup, messages, model_size, stop, events))
+                        racers[-1].start()
+                    elif len(failed) == len(racers):
+                        break
+                    continue
+                winner = racer
+                for other in racers:
+                    if other is not winner:
+                        other.cancel()
+                if kind == "chunk":
+                    yield value
+
+            if winner is None:
+                tried = [r.provider for r in racers]
+                yield from self._fallback_stream([p for p in ranked if p not in tried],
+                                                 messages, model_size, stop, errors)
+                return
+
+            while kind != "done":
+                racer, kind, value = events.get()
+                if racer is not winner:
+                    continue
+                if kind == "chunk":
+                    yield value
+                elif kind == "error":
+                    raise value
+            winner.provider.stats["complete"].record(time.monotonic() - start)
+        finally:
+            for racer in racers:
+                racer.cancel()
+
+    def snapshot(self):
+        """Per-provider routing inputs, for logs and dashboards"""
+        snapshot = {"hedge_rate": self.hedge_rate} if self.hedge else {}
+        if self.flights is not None:
+            snapshot["coalesced"] = self.flights.coalesced
+        for provider in self.providers:
+            entry = {"available": provider.unavailable_reason() is None,
+                     "queue_depth": provider.queue_depth()}
+            for kind, stats in provider.stats.items():
+                entry[kind] = {"p50": stats.percentile(50), "p95": stats.percentile(95),
+                               "error_rate": stats.error_rate, "samples": stats.count}
+            snapshot[provider.name] = entry
+        return snapshot
+
+
+def _together_complete(messages, model_size, stop):
+    from utils import llama32
+    with get_breaker("together").guard():
+        return llama32(to_together_messages(messages), model_size, stop=stop)
+
+
+def _together_stream(messages, model_size, stop):
+    from utils import llama32_stream
+    with get_breaker("together").guard():
+        yield from llama32_stream(to_together_messages(messages), model_size, stop=stop)
+
+
+def _together_available():
+    return None if os.getenv("TOGETHER_API_KEY") else "TOGETHER_API_KEY not configured"
+
+
+def _ollama_payload(messages, stop, stream):
+    payload = {"model": OLLAMA_VISION_MODEL, "messages": to_ollama_messages(messages),
+               "stream": stream}
+    if stop:
+        payload["options"] = {"stop": stop}
+    return payload
+
+
+@recorded("ollama_http.complete")
+def _ollama_http_complete(messages, model_size, stop):
+    breaker = get_breaker("ollama")
+    breaker.check()
+    payload = _ollama_payload(messages, stop, False)
+    body = json.dumps(payload)
+    with scheduler.slot(OLLAMA_VISION_MODEL), breaker.guard(), \
+            model_call("ollama_http", OLLAMA_VISION_MODEL, payload, body) as call, \
+            cancellable_session() as session:
+        response = session.post(f"{OLLAMA_HOST}/api/chat", timeout=OLLAMA_TIMEOUT, data=body,
+                                headers=JSON_HEADERS)
+        call.first_byte(response.elapsed.total_seconds())
+        response.raise_for_status()
+        result = response.json()
+        call.ollama_stats(result)
+    return result["message"]["content"]
+
+
+@recorded("ollama_http.stream")
+def _ollama_http_stream(messages, model_size, stop):
+    breaker = get_breaker("ollama")
+    breaker.check()
+    payload = _ollama_payload(messages, stop, True)
+    body = json.dumps(payload)
+    with scheduler.slot(OLLAMA_VISION_MODEL) as ticket, breaker.guard(), \
+            model_call("ollama_http", OLLAMA_VISION_MODEL, payload, body) as call, \
+            cancellable_session() as session:
+        # A cancelled hedge racer shuts this connection down, even before the
+        # first token, which frees the scheduler slot and stops Ollama
+        with session.post(f"{OLLAMA_HOST}/api/chat", timeout=OLLAMA_TIMEOUT, stream=True,
+                          data=body, headers=JSON_HEADERS) as response:
+            call.first_byte(response.elapsed.total_seconds())
+            response.raise_for_status()
+            for line in response.iter_lines():
+                ticket.touch()
+                if not line:
+                    continue
+                part = json.loads(line)
+                if "error" in part:
+                    raise Exception(part["error"])
+                if part.get("done"):
+                    call.ollama_stats(part)
+                content = part.get("message", {}).get("content", "")
+                if content:
+                    call.token()
+                    yield content
+
+
+def _ollama_library_complete(messages, model_size, stop):
+    from local_utils import llama32
+    return llama32(to_ollama_messages(messages), model_size, stop=stop)
+
+
+def _ollama_library_stream(messages, model_size, stop):
+    from local_utils import llama32_stream
+    yield from llama32_stream(to_ollama_messages(messages), model_size, stop=stop)
+
+
+def _ollama_library_available():
+    return None if importlib.util.find_spec("ollama") else "ollama package not installed"
+
+
+def _ollama_queue():
+    return scheduler.stats()["queue_depth"].get(OLLAMA_VISION_MODEL, 0)
+
+
+def build_providers():
+    """Every known provider by name"""
+    return {
+        "together": Provider("together", _together_complete, _together_stream,
+                             available_fn=_together_available, backend="together",
+                             breaker=get_breaker("together"),
+                             concurrency=int(os.getenv("TOGETHER_CONCURRENCY", "8"))),
+        "ollama_http": Provider("ollama_http", _ollama_http_complete, _ollama_http_stream,
+                                queue_fn=_ollama_queue, concurrency=scheduler.parallel,
+                                backend="ollama", breaker=get_breaker("ollama")),
+        "ollama": Provider("ollama", _ollama_library_complete, _ollama_library_stream,
+                           available_fn=_ollama_library_available,
+                           queue_fn=_ollama_queue, concurrency=scheduler.parallel,
+                           backend="ollama", breaker=get_breaker("ollama")),
+    }
+
+
+def default_router(priority="together,ollama_http,ollama"):
+    """Router over the providers named in AI_PROVIDER_PRIORITY (or priority)"""
+    providers = build_providers()
+    names = [name.strip() for name in os.getenv("AI_PROVIDER_PRIORITY", priority).split(",")]
+    return ProviderRouter((providers[name] for name in names if name in providers),
+                          hedge=LLM_HEDGING, coalesce=LLM_SINGLE_FLIGHT)
@@ -0,0 +1,149 @@
+# Single-flight coalescing: identical requests that arrive while one is still
+# running attach to it instead of hitting the backend again. Streamed chunks
+# fan out to every waiter, late joiners replay what was already produced.
+
+import base64
+import binascii
+import contextvars
+import hashlib
+import json
+import os
+import threading
+
+import tracing
+
+
+def _image_digest(image):
+    """sha256 of the image bytes, whether given as bytes, a path, base64 or a data URL"""
+    if isinstance(image, bytes):
+        data = image
+    elif os.path.exists(image):
+        with open(image, "rb") as image_file:
+            data = image_file.read()
+    else:
+        encoded = image.split(",", 1)[1] if image.startswith("data:") else image
+        try:
+            data = base64.b64decode(encoded, validate=True)
+        except (binascii.Error, ValueError):
+            data = image.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+def _normalize(message):
+    content = message.get("content")
+    if isinstance(content, list):
+        content = [{"image": _image_digest(part["image_url"]["url"])}
+                   if part.get("type") == "image_url" else part for part in content]
+    normalized = {"role": message.get("role"), "content": content}
+    if message.get("images"):
+        normalized["images"] = [_image_digest(image) for image in message["images"]]
+    return normalized
+
+
+def request_key(kind, messages, **params):
+    """Content hash of a request: kind, messages with image bytes hashed, and params"""
+    payload = {"kind": kind, "messages": [_normalize(m) for m in messages], "params": params}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.cancelled = False
+        self.subscribers = 0
+        self.cond = threading.Condition()
+
+
+class SingleFlight:
+    """
+    Run at most one upstream call per key at a time
+
+    The upstream stream runs in its own thread so every subscriber reads at
+    its own pace; it is closed once the last subscriber stops reading.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.coalesced = 0
+
+    def _join(self, key, stream_fn):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.started += 1
+                # The upstream call's spans belong to the trace that started it
+                context = contextvars.copy_context()
+                threading.Thread(target=context.run, daemon=True,
+                                 args=(self._produce, key, flight, stream_fn)).start()
+            else:
+                self.coalesced += 1
+                tracing.set_attribute("coalesced", True)
+            with flight.cond:
+                flight.subscribers += 1
+        return flight
+
+    def _leave(self, flight, key):
+        with self._lock:
+            with flight.cond:
+                flight.subscribers -= 1
+                if flight.subscribers or flight.done:
+                    return
+                # Nobody is reading any more: stop the upstream call
+                flight.cancelled = True
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def _produce(self, key, flight, stream_fn):
+        chunks = None
+        try:
+            # stream_fn may fail before returning an iterator (e.g. no provider
+            # is available); the error must still reach the subscribers
+            chunks = stream_fn()
+            for chunk in chunks:
+                with flight.cond:
+                    if flight.cancelled:
+                        break
+                    flight.chunks.append(chunk)
+                    flight.cond.notify_all()
+        except Exception as e:
+            flight.error = e
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+
+    def stream(self, key, stream_fn):
+        """Yield stream_fn()'s chunks, sharing one call among concurrent identical keys"""
+        flight = self._join(key, stream_fn)
+        try:
+            i = 0
+            while True:
+                with flight.cond:
+                    while i >= len(flight.chunks) and not flight.done:
+                        flight.cond.wait()
+                    if i < len(flight.chunks):
+                        chunk = flight.chunks[i]
+                        i += 1
+                    elif flight.error is not None:
+                        raise flight.error
+                    else:
+                        return
+                yield chunk
+        finally:
+            self._leave(flight, key)
+
+    def call(self, key, fn):
+        """Return fn(), sharing one call among concurrent identical keys"""
+        def once():
+            yield fn()
+        return "".join(self.stream(key, once))
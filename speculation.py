@@ -0,0 +1,99 @@
+# Speculative pre-computation of the follow-up questions users almost always
+# ask after an interior design analysis. Answers are computed in the
+# background and cached on the session; a matching question is a cache hit.
+
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_FOLLOWUPS = [
+    "List all the materials used in this room.",
+    "Estimate the cost of the furniture and decor in this photo.",
+    "Count the objects in this photo.",
+]
+
+# Off unless set: ";"-separated questions, or "default" for DEFAULT_FOLLOWUPS.
+# Each analysis then makes one extra vision call per question.
+_followups = os.getenv("SPECULATIVE_FOLLOWUPS", "")
+SPECULATIVE_FOLLOWUPS = DEFAULT_FOLLOWUPS if _followups.strip() == "default" else [
+    q.strip() for q in _followups.split(";") if q.strip()
+]
+# Maximum speculative calls per session and concurrent speculative calls overall
+SPECULATIVE_BUDGET = int(os.getenv("SPECULATIVE_BUDGET", "3"))
+SPECULATIVE_WORKERS = int(os.getenv("SPECULATIVE_WORKERS", "2"))
+
+
+def normalize_question(question):
+    """
+    Lowercase and strip punctuation and extra spaces. Only questions equal
+    after this match: any other word (e.g. "not") can change the answer.
+    """
+    return " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+
+
+class FollowupSpeculator:
+    """
+    Fire likely follow-ups in the background once a session's first answer
+    is available.
+
+    answer_fn(session, question, base_turns) must answer the question as if
+    it were asked right after the first base_turns turns, without modifying
+    the session, and return (answer, context).
+    """
+
+    def __init__(self, answer_fn, questions=None, budget=SPECULATIVE_BUDGET,
+                 max_workers=SPECULATIVE_WORKERS):
+        self.answer_fn = answer_fn
+        self.questions = SPECULATIVE_FOLLOWUPS if questions is None else questions
+        self.budget = budget
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers),
+                                            thread_name_prefix="speculate")
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()  # take() runs on concurrent handler threads
+
+    def start(self, session):
+        """Queue the speculative follow-ups for a session"""
+        base_turns = len(session.turns)
+        session.speculative = {}
+        for question in self.questions[:self.budget]:
+            future = self._executor.submit(self._run, session, question, base_turns)
+            session.speculative[normalize_question(question)] = (future, base_turns)
+
+    def _run(self, session, question, base_turns):
+        if session.closed:
+            return None
+        return self.answer_fn(session, question, base_turns)
+
+    def take(self, session, question):
+        """
+        Return (answer, context, base_turns) for a speculated question, or None.
+        A speculation that has not started yet is cancelled so the caller can
+        ask directly instead of queueing behind other speculative work.
+        """
+        result = None
+        entry = session.speculative.pop(normalize_question(question), None)
+        if entry is not None:
+            future, base_turns = entry
+            if not future.cancel():
+                try:
+                    result = future.result()
+                except Exception:
+                    result = None
+        with self._stats_lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if result is None:
+            return None
+        answer, context = result
+        return answer, context, base_turns
+
+    def cancel(self, session):
+        """Drop pending speculation for a closed or evicted session"""
+        session.closed = True
+        for future, _ in session.speculative.values():
+            future.cancel()
+        session.speculative = {}
@@ -0,0 +1,101 @@
+# Paragraph-targeted story editing: ask the model which paragraphs an edit
+# instruction touches, rewrite only those and splice the rest back verbatim.
+
+import re
+
+SELECT_PROMPT = """Below is a story split into numbered paragraphs, followed by an edit instruction.
+Reply with only the numbers of the paragraphs that must change to follow the instruction,
+comma-separated (for example: 2, 5). Reply "all" only if every paragraph must change.
+
+{paragraphs}
+
+Edit instruction: {instruction}"""
+
+REWRITE_PROMPT = """You are editing one paragraph of a story.
+Edit instruction: {instruction}
+
+Previous paragraph (for context, do not rewrite):
+{before}
+
+Paragraph to rewrite:
+{paragraph}
+
+Next paragraph (for context, do not rewrite):
+{after}
+
+Reply with only the rewritten paragraph, in the same language and style."""
+
+THINK_PATTERN = re.compile(r"<think>.*?(</think>|$)", re.DOTALL)
+ALL_PATTERN = re.compile(r"\W*all(\s+(of\s+them|(of\s+the\s+)?paragraphs))?\W*", re.IGNORECASE)
+
+
+def strip_reasoning(text):
+    """Drop <think> blocks emitted by reasoning models such as Deepseek R1 and QWQ"""
+    return THINK_PATTERN.sub("", text).strip()
+
+
+def split_paragraphs(story):
+    """Split a story into paragraphs on blank lines"""
+    return [p.strip() for p in re.split(r"\n\s*\n", story.strip()) if p.strip()]
+
+
+def join_paragraphs(paragraphs):
+    return "\n\n".join(paragraphs)
+
+
+def parse_selection(reply, count):
+    """Paragraph indices (0-based) named in the model's reply; every index for 'all'"""
+    reply = strip_reasoning(reply)
+    # Only a bare "all" selects everything; "all" inside a sentence does not
+    if ALL_PATTERN.fullmatch(reply):
+        return list(range(count))
+    numbers = [int(n) for n in re.findall(r"\d+", reply)]
+    return sorted({n - 1 for n in numbers if 1 <= n <= count})
+
+
+def select_paragraphs(paragraphs, instruction, complete_fn):
+    """Ask the model which paragraphs the instruction touches"""
+    numbered = "\n\n".join(f"[{i}] {p}" for i, p in enumerate(paragraphs, 1))
+    reply = complete_fn(SELECT_PROMPT.format(paragraphs=numbered, instruction=instruction))
+    # An unusable answer falls back to rewriting everything, as before
+    return parse_selection(reply, len(paragraphs)) or list(range(len(paragraphs)))
+
+
+def edit_story_stream(story, instruction, complete_fn, stream_fn):
+    """
+    Apply an edit instruction by rewriting only the affected paragraphs
+
+    Args:
+        story (str): Current story text
+        instruction (str): Edit instruction
+        complete_fn: complete_fn(prompt) -> reply text, used to pick paragraphs
+        stream_fn: stream_fn(prompt) -> iterator of text chunks, used to rewrite
+
+    Yields:
+        str: The full story with rewritten paragraphs streamed in place
+
+    If a model call fails, the paragraph being rewritten is restored, the
+    story as it stands is yielded once more and the error is re-raised.
+    """
+    paragraphs = split_paragraphs(story)
+    if not paragraphs:
+        return
+    selected = select_paragraphs(paragraphs, instruction, complete_fn)
+    for i in selected:
+        prompt = REWRITE_PROMPT.format(
+            instruction=instruction,
+            before=paragraphs[i - 1] if i > 0 else "(start of story)",
+            paragraph=paragraphs[i],
+            after=paragraphs[i + 1] if i + 1 < len(paragraphs) else "(end of story)")
+        rewritten = ""
+        try:
+            for chunk in stream_fn(prompt):
+                rewritten += chunk
+                visible = strip_reasoning(rewritten)
+                if visible:
+                    yield join_paragraphs(paragraphs[:i] + [visible] + paragraphs[i + 1:])
+        except Exception:
+            yield join_paragraphs(paragraphs)
+            raise
+        paragraphs[i] = strip_reasoning(rewritten) or paragraphs[i]
+    yield join_paragraphs(paragraphs)
@@ -0,0 +1,29 @@
+# Stream adapters for the Gradio handlers
+
+import time
+
+def coalesce_chunks(chunks, interval=0.05, max_chars=512):
+    """
+    Re-chunk a text stream into fewer, larger pieces
+
+    A piece is emitted when `interval` seconds have passed since the last one
+    or `max_chars` characters are buffered, and once more at the end, so a
+    handler yields a UI update a few dozen times per second at most instead
+    of once per token.
+    """
+    buffer = []
+    buffered = 0
+    last_flush = time.monotonic()
+    for chunk in chunks:
+        if not chunk:
+            continue
+        buffer.append(chunk)
+        buffered += len(chunk)
+        now = time.monotonic()
+        if buffered >= max_chars or now - last_flush >= interval:
+            yield "".join(buffer)
+            buffer = []
+            buffered = 0
+            last_flush = now
+    if buffer:
+        yield "".join(buffer)
@@ -0,0 +1,380 @@
+# Post-processing for "Convert the chart to an HTML table." responses:
+# extract the <table>, parse it into columns, validate it and export it.
+
+import csv
+import html
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from html.parser import HTMLParser
+
+TABLE_PATTERN = re.compile(r"<table\b.*?</table\s*>", re.IGNORECASE | re.DOTALL)
+TABLE_STOP = "</table>"
+NUMBER_PATTERN = re.compile(r"^[-+]?\d+(\.\d+)?([eE][-+]?\d+)?$")
+
+# Every conversion writes its exports (and chart crops) to a directory under
+# EXPORT_ROOT; directories older than EXPORT_TTL seconds are removed.
+EXPORT_ROOT = os.getenv("GRAPH_TABLE_EXPORT_ROOT",
+                        os.path.join(tempfile.gettempdir(), "graph_table_exports"))
+EXPORT_TTL = float(os.getenv("GRAPH_TABLE_EXPORT_TTL", "3600"))
+
+
+def extract_html_table(text):
+    """Return the first <table>...</table> block in the model response, or None"""
+    if not text:
+        return None
+    match = TABLE_PATTERN.search(text)
+    if match:
+        return match.group(0)
+    # A "</table>" stop sequence is not included in the returned text
+    start = text.lower().find("<table")
+    return text[start:] + TABLE_STOP if start != -1 else None
+
+
+class _TableParser(HTMLParser):
+    """Collect the rows of the first table, remembering which rows are headers"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self.header_rows = set()
+        self._depth = 0
+        self._in_thead = False
+        self._row = None
+        self._cell = None
+        self._row_has_td = False
+        self._colspan = 1
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "table":
+            self._depth += 1
+        if self._depth != 1:
+            return
+        if tag == "thead":
+            self._in_thead = True
+        elif tag == "tr":
+            self._finish_row()
+            self._row = []
+            self._row_has_td = False
+        elif tag in ("td", "th"):
+            self._finish_cell()
+            if self._row is None:
+                self._row = []
+            self._cell = []
+            self._row_has_td = self._row_has_td or tag == "td"
+            span = dict(attrs).get("colspan")
+            self._colspan = int(span) if span and span.isdigit() else 1
+        elif tag == "br" and self._cell is not None:
+            self._cell.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag == "table":
+            if self._depth == 1:
+                self._finish_row()
+            self._depth -= 1
+        if self._depth != 1:
+            return
+        if tag == "thead":
+            self._finish_row()
+            self._in_thead = False
+        elif tag == "tr":
+            self._finish_row()
+        elif tag in ("td", "th"):
+            self._finish_cell()
+
+    def handle_data(self, data):
+        if self._depth == 1 and self._cell is not None:
+            self._cell.append(data)
+
+    def _finish_cell(self):
+        if self._cell is None:
+            return
+        text = " ".join("".join(self._cell).split())
+        self._row.extend([text] + [""] * (self._colspan - 1))
+        self._cell = None
+
+    def _finish_row(self):
+        self._finish_cell()
+        if self._row:
+            if self._in_thead or not self._row_has_td:
+                self.header_rows.add(len(self.rows))
+            self.rows.append(self._row)
+        self._row = None
+
+
+def parse_number(value):
+    """Parse '1,234', '$12.5' or '45%' style cells into a float, else None"""
+    cleaned = value.strip().replace(",", "").replace(" ", "")
+    cleaned = cleaned.lstrip("$€£¥").rstrip("%")
+    if NUMBER_PATTERN.match(cleaned):
+        return float(cleaned)
+    return None
+
+
+def parse_html_table(table_html):
+    """
+    Parse an HTML table into a columnar structure
+
+    Returns:
+        dict: {"columns": [...], "data": {column: [values]}, "numeric": [...],
+               "issues": [...]} where numeric columns hold floats (None for blanks)
+    """
+    parser = _TableParser()
+    parser.feed(table_html or "")
+    parser.close()
+    rows = parser.rows
+    issues = []
+
+    header_count = 0
+    while header_count in parser.header_rows:
+        header_count += 1
+    if header_count:
+        # Multi-row headers are joined column by column
+        width = max(len(row) for row in rows[:header_count])
+        header = []
+        for i in range(width):
+            parts = [row[i] for row in rows[:header_count] if i < len(row) and row[i]]
+            header.append(" ".join(parts))
+        body = rows[header_count:]
+    elif rows:
+        issues.append("No header row found; using the first row as header")
+        header, body = rows[0], rows[1:]
+    else:
+        header, body = [], []
+
+    width = max([len(header)] + [len(row) for row in body])
+    columns = []
+    for i in range(width):
+        name = header[i] if i < len(header) and header[i] else f"column_{i + 1}"
+        while name in columns:
+            name = f"{name}_{i + 1}"
+        columns.append(name)
+
+    ragged = [i + 1 for i, row in enumerate(body) if len(row) != width]
+    if ragged:
+        issues.append(f"Rows {ragged} do not have {width} cells and were padded")
+    body = [row + [""] * (width - len(row)) for row in body]
+
+    data = {}
+    numeric = []
+    for i, name in enumerate(columns):
+        values = [row[i] for row in body]
+        filled = [value for value in values if value]
+        parsed = [parse_number(value) for value in filled]
+        numeric_count = sum(value is not None for value in parsed)
+        if filled and numeric_count == len(filled):
+            data[name] = [parse_number(value) if value else None for value in values]
+            numeric.append(name)
+        else:
+            data[name] = values
+            if filled and numeric_count * 2 >= len(filled):
+                issues.append(f"Column '{name}' is mostly numeric but has "
+                              f"{len(filled) - numeric_count} non-numeric values")
+
+    return {"columns": columns, "data": data, "numeric": numeric, "issues": issues}
+
+
+def table_shape(table):
+    """Return (row_count, column_count) of a parsed table"""
+    columns = table["columns"]
+    rows = len(table["data"][columns[0]]) if columns else 0
+    return rows, len(columns)
+
+
+def validate_table(table, expected_rows=None, expected_columns=None, min_rows=1):
+    """Return a list of validation problems; an empty list means the table is usable"""
+    problems = list(table["issues"])
+    rows, cols = table_shape(table)
+    if cols == 0:
+        return problems + ["Table has no columns"]
+    if rows < min_rows:
+        problems.append(f"Table has {rows} data rows, expected at least {min_rows}")
+    if expected_rows is not None and rows != expected_rows:
+        problems.append(f"Table has {rows} data rows, expected {expected_rows}")
+    if expected_columns is not None and cols != expected_columns:
+        problems.append(f"Table has {cols} columns, expected {expected_columns}")
+    if cols > 1 and not table["numeric"]:
+        problems.append("Table has no numeric columns")
+    return problems
+
+
+def format_cell(value):
+    """Format a parsed cell for display or CSV; whole floats lose their '.0'"""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def table_records(table):
+    """Return the table as a list of row dicts"""
+    columns = table["columns"]
+    rows, _ = table_shape(table)
+    return [{name: table["data"][name][i] for name in columns} for i in range(rows)]
+
+
+def table_to_csv(table):
+    """Serialize a parsed table to CSV text"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(table["columns"])
+    for record in table_records(table):
+        writer.writerow([format_cell(value) for value in record.values()])
+    return buffer.getvalue()
+
+
+def table_to_json(table):
+    """Serialize a parsed table to columnar JSON"""
+    return json.dumps({"columns": table["columns"],
+                       "numeric": table["numeric"],
+                       "data": table["data"]}, ensure_ascii=False)
+
+
+def table_to_parquet(table, path):
+    """Write a parsed table to a Parquet file (requires pyarrow)"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export needs pyarrow: pip install pyarrow")
+    pq.write_table(pa.table(table["data"]), path)
+    return path
+
+
+def prune_exports(root=EXPORT_ROOT, ttl=EXPORT_TTL):
+    """Remove export directories last modified more than ttl seconds ago"""
+    cutoff = time.time() - ttl
+    try:
+        entries = list(os.scandir(root))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_dir() and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except FileNotFoundError:
+            continue
+
+
+def new_export_dir(prefix="graph_table_", root=EXPORT_ROOT):
+    """A fresh directory under the export root; expired ones are pruned first"""
+    prune_exports(root)
+    os.makedirs(root, exist_ok=True)
+    return tempfile.mkdtemp(prefix=prefix, dir=root)
+
+
+def export_table(table, directory=None, name="table", formats=("csv", "json", "parquet")):
+    """
+    Write the table in each requested format and return the file paths.
+    Parquet is skipped silently when pyarrow is not installed.
+    """
+    directory = directory or new_export_dir()
+    paths = []
+    for fmt in formats:
+        path = os.path.join(directory, f"{name}.{fmt}")
+        if fmt == "csv":
+            with open(path, "w", newline="", encoding="utf-8") as f:
+                f.write(table_to_csv(table))
+        elif fmt == "json":
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(table_to_json(table))
+        elif fmt == "parquet":
+            try:
+                table_to_parquet(table, path)
+            except ImportError:
+                continue
+        else:
+            raise ValueError(f"Unknown export format: {fmt}")
+        paths.append(path)
+    return paths
+
+
+def render_table_html(table, problems=None):
+    """Render a parsed table back to HTML; every cell is escaped so it is safe for gr.HTML"""
+    head = "".join(f"<th>{html.escape(name)}</th>" for name in table["columns"])
+    body = "".join(
+        "<tr>" + "".join(f"<td>{html.escape(format_cell(v))}</td>" for v in record.values())
+        + "</tr>"
+        for record in table_records(table))
+    out = f"<table><thead><tr>{head}</tr></thead><tbody>{body}</tbody></table>"
+    if problems:
+        notes = "".join(f"<li>{html.escape(p)}</li>" for p in problems)
+        out += f"<p><b>Validation warnings:</b></p><ul>{notes}</ul>"
+    return out
+
+
+def render_text_html(text):
+    """Fallback rendering for responses that contain no table"""
+    return f"<pre>{html.escape(text or '')}</pre>"
+
+
+def process_table_response(text, export_dir=None, name="table"):
+    """
+    Turn a raw model response into (sanitized_html, table, export_paths).
+    table and export_paths are None when the response has no table.
+    """
+    table_html = extract_html_table(text)
+    if table_html is None:
+        return render_text_html(text), None, None
+    table = parse_html_table(table_html)
+    if not table["columns"]:
+        return render_text_html(text), None, None
+    problems = validate_table(table)
+    paths = export_table(table, export_dir, name)
+    return render_table_html(table, problems), table, paths
+
+
+def stream_table_text(chunks):
+    """
+    Accumulate streamed chunks and yield the text so far, stopping as soon as
+    the table is structurally complete. Leaving the loop closes the upstream
+    generator, which cancels the model stream on the client side.
+    A backend-side stop sequence strips "</table>", so it is restored at the end.
+    """
+    text = ""
+    try:
+        for chunk in chunks:
+            text += chunk
+            end = text.lower().find(TABLE_STOP)
+            if end != -1:
+                yield text[:end + len(TABLE_STOP)]
+                return
+            yield text
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+    if "<table" in text.lower():
+        yield text + TABLE_STOP
+
+
+def collect_table_text(chunks):
+    """Consume a stream with the same early stop and return the final text"""
+    text = ""
+    for text in stream_table_text(chunks):
+        pass
+    return text
+
+
+def render_partial_table(text):
+    """Render the complete rows of a table that is still streaming"""
+    lower = text.lower()
+    start = lower.find("<table")
+    if start == -1:
+        return render_text_html(text)
+    last_row = lower.rfind("</tr>")
+    if last_row < start:
+        return "<p><i>Building table...</i></p>"
+    table = parse_html_table(text[start:last_row + len("</tr>")] + TABLE_STOP)
+    if not table["columns"]:
+        return "<p><i>Building table...</i></p>"
+    return render_table_html(table)
+
+
+def render_table_list(sections):
+    """Render one titled section per chart; sections is a list of HTML strings"""
+    return "".join(f"<h4>Chart {i}</h4>{section}" for i, section in enumerate(sections, 1))
@@ -0,0 +1,93 @@
+import contextvars
+import socket
+import threading
+import time
+
+import httpx
+import pytest
+import requests
+
+from cancellation import CancelledError, CancelScope, cancellable_session, enter, httpx_event_hooks
+from ollama_scheduler import ModelScheduler
+
+
+@pytest.fixture
+def silent_server():
+    """A server that accepts connections and never answers; yields its URL"""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    accepted = []
+
+    def accept():
+        while True:
+            try:
+                accepted.append(server.accept()[0])
+            except OSError:
+                return
+
+    threading.Thread(target=accept, daemon=True).start()
+    yield f"http://127.0.0.1:{server.getsockname()[1]}"
+    server.close()
+    for conn in accepted:
+        conn.close()
+
+
+def _cancel_later(fn, delay=0.2):
+    """Run fn in a new cancel scope, cancel it after delay; returns (error, seconds)"""
+    scope = CancelScope()
+    context = contextvars.copy_context()
+    context.run(enter, scope)
+    threading.Timer(delay, scope.cancel).start()
+    start = time.monotonic()
+    with pytest.raises(Exception) as error:
+        context.run(fn)
+    return error.value, time.monotonic() - start
+
+
+def test_cancel_wakes_a_request_waiting_for_headers(silent_server):
+    def call():
+        with cancellable_session() as session:
+            session.get(silent_server, timeout=10)
+
+    error, elapsed = _cancel_later(call)
+    assert isinstance(error, requests.exceptions.ConnectionError)
+    assert elapsed < 5
+
+
+def test_cancel_wakes_an_httpx_request_waiting_for_headers(silent_server):
+    def call():
+        with httpx.Client(event_hooks=httpx_event_hooks()) as client:
+            client.get(silent_server, timeout=10)
+
+    error, elapsed = _cancel_later(call)
+    assert isinstance(error, httpx.TransportError)
+    assert elapsed < 5
+
+
+def test_requests_outside_a_scope_use_the_shared_pool():
+    adapter = cancellable_session().get_adapter("http://example.com")
+    request = requests.Request("GET", "http://example.com/").prepare()
+    pool = adapter.get_connection_with_tls_context(request, True)
+    assert pool is adapter.get_connection_with_tls_context(request, True)
+
+
+def test_cancel_stops_a_queued_scheduler_wait():
+    scheduler = ModelScheduler(capacity_gb=8, memory_gb={"a": 8})
+    held = scheduler.acquire("a")
+    error, elapsed = _cancel_later(lambda: scheduler.acquire("a", timeout=10))
+    assert isinstance(error, CancelledError)
+    assert elapsed < 1
+    assert scheduler.stats()["queue_depth"] == {}
+    scheduler.release(held)
+
+
+def test_requests_in_a_scope_get_a_pool_of_their_own():
+    adapter = cancellable_session().get_adapter("http://example.com")
+    request = requests.Request("GET", "http://example.com/").prepare()
+    context = contextvars.copy_context()
+    context.run(enter, CancelScope())
+    first = context.run(adapter.get_connection_with_tls_context, request, True)
+    second = context.run(adapter.get_connection_with_tls_context, request, True)
+    assert first is not second
+    assert first is not adapter.get_connection_with_tls_context(request, True)
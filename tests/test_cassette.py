@@ -0,0 +1,102 @@
+import pytest
+import requests
+
+import cassette
+from cassette import Cassette, CassetteMiss, call_key, recorded
+
+
+@pytest.fixture
+def tape(tmp_path, monkeypatch):
+    """A fresh cassette file in place of the module-level one"""
+    recording = Cassette(str(tmp_path / "llm.jsonl"))
+    monkeypatch.setattr(cassette, "cassette", recording)
+    return recording
+
+
+def _complete(messages, temperature=0.0):
+    return "unused"
+
+
+def test_key_binds_arguments_to_parameter_names():
+    messages = [{"role": "user", "content": "hi"}]
+    positional = call_key("complete", _complete, (messages,), {})
+    assert positional == call_key("complete", _complete, (), {"messages": messages})
+    # Defaults are applied, so passing one explicitly gives the same key
+    assert positional == call_key("complete", _complete, (messages, 0.0), {})
+    assert positional != call_key("complete", _complete, (messages, 0.5), {})
+    assert positional != call_key("stream", _complete, (messages,), {})
+
+
+def test_replay_serves_recorded_results_in_order(tape):
+    answers = iter(["first", "second"])
+
+    @recorded("complete", mode="record")
+    def complete(prompt):
+        return next(answers)
+
+    assert [complete("q"), complete("q")] == ["first", "second"]
+
+    @recorded("complete", mode="replay")
+    def replayed(prompt):
+        raise AssertionError("replay must not call the model")
+
+    tape._entries = None
+    assert [replayed("q"), replayed("q"), replayed("q")] == ["first", "second", "second"]
+    with pytest.raises(CassetteMiss):
+        replayed("other")
+
+
+def test_replay_streams_recorded_chunks(tape):
+    @recorded("stream", mode="record")
+    def stream(prompt):
+        yield from ["a", "b", "c"]
+
+    assert list(stream("q")) == ["a", "b", "c"]
+
+    @recorded("stream", mode="replay")
+    def replayed(prompt):
+        raise AssertionError("replay must not call the model")
+        yield
+
+    assert list(replayed("q")) == ["a", "b", "c"]
+
+
+def test_replay_raises_the_recorded_error_class(tape):
+    @recorded("complete", mode="record")
+    def complete(prompt):
+        raise requests.exceptions.ConnectTimeout("backend down")
+
+    with pytest.raises(requests.exceptions.ConnectTimeout):
+        complete("q")
+
+    @recorded("complete", mode="replay")
+    def replayed(prompt):
+        raise AssertionError("replay must not call the model")
+
+    tape._entries = None
+    with pytest.raises(requests.exceptions.RequestException, match="backend down") as raised:
+        replayed("q")
+    assert type(raised.value) is requests.exceptions.ConnectTimeout
+
+
+def test_replay_past_a_truncated_stream_is_a_miss(tape):
+    @recorded("stream", mode="record")
+    def stream(prompt):
+        yield from ["a", "b", "c"]
+
+    chunks = stream("q")
+    assert next(chunks) == "a"
+    chunks.close()
+
+    @recorded("stream", mode="replay")
+    def replayed(prompt):
+        raise AssertionError("replay must not call the model")
+        yield
+
+    tape._entries = None
+    # A caller that stops at the same point is served
+    served = replayed("q")
+    assert next(served) == "a"
+    served.close()
+    with pytest.raises(CassetteMiss):
+        list(replayed("q"))
@@ -0,0 +1,39 @@
+from PIL import Image, ImageDraw
+
+from chart_layout import detect_chart_regions
+
+
+def _dashboard(charts):
+    """A white 600x400 image with a filled block drawn at each box"""
+    img = Image.new("RGB", (600, 400), "white")
+    draw = ImageDraw.Draw(img)
+    for box in charts:
+        draw.rectangle(box, fill="navy")
+    return img
+
+
+def test_blank_image_is_one_region():
+    assert detect_chart_regions(_dashboard([])) == [(0, 0, 600, 400)]
+
+
+def test_single_chart_is_the_whole_image():
+    assert detect_chart_regions(_dashboard([(50, 50, 550, 350)])) == [(0, 0, 600, 400)]
+
+
+def test_two_by_two_grid_in_reading_order():
+    charts = [(20, 20, 280, 180), (320, 20, 580, 180),
+              (20, 220, 280, 380), (320, 220, 580, 380)]
+    regions = detect_chart_regions(_dashboard(charts), padding=0)
+    assert regions == [(l, t, r + 1, b + 1) for l, t, r, b in charts]
+
+
+def test_padding_is_clamped_to_the_image():
+    regions = detect_chart_regions(_dashboard([(0, 0, 280, 399), (320, 0, 599, 399)]))
+    assert regions[0][0] == 0 and regions[0][1] == 0
+    assert regions[-1][2] == 600 and regions[-1][3] == 400
+
+
+def test_small_blocks_are_not_separate_charts():
+    # A title strip above one chart is merged into it rather than becoming a region
+    regions = detect_chart_regions(_dashboard([(200, 10, 400, 25), (50, 60, 550, 380)]))
+    assert regions == [(0, 0, 600, 400)]
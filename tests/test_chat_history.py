@@ -0,0 +1,37 @@
+import threading
+
+from chat_history import HistoryManager
+
+HISTORY = [(f"question {i} " * 20, f"answer {i} " * 20) for i in range(12)]
+
+
+def _fail_if_called(prompt):
+    raise AssertionError("summarize_fn called on the request path")
+
+
+def test_build_never_waits_for_a_summary():
+    manager = HistoryManager({"m": 200}, _fail_if_called)
+    messages = manager.build_messages("hi", HISTORY, "m")
+    # No summary yet: older turns are truncated instead of summarized inline
+    assert messages[0]["role"] == "user"
+    assert messages[-1] == {"role": "user", "content": "hi"}
+
+
+def test_prepared_summary_is_used_by_the_next_turn():
+    done = threading.Event()
+    prompts = []
+
+    def summarize(prompt):
+        prompts.append(prompt)
+        done.set()
+        return "the story so far"
+
+    manager = HistoryManager({"m": 200}, summarize)
+    manager.prepare(HISTORY, "m")
+    manager.prepare(HISTORY, "m")
+    assert done.wait(5)
+    manager._executor.shutdown(wait=True)
+    assert len(prompts) == 1
+    messages = manager.build_messages("hi", HISTORY, "m")
+    assert messages[0] == {"role": "system",
+                           "content": "Summary of the earlier conversation: the story so far"}
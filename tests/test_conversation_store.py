@@ -0,0 +1,29 @@
+from conversation_store import ConversationStore
+
+
+def test_turns_round_trip_with_compression(tmp_path):
+    store = ConversationStore(str(tmp_path / "chat.db"))
+    conversation_id = store.create("story")
+    store.append(conversation_id, "short", "x" * 2000)
+    store.append(conversation_id, "second", "reply")
+    assert store.count(conversation_id) == 2
+    assert store.turns(conversation_id) == [("short", "x" * 2000), ("second", "reply")]
+    assert store.turns(conversation_id, limit=1) == [("second", "reply")]
+
+
+def test_find_summaries_beyond_the_sqlite_variable_limit(tmp_path):
+    store = ConversationStore(str(tmp_path / "chat.db"))
+    digests = [i.to_bytes(2, "big") for i in range(3000)]
+    store.put_summary(digests[-1], "latest")
+    assert store.find_summaries(digests) == {digests[-1]: "latest"}
+
+
+def test_eviction_prunes_summaries(tmp_path):
+    store = ConversationStore(str(tmp_path / "chat.db"), max_conversations=2)
+    for i in range(4):
+        store.put_summary(bytes([i]), f"summary {i}")
+    store.find_summaries([bytes([0])])
+    store.create()
+    # Only the most recently used summaries survive, up to the conversation cap
+    assert store.find_summaries([bytes([i]) for i in range(4)]) == {
+        bytes([0]): "summary 0", bytes([3]): "summary 3"}
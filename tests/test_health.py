@@ -0,0 +1,83 @@
+import contextvars
+
+import pytest
+import requests
+
+import cancellation
+from health import (BREAKER_CONSECUTIVE, CLOSED, HALF_OPEN, OPEN, CircuitBreaker,
+                    CircuitOpenError, is_backend_failure)
+
+
+def _fail(breaker, error):
+    with pytest.raises(type(error)):
+        with breaker.guard():
+            raise error
+
+
+def _http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(response=response)
+
+
+def test_only_transport_errors_and_5xx_are_failures():
+    assert is_backend_failure(requests.exceptions.ConnectionError())
+    assert is_backend_failure(requests.exceptions.ReadTimeout())
+    assert is_backend_failure(_http_error(503))
+    assert not is_backend_failure(_http_error(404))
+    assert not is_backend_failure(ValueError("bad json"))
+
+
+def test_consecutive_failures_open_the_breaker():
+    breaker = CircuitBreaker("test")
+    for _ in range(BREAKER_CONSECUTIVE):
+        assert breaker.state == CLOSED
+        _fail(breaker, requests.exceptions.ConnectionError())
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_client_errors_keep_it_closed():
+    breaker = CircuitBreaker("test")
+    for _ in range(BREAKER_CONSECUTIVE + 2):
+        _fail(breaker, _http_error(400))
+    assert breaker.state == CLOSED
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker("test", open_seconds=0)
+    breaker.trip()
+    assert breaker.state == HALF_OPEN
+    breaker.acquire()
+    assert not breaker.available()
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker("test", open_seconds=60)
+    breaker.trip()
+    breaker.probe_succeeded()
+    assert breaker.state == HALF_OPEN
+    _fail(breaker, requests.exceptions.ConnectionError())
+    assert breaker.state == OPEN
+
+
+def test_cancelled_request_records_nothing():
+    breaker = CircuitBreaker("test", open_seconds=60)
+    breaker.trip()
+    breaker.probe_succeeded()
+    scope = cancellation.CancelScope()
+    scope.cancel()
+
+    def cancelled_trial():
+        cancellation.enter(scope)
+        _fail(breaker, requests.exceptions.ConnectionError())
+
+    contextvars.copy_context().run(cancelled_trial)
+    # The trial slot is freed without counting as a failure
+    assert breaker.state == HALF_OPEN
+    assert breaker.available()
@@ -0,0 +1,43 @@
+import pytest
+
+import metrics
+from metrics import RecentEvents, timed_task
+
+
+def test_busy_key_does_not_push_out_a_quiet_one():
+    events = RecentEvents(size=3)
+    events.record("quiet", 1.0)
+    for _ in range(10):
+        events.record("busy", 0.1)
+
+    summary = events.summary(window=300)
+    assert summary["quiet"]["count"] == 1
+    assert summary["busy"]["count"] == 3
+
+
+def test_rate_covers_only_what_a_full_ring_kept():
+    events = RecentEvents(size=3)
+    for _ in range(10):
+        events.record("busy", 0.1)
+
+    # Three events in well under a second, not three in the whole window
+    assert events.summary(window=300)["busy"]["rate"] > 3 / 300
+    quiet = RecentEvents(size=3)
+    quiet.record("quiet", 0.1)
+    assert quiet.summary(window=300)["quiet"]["rate"] == pytest.approx(1 / 300)
+
+
+def test_timed_task_counts_raised_errors(monkeypatch):
+    events = RecentEvents()
+    monkeypatch.setattr(metrics, "recent_tasks", events)
+
+    @timed_task("task")
+    def handler(fail):
+        if fail:
+            raise RuntimeError("backend down")
+        return "ok"
+
+    handler(False)
+    with pytest.raises(RuntimeError):
+        handler(True)
+    assert events.summary()["task"]["error_rate"] == 0.5
@@ -0,0 +1,74 @@
+import gc
+import threading
+import time
+
+import pytest
+
+from ollama_scheduler import ModelScheduler, SlotTimeout
+
+
+def test_queued_request_times_out_and_leaves_the_queue():
+    scheduler = ModelScheduler(capacity_gb=8, memory_gb={"a": 8, "b": 8})
+    with scheduler.slot("a"):
+        with pytest.raises(SlotTimeout):
+            scheduler.acquire("b", timeout=0.1)
+        assert scheduler.stats()["queue_depth"] == {}
+    assert scheduler.stats()["running"] == {}
+    assert scheduler.timeouts == 1
+
+
+def test_loaded_model_goes_before_an_older_request_for_another():
+    scheduler = ModelScheduler(capacity_gb=8, memory_gb={"a": 8, "b": 8})
+    order = []
+    first = scheduler.acquire("a")
+
+    def run(model):
+        with scheduler.slot(model):
+            order.append(model)
+
+    threads = [threading.Thread(target=run, args=(model,)) for model in ("b", "a")]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    scheduler.release(first)
+    for thread in threads:
+        thread.join(5)
+    assert order == ["a", "b"]
+    assert scheduler.switches == 2
+
+
+def test_release_is_idempotent():
+    scheduler = ModelScheduler(parallel=2)
+    ticket = scheduler.acquire("a")
+    other = scheduler.acquire("a")
+    scheduler.release(ticket)
+    scheduler.release(ticket)
+    assert scheduler.stats()["running"] == {"a": 1}
+    scheduler.release(other)
+
+
+def test_abandoned_stream_releases_its_slot():
+    scheduler = ModelScheduler()
+
+    def stream():
+        with scheduler.slot("a"):
+            yield "chunk"
+            yield "chunk"
+
+    chunks = stream()
+    next(chunks)
+    assert scheduler.stats()["running"] == {"a": 1}
+    del chunks
+    gc.collect()
+    assert scheduler.stats()["running"] == {}
+
+
+def test_idle_slot_is_reclaimed():
+    scheduler = ModelScheduler(memory_gb={"a": 24}, idle_timeout=0.1)
+    stuck = scheduler.acquire("a")
+    ticket = scheduler.acquire("a", timeout=2)
+    assert scheduler.reclaimed == 1
+    # The reclaimed holder's late release does not free the new holder's slot
+    scheduler.release(stuck)
+    assert scheduler.stats()["running"] == {"a": 1}
+    scheduler.release(ticket)
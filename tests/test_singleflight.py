@@ -0,0 +1,45 @@
+import threading
+
+import pytest
+
+from providers import Provider, ProviderRouter
+from singleflight import SingleFlight
+
+
+def _run_with_timeout(fn, timeout=5):
+    """fn()'s result or exception, failing the test if it does not return in time"""
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = fn()
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "call never returned"
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def test_error_before_stream_reaches_subscribers():
+    flights = SingleFlight()
+
+    def stream_fn():
+        raise Exception("no provider")
+
+    for _ in range(2):
+        with pytest.raises(Exception, match="no provider"):
+            _run_with_timeout(lambda: list(flights.stream("key", stream_fn)))
+    # The failed flight was removed, so the second call started a new one
+    assert flights.started == 2
+
+
+def test_router_with_no_available_provider_raises():
+    provider = Provider("down", lambda *args: "", available_fn=lambda: "down")
+    router = ProviderRouter([provider], coalesce=True)
+    with pytest.raises(Exception, match="No LLM providers are available"):
+        _run_with_timeout(lambda: list(router.stream([{"role": "user", "content": "hi"}])))
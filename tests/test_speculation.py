@@ -0,0 +1,48 @@
+import threading
+
+from speculation import FollowupSpeculator, normalize_question
+from vision_sessions import VisionSession
+
+
+def _speculator(questions):
+    calls = []
+
+    def answer_fn(session, question, base_turns):
+        calls.append(question)
+        return f"answer to {question}", None
+
+    return FollowupSpeculator(answer_fn, questions=questions), calls
+
+
+def test_normalize_ignores_case_punctuation_and_spacing():
+    assert normalize_question("  List ALL the materials,  used?") == "list all the materials used"
+
+
+def test_matching_question_is_a_hit():
+    speculator, _ = _speculator(["List all the materials used in this room."])
+    session = VisionSession("room.jpg")
+    speculator.start(session)
+    hit = speculator.take(session, "list all the materials used in this room")
+    assert hit == ("answer to List all the materials used in this room.", None, 0)
+    assert (speculator.hits, speculator.misses) == (1, 0)
+
+
+def test_similar_question_with_different_words_is_a_miss():
+    speculator, _ = _speculator(["List all the materials used in this room."])
+    session = VisionSession("room.jpg")
+    speculator.start(session)
+    assert speculator.take(session, "List all the materials not used in this room.") is None
+    assert (speculator.hits, speculator.misses) == (0, 1)
+
+
+def test_cancelled_session_runs_nothing():
+    gate = threading.Event()
+    speculator = FollowupSpeculator(lambda *args: gate.wait(5), questions=["a", "b"],
+                                    max_workers=1)
+    session = VisionSession("room.jpg")
+    speculator.start(session)
+    speculator.cancel(session)
+    gate.set()
+    assert session.closed
+    assert session.speculative == {}
+    assert speculator.take(session, "b") is None
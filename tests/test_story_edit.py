@@ -0,0 +1,30 @@
+from story_edit import edit_story_stream, parse_selection
+
+
+def test_numbers_are_one_based_and_deduplicated():
+    assert parse_selection("2, 5, 2", 5) == [1, 4]
+
+
+def test_out_of_range_numbers_are_dropped():
+    assert parse_selection("0, 3, 9", 4) == [2]
+
+
+def test_bare_all_selects_every_paragraph():
+    assert parse_selection("All", 3) == [0, 1, 2]
+    assert parse_selection("all paragraphs.", 3) == [0, 1, 2]
+
+
+def test_all_inside_a_sentence_does_not():
+    assert parse_selection("Paragraph 2 is all that needs to change", 4) == [1]
+    assert parse_selection("Not all of them", 4) == []
+
+
+def test_reasoning_is_ignored():
+    assert parse_selection("<think>maybe 1 or 3</think>3", 3) == [2]
+
+
+def test_only_selected_paragraphs_are_rewritten():
+    story = "One.\n\nTwo.\n\nThree."
+    outputs = list(edit_story_stream(story, "louder", lambda prompt: "2",
+                                     lambda prompt: iter(["TWO", "!"])))
+    assert outputs[-1] == "One.\n\nTWO!\n\nThree."
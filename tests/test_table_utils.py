@@ -0,0 +1,88 @@
+import csv
+import io
+import json
+import os
+
+from table_utils import (collect_table_text, export_table, extract_html_table, parse_html_table,
+                         parse_number, process_table_response, validate_table)
+
+RESPONSE = """Here is the table:
+<table>
+  <thead><tr><th>Year</th><th>Sales</th></tr></thead>
+  <tbody>
+    <tr><td>2022</td><td>$1,200</td></tr>
+    <tr><td>2023</td><td>45%</td></tr>
+  </tbody>
+</table>
+Let me know if you need anything else."""
+
+
+def test_extract_returns_only_the_table():
+    table_html = extract_html_table(RESPONSE)
+    assert table_html.startswith("<table>")
+    assert table_html.endswith("</table>")
+
+
+def test_extract_restores_a_stripped_stop_sequence():
+    assert extract_html_table("<table><tr><td>1</td></tr>") == "<table><tr><td>1</td></tr></table>"
+    assert extract_html_table("no table here") is None
+
+
+def test_parse_number_formats():
+    assert parse_number("1,234") == 1234.0
+    assert parse_number("$12.5") == 12.5
+    assert parse_number("45%") == 45.0
+    assert parse_number("n/a") is None
+
+
+def test_parse_header_and_numeric_columns():
+    table = parse_html_table(extract_html_table(RESPONSE))
+    assert table["columns"] == ["Year", "Sales"]
+    assert table["data"]["Sales"] == [1200.0, 45.0]
+    assert set(table["numeric"]) == {"Year", "Sales"}
+    assert validate_table(table) == []
+
+
+def test_validate_reports_shape_problems():
+    table = parse_html_table(extract_html_table(RESPONSE))
+    problems = validate_table(table, expected_rows=3, expected_columns=2)
+    assert problems == ["Table has 2 data rows, expected 3"]
+    empty = parse_html_table("<table></table>")
+    assert validate_table(empty) == ["Table has no columns"]
+
+
+def test_export_writes_csv_and_json(tmp_path):
+    table = parse_html_table(extract_html_table(RESPONSE))
+    paths = export_table(table, str(tmp_path), formats=("csv", "json"))
+    assert [os.path.basename(p) for p in paths] == ["table.csv", "table.json"]
+    with open(paths[0], newline="", encoding="utf-8") as f:
+        assert list(csv.reader(f)) == [["Year", "Sales"], ["2022", "1200"], ["2023", "45"]]
+    with open(paths[1], encoding="utf-8") as f:
+        assert json.load(f)["data"]["Year"] == [2022.0, 2023.0]
+
+
+def test_process_escapes_cells_and_falls_back_to_text(tmp_path):
+    table_html, table, paths = process_table_response(
+        "<table><tr><th>Name</th><th>Value</th></tr>"
+        "<tr><td><script>x</script>a &lt;b&gt;</td><td>1</td></tr></table>",
+        str(tmp_path))
+    assert "<script>" not in table_html
+    assert "a &lt;b&gt;" in table_html
+    assert table["columns"] == ["Name", "Value"]
+    assert paths
+
+    text_html, table, paths = process_table_response("I cannot read <b>this</b> chart")
+    assert text_html == "<pre>I cannot read &lt;b&gt;this&lt;/b&gt; chart</pre>"
+    assert table is None and paths is None
+
+
+def test_collect_stops_at_the_closing_tag():
+    consumed = []
+
+    def chunks():
+        for chunk in ["<table><tr><td>1</td>", "</tr></table>", " trailing", " text"]:
+            consumed.append(chunk)
+            yield chunk
+
+    assert collect_table_text(chunks()) == "<table><tr><td>1</td></tr></table>"
+    assert len(consumed) == 2
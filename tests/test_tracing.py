@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+
+import tracing
+from tracing import span, traced
+
+
+class _Collect:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+
+@pytest.fixture
+def exported(monkeypatch):
+    collect = _Collect()
+    monkeypatch.setattr(tracing, "exporter", collect)
+    return collect.spans
+
+
+def test_traced_generator_parents_spans_across_threads(exported):
+    @traced("outer")
+    def steps():
+        for i in range(2):
+            with span("step", index=i):
+                yield i
+
+    gen = steps()
+    results = []
+    # Gradio resumes a generator handler on whichever worker thread is free
+    for _ in range(3):
+        thread = threading.Thread(target=lambda: results.append(next(gen, None)))
+        thread.start()
+        thread.join()
+
+    assert results == [0, 1, None]
+    by_name = {}
+    for s in exported:
+        by_name.setdefault(s.name, []).append(s)
+    outer, = by_name["outer"]
+    assert [s.parent_id for s in by_name["step"]] == [outer.span_id] * 2
+    assert tracing._current.get() is None
+
+
+def test_traced_generator_closes_span_when_abandoned(exported):
+    @traced("outer")
+    def steps():
+        yield 1
+        yield 2
+
+    gen = steps()
+    next(gen)
+    gen.close()
+    assert [s.name for s in exported] == ["outer"]
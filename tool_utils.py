@@ -0,0 +1,27 @@
+# Tool-calling helpers moved out of utils.py so that serving code does not import
+# wolframalpha or patch asyncio; utils and local_utils load them on first use.
+
+from wolframalpha import Client
+from utils import get_wolfram_alpha_api_key
+
+import nest_asyncio
+nest_asyncio.apply()
+
+def wolfram_alpha(query: str) -> str:
+    WOLFRAM_ALPHA_KEY = get_wolfram_alpha_api_key()
+    client = Client(WOLFRAM_ALPHA_KEY)
+    result = client.query(query)
+
+    results = []
+    for pod in result.pods:
+        if pod["@title"] == "Result" or pod["@title"] == "Results":
+          for sub in pod.subpods:
+            results.append(sub.plaintext)
+
+    return '\n'.join(results)
+
+
+
+def get_boiling_point(liquid_name, celsius):
+  # function body
+  return []
@@ -0,0 +1,216 @@
+# Lightweight tracing: nested spans with attributes, exported to a local JSONL
+# file or, in OTLP/JSON, to an OpenTelemetry collector (or any stand-in that
+# accepts POST /v1/traces). Off unless TRACE_EXPORTER is set.
+
+import contextvars
+import functools
+import inspect
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "")  # "jsonl", "otlp" or empty
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "multimodal-llama")
+# The OTLP exporter sends a batch at least every TRACE_FLUSH_SECONDS
+TRACE_FLUSH_SECONDS = 2.0
+TRACE_BATCH_SIZE = 100
+
+_current = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    @property
+    def duration(self):
+        """Seconds from start to end (or to now while the span is open)"""
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start_ns / 1e9,
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class JsonlExporter:
+    """Append one JSON object per finished span to a file"""
+
+    def __init__(self, path=TRACE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as trace_file:
+            trace_file.write(line + "\n")
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans):
+    """OTLP/JSON ExportTraceServiceRequest body for finished spans"""
+    otlp_spans = []
+    for span in spans:
+        otlp_span = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            otlp_span["parentSpanId"] = span.parent_id
+        otlp_spans.append(otlp_span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name",
+                                     "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "tracing"}, "spans": otlp_spans}],
+    }]}
+
+
+class OtlpExporter:
+    """Batch finished spans and POST them as OTLP/JSON from a daemon thread"""
+
+    def __init__(self, endpoint=TRACE_OTLP_ENDPOINT):
+        self.endpoint = endpoint
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def export(self, span):
+        self._queue.put(span)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + TRACE_FLUSH_SECONDS
+            while len(batch) < TRACE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                requests.post(self.endpoint, json=to_otlp(batch), timeout=5)
+            except requests.exceptions.RequestException:
+                # Tracing must never break the app; the batch is dropped
+                pass
+
+
+def _make_exporter(kind):
+    if kind == "jsonl":
+        return JsonlExporter()
+    if kind == "otlp":
+        return OtlpExporter()
+    return None
+
+
+exporter = _make_exporter(TRACE_EXPORTER)
+
+
+def current_span():
+    return _current.get()
+
+
+def set_attribute(key, value):
+    """Set an attribute on the current span, if any"""
+    span = _current.get()
+    if span is not None:
+        span.set_attribute(key, value)
+
+
+@contextmanager
+def span(name, activate=True, **attributes):
+    """
+    Time a block as a child of the current span
+
+    activate=False keeps the span out of the context, for leaf spans around
+    generators whose callers would otherwise nest under them between yields.
+    """
+    parent = _current.get()
+    new_span = Span(name, parent, attributes)
+    token = _current.set(new_span) if activate else None
+    try:
+        yield new_span
+    except GeneratorExit:
+        new_span.set_attribute("cancelled", True)
+        raise
+    except BaseException as e:
+        new_span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        new_span.end_ns = time.time_ns()
+        if token is not None:
+            try:
+                _current.reset(token)
+            except ValueError:
+                # Ended from another context (e.g. a generator resumed elsewhere)
+                _current.set(parent)
+        if exporter is not None:
+            exporter.export(new_span)
+
+
+def traced(name):
+    """Decorator: run the function (plain or generator) inside a span called name"""
+    def decorator(fn):
+        if inspect.isgeneratorfunction(fn):
+            @functools.wraps(fn)
+            def stream_wrapper(*args, **kwargs):
+                # Every step runs in one context of its own, so spans opened by
+                # the body nest under this one whichever thread resumes it
+                context = contextvars.copy_context()
+                with span(name, activate=False) as stream_span:
+                    context.run(_current.set, stream_span)
+                    steps = context.run(fn, *args, **kwargs)
+                    try:
+                        while True:
+                            try:
+                                value = context.run(next, steps)
+                            except StopIteration:
+                                return
+                            yield value
+                    finally:
+                        context.run(steps.close)
+            return stream_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
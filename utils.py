@@ -4,8 +4,16 @@ import requests
 import json
 
 from dotenv import load_dotenv, find_dotenv
+import importlib
 import os
-from wolframalpha import Client
+from metrics import model_call
+from cassette import recorded
+from cancellation import cancellable_session
+
+# (connect, read) seconds for Together requests; the read timeout applies
+# between streamed chunks, so a hung connection fails instead of blocking
+TOGETHER_TIMEOUT = (float(os.getenv("TOGETHER_CONNECT_TIMEOUT", "5")),
+                    float(os.getenv("TOGETHER_TIMEOUT", "120")))
 
 def load_env():
     _ = load_dotenv(find_dotenv())
@@ -13,14 +21,15 @@ def load_env():
   # The right API to pass in a prompt (of type string) is the completions API https://docs.together.ai/reference/completions-1
   # The right API to pass in a messages (of type of list of message) is The chat completions API https://docs.together.ai/reference/chat-completions-1
 
-def llama32(messages, model_size=11):
+@recorded("together.llama32")
+def llama32(messages, model_size=11, stop=None):
   model = f"meta-llama/Llama-3.2-{model_size}B-Vision-Instruct-Turbo"
   url = f"{os.getenv('DLAI_TOGETHER_API_BASE', 'https://api.together.xyz')}/v1/chat/completions"
   payload = {
     "model": model,
     "max_tokens": 4096,
     "temperature": 0.0,
-    "stop": ["<|eot_id|>","<|eom_id|>"],
+    "stop": ["<|eot_id|>","<|eom_id|>"] + (stop or []),
     "messages": messages
   }
 
@@ -29,13 +38,66 @@ def llama32(messages, model_size=11):
     "Content-Type": "application/json",
     "Authorization": f"Bearer {os.getenv('TOGETHER_API_KEY')}"
   }
-  res = json.loads(requests.request("POST", url, headers=headers, data=json.dumps(payload)).content)
+  body = json.dumps(payload)
+  with model_call("together", model, payload, body) as call:
+    response = requests.request("POST", url, headers=headers, data=body,
+                                timeout=TOGETHER_TIMEOUT)
+    call.first_byte(response.elapsed.total_seconds())
+    if response.status_code >= 500:
+      # With the response attached, the circuit breaker counts it as a backend failure
+      raise requests.HTTPError(response.text, response=response)
+    res = json.loads(response.content)
 
-  if 'error' in res:
-    raise Exception(res['error'])
+    if 'error' in res:
+      raise Exception(res['error'])
+    call.usage(res.get('usage'))
 
   return res['choices'][0]['message']['content']
 
+@recorded("together.llama32_stream")
+def llama32_stream(messages, model_size=11, stop=None):
+  """Stream llama32 content deltas; extra stop sequences end generation server-side"""
+  model = f"meta-llama/Llama-3.2-{model_size}B-Vision-Instruct-Turbo"
+  url = f"{os.getenv('DLAI_TOGETHER_API_BASE', 'https://api.together.xyz')}/v1/chat/completions"
+  payload = {
+    "model": model,
+    "max_tokens": 4096,
+    "temperature": 0.0,
+    "stop": ["<|eot_id|>","<|eom_id|>"] + (stop or []),
+    "messages": messages,
+    "stream": True
+  }
+
+  headers = {
+    "Accept": "text/event-stream",
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {os.getenv('TOGETHER_API_KEY')}"
+  }
+  # The session lets a cancelled hedge racer drop the connection mid-request
+  body = json.dumps(payload)
+  with model_call("together", model, payload, body) as call, cancellable_session() as session, \
+       session.post(url, headers=headers, data=body, stream=True,
+                    timeout=TOGETHER_TIMEOUT) as response:
+    call.first_byte(response.elapsed.total_seconds())
+    if not response.ok:
+      raise requests.HTTPError(response.text, response=response)
+    for line in response.iter_lines(decode_unicode=True):
+      if not line or not line.startswith("data:"):
+        continue
+      data = line[len("data:"):].strip()
+      if data == "[DONE]":
+        break
+      chunk = json.loads(data)
+      if 'error' in chunk:
+        raise Exception(chunk['error'])
+      # The last chunk carries the token usage
+      call.usage(chunk.get('usage'))
+      choice = chunk['choices'][0]
+      content = choice.get('delta', {}).get('content') or choice.get('text') or ""
+      if content:
+        call.token()
+        yield content
+
 def get_wolfram_alpha_api_key():
     load_env()
     wolfram_alpha_api_key = os.getenv("WOLFRAM_ALPHA_KEY")
@@ -47,6 +109,7 @@ def get_tavily_api_key():
     return tavily_api_key
 
 
+@recorded("together.llama31")
 def llama31(prompt_or_messages, model_size=8, temperature=0, raw=False, debug=False):
     model = f"meta-llama/Meta-Llama-3.1-{model_size}B-Instruct-Turbo"
     if isinstance(prompt_or_messages, str):
@@ -75,17 +138,21 @@ def llama31(prompt_or_messages, model_size=8, temperature=0, raw=False, debug=Fa
         "Authorization": f"Bearer {os.getenv('TOGETHER_API_KEY')}"
     }
 
-    try:
-        response = requests.post(
-            url, headers=headers, data=json.dumps(payload)
-        )
-        response.raise_for_status()  # Raises HTTPError for bad responses
-        res = response.json()
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Request failed: {e}")
-
-    if 'error' in res:
-        raise Exception(f"API Error: {res['error']}")
+    body = json.dumps(payload)
+    with model_call("together", model, payload, body) as call:
+        try:
+            response = requests.post(
+                url, headers=headers, data=body, timeout=TOGETHER_TIMEOUT
+            )
+            call.first_byte(response.elapsed.total_seconds())
+            response.raise_for_status()  # Raises HTTPError for bad responses
+            res = response.json()
+        except requests.exceptions.RequestException as e:
+            raise Exception(f"Request failed: {e}")
+
+        if 'error' in res:
+            raise Exception(f"API Error: {res['error']}")
+        call.usage(res.get('usage'))
 
     if raw:
         return res
@@ -95,103 +162,24 @@ def llama31(prompt_or_messages, model_size=8, temperature=0, raw=False, debug=Fa
     else:
         return res['choices'][0].get('message', {}).get('content', '')
 
-import os
-import requests
-from PIL import Image
-from io import BytesIO
-import matplotlib.pyplot as plt
-
-def disp_image(address):
-    if address.startswith("http://") or address.startswith("https://"):
-        response = requests.get(address)
-        img = Image.open(BytesIO(response.content))
-    else:
-        img = Image.open(address)
-    
-    plt.imshow(img)
-    plt.axis('off')
-    plt.show()
-
-def resize_image(img, max_dimension = 1120):
-  original_width, original_height = img.size
-
-  if original_width > original_height:
-      scaling_factor = max_dimension / original_width
-  else:
-      scaling_factor = max_dimension / original_height
-
-  new_width = int(original_width * scaling_factor)
-  new_height = int(original_height * scaling_factor)
-
-  # Resize the image while maintaining aspect ratio
-  resized_img = img.resize((new_width, new_height))
-
-  resized_img.save("images/resized_image.jpg")
-
-  print("Original size:", original_width, "x", original_height)
-  print("New size:", new_width, "x", new_height)
-
-  return resized_img
-
-
-from PIL import Image
-
-def merge_images(image_1, image_2, image_3):
-    img1 = Image.open(image_1)
-    img2 = Image.open(image_2)
-    img3 = Image.open(image_3)
-    
-    width1, height1 = img1.size
-    width2, height2 = img2.size
-    width3, height3 = img3.size
-    
-    print("Image 1 dimensions:", width1, height1)
-    print("Image 2 dimensions:", width2, height2)
-    print("Image 3 dimensions:", width3, height3)
-    
-    total_width = width1 + width2 + width3
-    max_height = max(height1, height2, height3)
-    
-    merged_image = Image.new("RGB", (total_width, max_height))
-    
-    merged_image.paste(img1, (0, 0))
-    merged_image.paste(img2, (width1, 0))
-    merged_image.paste(img3, (width1 + width2, 0))
-    
-    merged_image.save("images/merged_image_horizontal.jpg")
-    
-    print("Merged image dimensions:", merged_image.size)
-    return merged_image
-
-
-
-# pretty print JSON with syntax highlighting
-from pygments import highlight, lexers, formatters
-def cprint(response):
-    formatted_json = json.dumps(response, indent=4)
-    colorful_json = highlight(formatted_json,
-                              lexers.JsonLexer(),
-                              formatters.TerminalFormatter())
-    print(colorful_json)
-
-import nest_asyncio
-nest_asyncio.apply()
-
-def wolfram_alpha(query: str) -> str:
-    WOLFRAM_ALPHA_KEY = get_wolfram_alpha_api_key()
-    client = Client(WOLFRAM_ALPHA_KEY)
-    result = client.query(query)
-
-    results = []
-    for pod in result.pods:
-        if pod["@title"] == "Result" or pod["@title"] == "Results":
-          for sub in pod.subpods:
-            results.append(sub.plaintext)
-
-    return '\n'.join(results)
-
-
-
-def get_boiling_point(liquid_name, celsius):
-  # function body
-  return []
+# Display and tool helpers pull in matplotlib, pygments, wolframalpha and
+# nest_asyncio, which serving code never needs; they load on first use (PEP 562)
+_LAZY_HELPERS = {
+  "disp_image": "display_utils",
+  "resize_image": "display_utils",
+  "merge_images": "display_utils",
+  "cprint": "display_utils",
+  "wolfram_alpha": "tool_utils",
+  "get_boiling_point": "tool_utils",
+}
+
+def __getattr__(name):
+  module = _LAZY_HELPERS.get(name)
+  if module is None:
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+  value = getattr(importlib.import_module(module), name)
+  globals()[name] = value
+  return value
+
+def __dir__():
+  return sorted(list(globals()) + list(_LAZY_HELPERS))
@@ -0,0 +1,137 @@
+# Server-side multi-turn sessions for image follow-up questions.
+# A session keeps the image, the conversation so far and, for Ollama, the
+# returned `context` so follow-ups do not re-process the image.
+
+import base64
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+SESSION_MAX = int(os.getenv("VISION_SESSION_MAX", "100"))
+SESSION_TTL = float(os.getenv("VISION_SESSION_TTL", "1800"))
+
+
+class VisionSession:
+    """One image and its conversation history"""
+
+    def __init__(self, image_path):
+        self.id = uuid.uuid4().hex
+        self.image_path = image_path
+        self.turns = []  # (question, answer) pairs, the first one is about the image
+        self.context = None  # Ollama context tokens after the last turn
+        self.lock = threading.Lock()  # one model call per session at a time
+        self.created = self.last_used = time.monotonic()
+        self.speculative = {}  # normalized question -> (future, base_turns)
+        self.closed = False
+        self._image_b64 = None
+
+    @property
+    def image_b64(self):
+        """Base64 of the image, read and encoded once per session"""
+        if self._image_b64 is None:
+            with open(self.image_path, "rb") as image_file:
+                self._image_b64 = base64.b64encode(image_file.read()).decode('utf-8')
+        return self._image_b64
+
+    def messages(self, question, upto=None):
+        """
+        Together/OpenAI-style messages for the history plus a new question;
+        upto limits the history to the first upto turns
+        """
+        turns = self.turns[:upto]
+        messages = []
+        for i, (q, a) in enumerate(turns):
+            if i == 0:
+                messages.append({"role": "user", "content": [
+                    {"type": "text", "text": q},
+                    {"type": "image_url",
+                     "image_url": {"url": f"data:image/jpeg;base64,{self.image_b64}"}}
+                ]})
+            else:
+                messages.append({"role": "user", "content": q})
+            messages.append({"role": "assistant", "content": a})
+        if not turns:
+            messages.append({"role": "user", "content": [
+                {"type": "text", "text": question},
+                {"type": "image_url",
+                 "image_url": {"url": f"data:image/jpeg;base64,{self.image_b64}"}}
+            ]})
+        else:
+            messages.append({"role": "user", "content": question})
+        return messages
+
+    def add_turn(self, question, answer, context=None):
+        self.turns.append((question, answer))
+        if context is not None:
+            self.context = context
+        self.last_used = time.monotonic()
+
+    def transcript(self):
+        """The analysis followed by every follow-up answer"""
+        if not self.turns:
+            return ""
+        parts = [self.turns[0][1]]
+        for question, answer in self.turns[1:]:
+            parts.append(f"Follow-up Analysis ({question}):\n{answer}")
+        return "\n\n".join(parts)
+
+
+class SessionStore:
+    """Thread-safe session registry with LRU and idle-TTL eviction"""
+
+    def __init__(self, max_sessions=SESSION_MAX, ttl=SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._on_evict = []
+
+    def on_evict(self, callback):
+        """Register callback(session) run when a session is closed or evicted"""
+        self._on_evict.append(callback)
+
+    def create(self, image_path):
+        session = VisionSession(image_path)
+        with self._lock:
+            self._sessions[session.id] = session
+            evicted = self._evict_locked()
+        self._notify(evicted)
+        return session
+
+    def get(self, session_id):
+        """Return the live session or None if it is unknown or expired"""
+        if not session_id:
+            return None
+        with self._lock:
+            evicted = self._evict_locked()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = time.monotonic()
+                self._sessions.move_to_end(session_id)
+        self._notify(evicted)
+        return session
+
+    def close(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        self._notify([session] if session else [])
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict_locked(self):
+        evicted = []
+        now = time.monotonic()
+        for session_id, session in list(self._sessions.items()):
+            if now - session.last_used > self.ttl:
+                evicted.append(self._sessions.pop(session_id))
+        while len(self._sessions) > self.max_sessions:
+            evicted.append(self._sessions.popitem(last=False)[1])
+        return evicted
+
+    def _notify(self, sessions):
+        for session in sessions:
+            for callback in self._on_evict:
+                callback(session)